@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import multiprocessing
+import shutil
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from broker import serve
+from broker_client import BrokerClient
+
+
+def run_broker(socket_path: str, directory: Path):
+    asyncio.run(serve(socket_path, directory))
+
+
+async def wait_for_broker(socket_path: str) -> BrokerClient:
+    while True:
+        try:
+            return await BrokerClient.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            await asyncio.sleep(0.01)
+
+
+def produce(socket_path: str, records: int, record_bytes: int, batch_records: int) -> int:
+    async def produce_batches():
+        payloads = [b'x' * record_bytes] * batch_records
+        async with await wait_for_broker(socket_path) as client:
+            for _ in range(records // batch_records):
+                await client.produce('topic', payloads)
+
+    asyncio.run(produce_batches())
+    return records // batch_records * batch_records
+
+
+def catch_up(socket_path: str, end_offset: int, fetch_bytes: int) -> int:
+    async def fetch_all() -> int:
+        received_bytes = 0
+        async with await wait_for_broker(socket_path) as client:
+            offset = 0
+            while offset < end_offset:
+                records = await client.fetch('topic', offset, fetch_bytes)
+                received_bytes += sum(len(payload) for _, payload in records)
+                offset = records[-1][0] + 1
+        return received_bytes
+
+    return asyncio.run(fetch_all())
+
+
+def subscribe(socket_path: str, start_offset: int, records: int, ready) -> list[float]:
+    async def receive() -> list[float]:
+        latencies = []
+        async with await wait_for_broker(socket_path) as client:
+            ready.release()
+            async for _, payload in client.subscribe('topic', start_offset):
+                # perf_counter is the monotonic clock, shared by the processes
+                latencies.append((time.perf_counter_ns() - int(payload)) / 1_000_000)
+                if len(latencies) == records:
+                    return latencies
+
+    return asyncio.run(receive())
+
+
+def produce_live(socket_path: str, records: int, interval_seconds: float):
+    async def produce_timestamps():
+        async with await wait_for_broker(socket_path) as client:
+            for _ in range(records):
+                await client.produce('topic', [str(time.perf_counter_ns())])
+                await asyncio.sleep(interval_seconds)
+
+    asyncio.run(produce_timestamps())
+
+
+def run(producers: int, records: int, record_bytes: int, batch_records: int, subscribers: int, fetch_bytes: int, live_records: int,
+        interval_ms: float, data_dir: str | None):
+    directory = Path(tempfile.mkdtemp(prefix='broker_load_', dir=data_dir))
+    socket_path = str(directory / 'broker.sock')
+    broker = multiprocessing.Process(target=run_broker, args=(socket_path, directory))
+    broker.start()
+    try:
+        with ProcessPoolExecutor(producers) as pool:
+            started = time.perf_counter()
+            produced = sum(pool.map(produce, *zip(*[(socket_path, records // producers, record_bytes, batch_records)] * producers)))
+            elapsed = time.perf_counter() - started
+        print(f'produce   {producers} clients, batches of {batch_records}: {produced / elapsed:,.0f} records/s, {produced * record_bytes / elapsed / 2 ** 20:,.1f} MB/s')
+
+        with ProcessPoolExecutor(subscribers) as pool:
+            started = time.perf_counter()
+            received_bytes = sum(pool.map(catch_up, *zip(*[(socket_path, produced, fetch_bytes)] * subscribers)))
+            elapsed = time.perf_counter() - started
+        print(f'catch up  {subscribers} clients, fetches of {fetch_bytes // 1024} KB: {received_bytes / elapsed / 2 ** 20:,.1f} MB/s in total ({received_bytes // subscribers // 2 ** 20} MB each)')
+
+        with multiprocessing.Manager() as manager, ProcessPoolExecutor(subscribers) as pool:
+            ready = manager.Semaphore(0)
+            futures = [pool.submit(subscribe, socket_path, produced, live_records, ready) for _ in range(subscribers)]
+            for _ in range(subscribers):
+                ready.acquire()
+            produce_live(socket_path, live_records, interval_ms / 1000)
+            latencies = [latency for future in futures for latency in future.result()]
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(f'live      {subscribers} subscribers: produce to receive p50 {quantiles[49]:.3f} ms, p99 {quantiles[98]:.3f} ms, max {max(latencies):.3f} ms')
+    finally:
+        broker.terminate()
+        broker.join()
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load generator of a broker: clients producing, catching up from the start of a topic and subscribed to it')
+    parser.add_argument('--producers', type=int, default=4, help='producing clients (processes)')
+    parser.add_argument('--records', type=int, default=400_000, help='records produced in total')
+    parser.add_argument('--record-bytes', type=int, default=200, help='size of a record')
+    parser.add_argument('--batch-records', type=int, default=100, help='records per produce request')
+    parser.add_argument('--subscribers', type=int, default=8, help='fetching clients (processes)')
+    parser.add_argument('--fetch-bytes', type=int, default=1024 * 1024, help='maximum bytes per fetch')
+    parser.add_argument('--live-records', type=int, default=500, help='records produced while the subscribers wait for them')
+    parser.add_argument('--interval-ms', type=float, default=5, help='time between the live records')
+    parser.add_argument('--data-dir', help='directory for the topic (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.producers, args.records, args.record_bytes, args.batch_records, args.subscribers, args.fetch_bytes, args.live_records, args.interval_ms,
+        args.data_dir)
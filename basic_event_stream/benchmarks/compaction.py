@@ -0,0 +1,61 @@
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from compactor import compact, json_field_key, latest_records
+from log import COMPACTED_FILE_SUFFIX, LOG_FILE_SUFFIX, Log
+
+
+def write_topic(topic_directory: Path, keys: int, updates: int, segment_mb: int):
+    # each update changes the state of a random product
+    with Log(topic_directory, segment_bytes=segment_mb * 1024 * 1024) as topic_log:
+        for id in range(updates):
+            event = {'id': id, 'product_id': f'prod-{random.randrange(keys):08d}', 'stock': random.randrange(1000), 'price': random.randrange(100, 50000)}
+            topic_log.append(json.dumps(event).encode())
+
+
+def topic_bytes(topic_directory: Path) -> int:
+    return sum(path.stat().st_size for suffix in [LOG_FILE_SUFFIX, COMPACTED_FILE_SUFFIX] for path in topic_directory.glob(f'*{suffix}'))
+
+
+def replay(topic_directory: Path, key) -> tuple[dict, float]:
+    started = time.perf_counter()
+    state = latest_records(topic_directory, key)
+    return state, time.perf_counter() - started
+
+
+def run(keys: int, updates: int, segment_mb: int, data_dir: str | None):
+    directory = Path(tempfile.mkdtemp(prefix='compaction_', dir=data_dir))
+    try:
+        topic_directory = directory / 'topic'
+        random.seed(0)
+        write_topic(topic_directory, keys, updates, segment_mb)
+        key = json_field_key('product_id')
+
+        state, seconds = replay(topic_directory, key)
+        print(f'{updates} updates of {len(state)} keys, {topic_bytes(topic_directory) / 1024 / 1024:.0f} MB - replayed in {seconds:.2f}s')
+
+        started = time.perf_counter()
+        removed = compact(topic_directory, key)
+        print(f'compaction removed {removed} records in {time.perf_counter() - started:.1f}s')
+
+        compacted_state, seconds = replay(topic_directory, key)
+        assert compacted_state == state
+        print(f'compacted topic {topic_bytes(topic_directory) / 1024 / 1024:.0f} MB - replayed in {seconds:.2f}s (the active segment is not compacted)')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the replay of the latest state per key of a topic before and after its compaction')
+    parser.add_argument('--keys', type=int, default=10_000, help='number of keys')
+    parser.add_argument('--updates', type=int, default=2_000_000, help='number of records')
+    parser.add_argument('--segment-mb', type=int, default=16, help='size of the segments')
+    parser.add_argument('--data-dir', help='directory for the topic (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.keys, args.updates, args.segment_mb, args.data_dir)
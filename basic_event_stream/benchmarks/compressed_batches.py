@@ -0,0 +1,85 @@
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from batches import CODECS, encode_block, read_block_records
+from log import LOG_FILE_SUFFIX, Log
+
+STATUSES = ['confirmed', 'paid', 'shipped', 'delivered', 'cancelled']
+CURRENCIES = ['EUR', 'USD', 'GBP']
+
+
+def make_event(id: int) -> bytes:
+    return json.dumps({
+        'id': id,
+        'type': 'order_status_changed',
+        'order_id': f'5f0c7d2e-{random.randrange(10 ** 12):012d}',
+        'customer_id': f'9a1b4c3d-{random.randrange(10 ** 6):012d}',
+        'status': random.choice(STATUSES),
+        'currency': random.choice(CURRENCIES),
+        'lines': [
+            {'product_id': f'prod-{random.randrange(5000):05d}', 'quantity': random.randint(1, 5), 'price': random.randrange(100, 50000)}
+            for _ in range(random.randint(1, 4))
+        ],
+    }).encode()
+
+
+def log_bytes(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.glob(f'*{LOG_FILE_SUFFIX}'))
+
+
+def write_log(directory: Path, events: list[bytes], codec: str | None, block_records: int) -> float:
+    started = time.perf_counter()
+    with Log(directory) as topic_log:
+        if codec is None:
+            for event in events:
+                topic_log.append(event)
+        else:
+            for start in range(0, len(events), block_records):
+                topic_log.append(encode_block(events[start:start + block_records], codec))
+    return time.perf_counter() - started
+
+
+def read_log(directory: Path, codec: str | None) -> tuple[int, float]:
+    records = 0
+    started = time.perf_counter()
+    for _ in Log(directory).read() if codec is None else read_block_records(directory):
+        records += 1
+    return records, time.perf_counter() - started
+
+
+def run(events_count: int, block_records: int, data_dir: str | None):
+    directory = Path(tempfile.mkdtemp(prefix='compressed_batches_', dir=data_dir))
+    try:
+        random.seed(0)
+        events = [make_event(id) for id in range(events_count)]
+        print(f'{events_count} events, {sum(map(len, events)) / events_count:.0f} bytes on average, {block_records} events per block (codecs: {", ".join(CODECS)})')
+
+        raw_bytes = None
+        for codec in [None] + CODECS:
+            name = codec or 'records'
+            write_seconds = write_log(directory / name, events, codec, block_records)
+            size = log_bytes(directory / name)
+            raw_bytes = raw_bytes or size
+            records, read_seconds = read_log(directory / name, codec)
+            assert records == events_count
+            print(
+                f'{name:<8} {size / 1024 / 1024:>8.1f} MB ({size / raw_bytes:>4.0%})  '
+                f'write {events_count / write_seconds:>10,.0f} events/s  read {records / read_seconds:>10,.0f} events/s'
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the size and read throughput of logs of plain records and of compressed blocks')
+    parser.add_argument('--events', type=int, default=1_000_000, help='events in each log')
+    parser.add_argument('--block-records', type=int, default=256, help='events per compressed block')
+    parser.add_argument('--data-dir', help='directory for the logs (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.events, args.block_records, args.data_dir)
@@ -0,0 +1,60 @@
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from log import Log
+from offsets import GroupConsumer
+
+EVENT = b'{"type": "order_confirmed", "order_id": "5f0c7d2e-000000000001", "total": 4200, "currency": "EUR", "padding": "' + b'x' * 90 + b'"}'
+
+
+def write_topic(topic_directory: Path, size_bytes: int) -> int:
+    with Log(topic_directory) as topic_log:
+        for _ in range(size_bytes // len(EVENT)):
+            topic_log.append(EVENT)
+        return topic_log.next_offset
+
+
+def consume(directory: Path, group: str, commit_interval_records: int, max_records: int | None = None) -> tuple[int, float]:
+    '''
+    :return: the records consumed by the group (from its committed offset) and the time it took
+    '''
+    records = 0
+    started = time.perf_counter()
+    with GroupConsumer('topic', group, directory, commit_interval_records) as consumer:
+        for _ in consumer.read():
+            records += 1
+            if records == max_records:
+                break
+
+    return records, time.perf_counter() - started
+
+
+def run(size_mb: int, data_dir: str | None):
+    directory = Path(tempfile.mkdtemp(prefix='consumer_restart_', dir=data_dir))
+    try:
+        event_count = write_topic(directory / 'topic', size_mb * 1024 * 1024)
+        print(f'wrote {event_count} events ({size_mb} MB)')
+
+        for commit_interval_records in [1, 100, 1000, 10000]:
+            records, seconds = consume(directory, f'commit_{commit_interval_records}', commit_interval_records, max_records=min(event_count, 10000 * commit_interval_records))
+            print(f'commit every {commit_interval_records:>5} records  {records / seconds:>12,.0f} records/s')
+
+        # a group that consumed all but the last 100 records is restarted
+        records, seconds = consume(directory, 'restarted', 1000, max_records=event_count - 100)
+        print(f'first run consumed {records} records in {seconds:.1f}s')
+        records, seconds = consume(directory, 'restarted', 1000)
+        print(f'restarted group consumed the remaining {records} records in {seconds * 1000:.2f} ms')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the cost of committing group offsets and of restarting a group consumer')
+    parser.add_argument('--size-mb', type=int, default=1024, help='size of the topic')
+    parser.add_argument('--data-dir', help='directory for the topic (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.size_mb, args.data_dir)
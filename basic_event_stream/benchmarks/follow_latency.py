@@ -0,0 +1,62 @@
+import argparse
+import multiprocessing
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from mmap_reader import MmapLogReader
+from publisher import FSYNC_NONE, Publisher
+
+
+def publish(directory: Path, events: int, interval_seconds: float, idle_seconds: float):
+    # the consumer waits for the first event for idle_seconds, then events are published every interval_seconds
+    with Publisher('topic', directory, fsync=FSYNC_NONE) as publisher:
+        time.sleep(idle_seconds)
+        for _ in range(events):
+            # perf_counter is the monotonic clock, shared by the processes
+            publisher.publish(str(time.perf_counter_ns())).result()
+            time.sleep(interval_seconds)
+
+
+def follow(directory: Path, events: int, interval_seconds: float, idle_seconds: float, use_inotify: bool):
+    publisher = multiprocessing.Process(target=publish, args=(directory, events, interval_seconds, idle_seconds))
+    latencies = []
+    idle_cpu_seconds = None
+
+    started_cpu = time.process_time()
+    publisher.start()
+    for _, record in MmapLogReader(directory / 'topic', use_inotify=use_inotify).read(follow=True):
+        latencies.append((time.perf_counter_ns() - int(bytes(record))) / 1_000_000)
+        if idle_cpu_seconds is None:
+            idle_cpu_seconds = time.process_time() - started_cpu
+        if len(latencies) == events:
+            break
+    publisher.join()
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f'{"inotify" if use_inotify else "polling":<8} publish to consume p50 {quantiles[49]:.3f} ms, p99 {quantiles[98]:.3f} ms, max {max(latencies):.3f} ms'
+        f' - {idle_cpu_seconds * 1000:.0f} ms of CPU while waiting {idle_seconds:.0f}s for the first event'
+    )
+
+
+def run(events: int, interval_ms: float, idle_seconds: float, data_dir: str | None):
+    for use_inotify in [True, False]:
+        directory = Path(tempfile.mkdtemp(prefix='follow_latency_', dir=data_dir))
+        try:
+            follow(directory, events, interval_ms / 1000, idle_seconds, use_inotify)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the latency from publishing an event to a consumer following the topic receiving it')
+    parser.add_argument('--events', type=int, default=2000, help='events published')
+    parser.add_argument('--interval-ms', type=float, default=5, help='time between events')
+    parser.add_argument('--idle-seconds', type=float, default=2, help='time before the first event')
+    parser.add_argument('--data-dir', help='directory for the topic (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.events, args.interval_ms, args.idle_seconds, args.data_dir)
@@ -0,0 +1,73 @@
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from log import LOG_FILE_SUFFIX, Log
+from mmap_reader import MmapLogReader
+
+
+def write_topic(log_path: Path, size_bytes: int, record_bytes: int) -> int:
+    record = b'x' * record_bytes
+    with Log(log_path) as topic_log:
+        for _ in range(size_bytes // record_bytes):
+            topic_log.append(record)
+
+    return size_bytes // record_bytes
+
+
+def page_cache_rate(log_path: Path) -> float:
+    # reading the segment files into a buffer, without looking at the records - the upper bound
+    buffer = bytearray(1024 * 1024)
+    read_bytes = 0
+    started = time.perf_counter()
+    for segment_path in sorted(log_path.glob(f'*{LOG_FILE_SUFFIX}')):
+        with segment_path.open('rb', buffering=0) as segment_file:
+            while count := segment_file.readinto(buffer):
+                read_bytes += count
+
+    return read_bytes / (time.perf_counter() - started)
+
+
+def reader_rate(records) -> tuple[int, float]:
+    events = 0
+    read_bytes = 0
+    started = time.perf_counter()
+    for _, record in records:
+        events += 1
+        read_bytes += len(record)
+
+    return events, read_bytes / (time.perf_counter() - started)
+
+
+def run(size_mb: int, record_sizes: list[int], data_dir: str | None):
+    for record_bytes in record_sizes:
+        directory = Path(tempfile.mkdtemp(prefix='mmap_reader_', dir=data_dir))
+        try:
+            log_path = directory / 'topic'
+            event_count = write_topic(log_path, size_mb * 1024 * 1024, record_bytes)
+            # warms up the page cache, so all readers read from memory
+            page_cache_rate(log_path)
+
+            print(f'{event_count} records of {record_bytes} bytes')
+            print(f'  page cache (readinto)      {page_cache_rate(log_path) / 1024 / 1024:>8,.0f} MB/s')
+            for name, records in [
+                ('log.Log.read', Log(log_path).read(0)),
+                ('MmapLogReader.read', MmapLogReader(log_path).read(0)),
+            ]:
+                events, rate = reader_rate(records)
+                assert events == event_count
+                print(f'  {name:<26} {rate / 1024 / 1024:>8,.0f} MB/s  {rate / record_bytes:>12,.0f} events/s')
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares reading a segmented log with buffered reads and with memory maps')
+    parser.add_argument('--size-mb', type=int, default=1024, help='size of the topic')
+    parser.add_argument('--record-bytes', type=int, nargs='+', default=[100, 1024, 16 * 1024], help='record sizes to compare')
+    parser.add_argument('--data-dir', help='directory for the topic (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.size_mb, args.record_bytes, args.data_dir)
@@ -0,0 +1,60 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from log import Log
+from partitions import consume_partitions, create_partitioned_topic, partition_for_key, partition_name
+
+EVENT_TEMPLATE = '{{"type": "order_confirmed", "order_id": "{key}", "total": {total}, "currency": "EUR", "lines": [{lines}]}}'
+LINE = '{"product_id": "9a1b4c3d", "quantity": 2, "price": 1250}'
+
+
+def write_topic(topic_directory: Path, partitions: int, events: int):
+    # written to the partition logs directly - the benchmark is about consuming
+    partition_logs = [Log(topic_directory / partition_name(partition)) for partition in range(partitions)]
+    for id in range(events):
+        key = f'5f0c7d2e-{id % 10000:012d}'
+        event = EVENT_TEMPLATE.format(key=key, total=id % 10000, lines=', '.join([LINE] * 3))
+        partition_logs[partition_for_key(key, partitions)].append(event.encode())
+
+    for partition_log in partition_logs:
+        partition_log.close()
+
+
+def handle(partition: int, offset: int, record: bytes):
+    # some work per event: decoding it and summing its lines
+    event = json.loads(record)
+    sum(line['quantity'] * line['price'] for line in event['lines'])
+
+
+def run(partitions: int, events: int, process_counts: list[int], data_dir: str | None):
+    directory = Path(tempfile.mkdtemp(prefix='partitioned_consumers_', dir=data_dir))
+    try:
+        topic_directory = create_partitioned_topic('topic', partitions, directory)
+        write_topic(topic_directory, partitions, events)
+        print(f'wrote {events} events to {partitions} partitions ({os.cpu_count()} CPUs)')
+
+        for processes in process_counts:
+            started = time.perf_counter()
+            # each run is a new group, consuming the topic from the start
+            consumed = consume_partitions('topic', f'group_{processes}', handle, processes, directory)
+            seconds = time.perf_counter() - started
+            assert sum(consumed.values()) == events
+            print(f'{processes:>3} processes  {events / seconds:>12,.0f} events/s')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the throughput of consuming a partitioned topic with a growing number of processes')
+    parser.add_argument('--partitions', type=int, default=8, help='partitions of the topic')
+    parser.add_argument('--events', type=int, default=1_000_000, help='events in the topic')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8], help='numbers of consumer processes to measure')
+    parser.add_argument('--data-dir', help='directory for the topic (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.partitions, args.events, args.processes, args.data_dir)
@@ -0,0 +1,67 @@
+import argparse
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from publisher import FSYNC_MODES, Publisher, emit_record
+
+EVENT = '{"type": "order_confirmed", "order_id": "5f0c7d2e-000000000001", "total": 4200, "currency": "EUR"}'
+
+
+def produce(publish, events: int, latencies: list[float]):
+    for _ in range(events):
+        started = time.perf_counter()
+        publish(EVENT)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+def run_producers(publish, producers: int, events_per_producer: int) -> tuple[float, list[float]]:
+    '''
+    :return: the events per second and the publish latencies (ms) of all producers publishing concurrently
+    '''
+    latencies = [[] for _ in range(producers)]
+    threads = [threading.Thread(target=produce, args=(publish, events_per_producer, latencies[i])) for i in range(producers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    return producers * events_per_producer / seconds, [latency for producer_latencies in latencies for latency in producer_latencies]
+
+
+def report(name: str, rate: float, latencies: list[float]):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'{name:<28} {rate:>10,.0f} events/s  p50 {quantiles[49]:.3f} ms  p99 {quantiles[98]:.3f} ms')
+
+
+def run(producers: int, events_per_producer: int, emit_events_per_producer: int, linger_ms: float, data_dir: str | None):
+    directory = Path(tempfile.mkdtemp(prefix='publisher_', dir=data_dir))
+    try:
+        # emit_record opens, locks and closes the topic for every event - concurrent producers wait for the lock
+        rate, latencies = run_producers(lambda event: emit_record(event, 'emit_record', directory), producers, emit_events_per_producer)
+        report('emit_record', rate, latencies)
+
+        for fsync in FSYNC_MODES:
+            with Publisher(f'publisher_{fsync}', directory, fsync=fsync, linger_seconds=linger_ms / 1000) as publisher:
+                # each producer waits for its event to be written before publishing the next one
+                rate, latencies = run_producers(lambda event: publisher.publish(event).result(), producers, events_per_producer)
+            report(f'Publisher fsync={fsync}', rate, latencies)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares publishing with emit_record and with a Publisher in each fsync mode')
+    parser.add_argument('--producers', type=int, default=16, help='number of concurrent producer threads')
+    parser.add_argument('--events', type=int, default=5000, help='events published by each producer to a Publisher')
+    parser.add_argument('--emit-events', type=int, default=500, help='events published by each producer with emit_record')
+    parser.add_argument('--linger-ms', type=float, default=0, help='time a Publisher waits for more events before writing a batch')
+    parser.add_argument('--data-dir', help='directory for the topics (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.producers, args.events, args.emit_events, args.linger_ms, args.data_dir)
@@ -0,0 +1,110 @@
+import argparse
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from common import EVENT_SEPARATOR
+from consumer import _read_event
+from log import Log
+
+EVENT_TEMPLATE = '{{"id": {id}, "type": "order_confirmed", "order_id": "5f0c7d2e-{id:012d}", "customer_id": "9a1b4c3d-{id:012d}", "total": {total}, "currency": "EUR", "padding": "{padding}"}}'
+
+
+def make_event(id: int, event_bytes: int) -> str:
+    event = EVENT_TEMPLATE.format(id=id, total=id % 10000, padding='')
+    return EVENT_TEMPLATE.format(id=id, total=id % 10000, padding='x' * max(event_bytes - len(event), 0))
+
+
+def write_topics(text_topic_path: Path, log_path: Path, size_bytes: int, event_bytes: int) -> int:
+    event_count = 0
+    written_bytes = 0
+    # the text topic is written in bulk - emit_bytes opens and closes the file for every event
+    with text_topic_path.open('wt') as text_topic_file, Log(log_path) as topic_log:
+        while written_bytes < size_bytes:
+            event = make_event(event_count, event_bytes)
+            text_topic_file.write(event + EVENT_SEPARATOR)
+            topic_log.append(event.encode())
+            event_count += 1
+            written_bytes += len(event) + 1
+
+    return event_count
+
+
+def char_by_char_rate(text_topic_path: Path, max_bytes: int) -> tuple[int, float]:
+    events = 0
+    read_bytes = 0
+    started = time.perf_counter()
+    with text_topic_path.open('r') as topic_file:
+        while read_bytes < max_bytes and (event := _read_event(topic_file)):
+            events += 1
+            read_bytes += len(event) + 1
+
+    return events, time.perf_counter() - started
+
+
+def segmented_log_rate(log_path: Path) -> tuple[int, int, float]:
+    events = 0
+    read_bytes = 0
+    started = time.perf_counter()
+    for _, record in Log(log_path).read(0):
+        events += 1
+        read_bytes += len(record)
+
+    return events, read_bytes, time.perf_counter() - started
+
+
+def seek_latencies_ms(log_path: Path, event_count: int, seeks: int) -> list[float]:
+    topic_log = Log(log_path)
+    latencies = []
+    for offset in random.sample(range(event_count), seeks):
+        started = time.perf_counter()
+        first_offset, _ = next(topic_log.read(offset))
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert first_offset == offset
+
+    return latencies
+
+
+def run(size_mb: int, event_bytes: int, char_reader_mb: int, seeks: int, data_dir: str | None):
+    directory = Path(tempfile.mkdtemp(prefix='segmented_log_', dir=data_dir))
+    try:
+        text_topic_path = directory / 'text_topic'
+        log_path = directory / 'log_topic'
+
+        started = time.perf_counter()
+        event_count = write_topics(text_topic_path, log_path, size_mb * 1024 * 1024, event_bytes)
+        print(f'wrote {event_count} events ({size_mb} MB) to each topic in {time.perf_counter() - started:.1f}s')
+
+        # the char by char reader is too slow to read the whole topic - its rate is measured on the
+        # first char_reader_mb
+        events, seconds = char_by_char_rate(text_topic_path, char_reader_mb * 1024 * 1024)
+        char_rate = events / seconds
+        print(f'char by char reader        {char_rate:>12,.0f} events/s  ({char_reader_mb} MB in {seconds:.1f}s)')
+
+        events, read_bytes, seconds = segmented_log_rate(log_path)
+        assert events == event_count
+        log_rate = events / seconds
+        print(f'segmented log reader       {log_rate:>12,.0f} events/s  ({read_bytes / seconds / 1024 / 1024:,.0f} MB/s, {char_rate and log_rate / char_rate:.0f}x)')
+
+        latencies = seek_latencies_ms(log_path, event_count, seeks)
+        print(
+            f'read from a random offset  median {statistics.median(latencies):.3f} ms, max {max(latencies):.3f} ms'
+            f' (char by char: ~{event_count / 2 / char_rate:.0f}s to scan to the middle of the topic)'
+        )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares reading a topic char by char with reading a segmented log')
+    parser.add_argument('--size-mb', type=int, default=2048, help='size of the topic')
+    parser.add_argument('--event-bytes', type=int, default=200, help='approximate size of each event')
+    parser.add_argument('--char-reader-mb', type=int, default=64, help='MB of the topic read by the char by char reader')
+    parser.add_argument('--seeks', type=int, default=100, help='number of reads from random offsets')
+    parser.add_argument('--data-dir', help='directory for the topics (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.size_mb, args.event_bytes, args.char_reader_mb, args.seeks, args.data_dir)
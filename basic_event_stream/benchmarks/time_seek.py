@@ -0,0 +1,67 @@
+import argparse
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from log import Log
+
+EVENT = b'{"type": "order_confirmed", "order_id": "5f0c7d2e-000000000001", "total": 4200, "currency": "EUR", "padding": "' + b'x' * 90 + b'"}'
+START_TIMESTAMP = 1_700_000_000_000
+
+
+def write_topic(topic_directory: Path, size_bytes: int, events_per_millisecond: int) -> int:
+    with Log(topic_directory) as topic_log:
+        events = size_bytes // len(EVENT)
+        for id in range(events):
+            topic_log.append(EVENT, timestamp=START_TIMESTAMP + id // events_per_millisecond)
+        return events
+
+
+def scan_for_time(topic_directory: Path, timestamp: int) -> int:
+    # what a consumer without a time index does - reads from the start until the timestamp
+    for offset, record_timestamp, _ in (record for segment in Log(topic_directory).segments for record in segment.read_records(segment.base_offset)):
+        if record_timestamp >= timestamp:
+            return offset
+
+
+def run(size_mb: int, events_per_millisecond: int, seeks: int, data_dir: str | None):
+    directory = Path(tempfile.mkdtemp(prefix='time_seek_', dir=data_dir))
+    try:
+        topic_directory = directory / 'topic'
+        events = write_topic(topic_directory, size_mb * 1024 * 1024, events_per_millisecond)
+        end_timestamp = START_TIMESTAMP + events // events_per_millisecond
+        print(f'wrote {events} events ({size_mb} MB) over {(end_timestamp - START_TIMESTAMP) / 1000:.0f}s of timestamps')
+
+        started = time.perf_counter()
+        topic_log = Log(topic_directory)
+        print(f'loading the log (indexes of {len(topic_log.segments)} segments) {(time.perf_counter() - started) * 1000:.1f} ms')
+
+        latencies = []
+        for timestamp in random.sample(range(START_TIMESTAMP, end_timestamp), seeks):
+            started = time.perf_counter()
+            offset = topic_log.offset_for_time(timestamp)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert offset == (timestamp - START_TIMESTAMP) * events_per_millisecond
+
+        print(f'offset_for_time  median {statistics.median(latencies):.3f} ms, max {max(latencies):.3f} ms')
+
+        middle_timestamp = (START_TIMESTAMP + end_timestamp) // 2
+        started = time.perf_counter()
+        scan_for_time(topic_directory, middle_timestamp)
+        print(f'scanning to the middle of the topic {time.perf_counter() - started:.1f}s')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures finding the offset of a time with the time index, and by scanning the topic')
+    parser.add_argument('--size-mb', type=int, default=2048, help='size of the topic')
+    parser.add_argument('--events-per-millisecond', type=int, default=10, help='rate of the timestamps of the events')
+    parser.add_argument('--seeks', type=int, default=100, help='number of random timestamps to find')
+    parser.add_argument('--data-dir', help='directory for the topic (a temporary directory by default)')
+
+    args = parser.parse_args()
+    run(args.size_mb, args.events_per_millisecond, args.seeks, args.data_dir)
@@ -0,0 +1,89 @@
+import struct
+import zlib
+from pathlib import Path
+from typing import Iterator
+
+from log import Log
+from mmap_reader import MmapLogReader
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# a block is the codec and number of its records, the end position of each record in the
+# decompressed data, and the compressed data - the records concatenated
+BLOCK_HEADER = struct.Struct('>BI')
+
+CODEC_NONE = 'none'
+CODEC_ZLIB = 'zlib'
+CODEC_LZ4 = 'lz4'
+CODEC_ZSTD = 'zstd'
+
+CODEC_IDS = {CODEC_NONE: 0, CODEC_ZLIB: 1, CODEC_LZ4: 2, CODEC_ZSTD: 3}
+
+# codec: (compress, decompress) - lz4 and zstd are optional
+COMPRESSION = {
+    CODEC_NONE: (bytes, bytes),
+    CODEC_ZLIB: (zlib.compress, zlib.decompress),
+}
+if lz4 is not None:
+    COMPRESSION[CODEC_LZ4] = (lz4.frame.compress, lz4.frame.decompress)
+if zstandard is not None:
+    COMPRESSION[CODEC_ZSTD] = (zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress)
+
+CODECS = list(COMPRESSION)
+CODECS_BY_ID = {CODEC_IDS[codec]: codec for codec in CODECS}
+
+
+def encode_block(payloads: list[bytes], codec: str = CODEC_ZLIB) -> bytes:
+    if codec not in COMPRESSION:
+        raise ValueError(f'codec needs to be one of {CODECS} (lz4 and zstd need their packages installed)')
+
+    ends = []
+    end = 0
+    for payload in payloads:
+        end += len(payload)
+        ends.append(end)
+
+    compress, _ = COMPRESSION[codec]
+    return BLOCK_HEADER.pack(CODEC_IDS[codec], len(payloads)) + struct.pack(f'>{len(ends)}I', *ends) + compress(b''.join(payloads))
+
+
+def decode_block(block: bytes) -> list[bytes]:
+    '''
+    Decompresses a block at once
+    :return: its records
+    '''
+    codec_id, count = BLOCK_HEADER.unpack_from(block)
+    codec = CODECS_BY_ID.get(codec_id)
+    if codec is None:
+        raise ValueError(f'the codec of the block ({codec_id}) is unknown or its package is not installed')
+
+    ends = struct.unpack_from(f'>{count}I', block, BLOCK_HEADER.size)
+    _, decompress = COMPRESSION[codec]
+    data = decompress(block[BLOCK_HEADER.size + count * 4:])
+
+    records = []
+    start = 0
+    for end in ends:
+        records.append(data[start:end])
+        start = end
+    return records
+
+
+def read_block_records(directory, start_offset: int = 0, follow: bool = False) -> Iterator[tuple[int, bytes]]:
+    '''
+    Reads a log of blocks - the offsets are those of the blocks, shared by their records
+    :param follow: keep waiting for blocks appended to the log instead of stopping at its end
+    :return: the offset of the block and each record of the blocks from start_offset on
+    '''
+    blocks = MmapLogReader(Path(directory)).read(start_offset, follow=True) if follow else Log(Path(directory), create=False).read(start_offset)
+    for offset, block in blocks:
+        for record in decode_block(block):
+            yield offset, record
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+import struct
+from pathlib import Path
+
+from log import COMPACTED_RECORD_HEADER, RECORD_HEADER, Log
+
+# a frame is the length of its body (4 bytes, big endian) followed by the body. The body of a request
+# is its type and topic (length prefixed, 2 bytes), followed by:
+# - produce: the number of records (4 bytes), each record its length (4 bytes) followed by its payload
+# - fetch: the offset to fetch from (8 bytes), the maximum bytes to return and the maximum time (ms) to
+#   wait for records at the end of the topic (4 bytes each)
+# The body of a response is its status, followed by:
+# - produce: the offset of the first record (8 bytes)
+# - fetch: the format of the records (1 byte) and the offset of the first record (8 bytes), followed by
+#   the records as stored in segment files - the last one may be incomplete
+# - error: the error message
+FRAME_HEADER = struct.Struct('>I')
+REQUEST_HEADER = struct.Struct('>BH')
+PRODUCE_HEADER = struct.Struct('>I')
+PRODUCE_RECORD_HEADER = struct.Struct('>I')
+FETCH_REQUEST = struct.Struct('>QII')
+STATUS = struct.Struct('>B')
+PRODUCE_RESPONSE = struct.Struct('>BQ')
+FETCH_RESPONSE_HEADER = struct.Struct('>BBQ')
+
+REQUEST_PRODUCE = 1
+REQUEST_FETCH = 2
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# the records of a fetch response: of a segment file (the offsets follow each other) or of a
+# compacted segment file (each record with its offset)
+FORMAT_RECORDS = 0
+FORMAT_COMPACTED_RECORDS = 1
+
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+TOPIC_NAME = re.compile(r'[A-Za-z0-9_-][A-Za-z0-9._-]*')
+
+
+class BrokerError(Exception):
+    pass
+
+
+class TopicState:
+    def __init__(self, directory: Path):
+        self.log = Log(directory)
+        try:
+            self.log.open_for_append(blocking=False)
+        except BlockingIOError:
+            raise BrokerError(f'{directory.name} is written by another process')
+        # set once records are appended and flushed - replaced by a new event for the next ones
+        self.appended = asyncio.Event()
+
+
+class Broker:
+    '''
+    Owns the logs of the topics under data_store_base_path, and serves produce and fetch requests of
+    clients over a Unix socket (see the protocol above). Requests are handled in the event loop:
+
+    - produced records are appended to the log of their topic, and flushed once for all the produce
+    requests handled in the same iteration of the loop (group commit)
+    - fetched records are sent from the segment files with sendfile - the file pages go to the socket
+    without being copied through the broker (except records of compacted segments). A fetch at the end
+    of a topic waits for records to be produced, up to its maximum wait
+    '''
+
+    def __init__(self, data_store_base_path='.'):
+        self.data_store_base_path = Path(data_store_base_path)
+        self.topics = {}
+        self.unflushed_topics = set()
+        self.flushed = None
+
+    def topic(self, name: str, create: bool = False) -> TopicState:
+        '''
+        :param create: create the topic if it does not exist - only produce requests create topics, so
+        fetching a misspelled topic does not leave a directory behind
+        '''
+        if not TOPIC_NAME.fullmatch(name):
+            raise BrokerError(f'invalid topic name {name!r}')
+        if name not in self.topics:
+            directory = self.data_store_base_path / name
+            if not create and not directory.is_dir():
+                raise BrokerError(f'unknown topic {name!r}')
+            self.topics[name] = TopicState(directory)
+        return self.topics[name]
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    return
+                if length > MAX_FRAME_BYTES:
+                    raise BrokerError(f'frame of {length} bytes is too large')
+                body = await reader.readexactly(length)
+
+                try:
+                    await self.handle_request(body, writer)
+                except BrokerError as e:
+                    message = str(e).encode()
+                    writer.write(FRAME_HEADER.pack(STATUS.size + len(message)) + STATUS.pack(STATUS_ERROR) + message)
+                await writer.drain()
+        except (ConnectionError, BrokerError) as e:
+            logging.warning('closing connection: %s', e)
+        finally:
+            writer.close()
+
+    async def handle_request(self, body: bytes, writer: asyncio.StreamWriter):
+        try:
+            request_type, topic_length = REQUEST_HEADER.unpack_from(body)
+            position = REQUEST_HEADER.size + topic_length
+            topic = self.topic(body[REQUEST_HEADER.size:position].decode(), create=request_type == REQUEST_PRODUCE)
+        except (struct.error, UnicodeDecodeError):
+            raise BrokerError('invalid request')
+
+        if request_type == REQUEST_PRODUCE:
+            base_offset = await self.produce(topic, body, position)
+            writer.write(FRAME_HEADER.pack(PRODUCE_RESPONSE.size) + PRODUCE_RESPONSE.pack(STATUS_OK, base_offset))
+        elif request_type == REQUEST_FETCH:
+            if len(body) != position + FETCH_REQUEST.size:
+                raise BrokerError('fetch request has the wrong size')
+            await self.fetch(topic, *FETCH_REQUEST.unpack_from(body, position), writer)
+        else:
+            raise BrokerError(f'unknown request type {request_type}')
+
+    async def produce(self, topic: TopicState, body: bytes, position: int) -> int:
+        '''
+        :return: the offset of the first record
+        '''
+        payloads = []
+        try:
+            (count,) = PRODUCE_HEADER.unpack_from(body, position)
+            position += PRODUCE_HEADER.size
+            for _ in range(count):
+                (length,) = PRODUCE_RECORD_HEADER.unpack_from(body, position)
+                position += PRODUCE_RECORD_HEADER.size
+                payloads.append(body[position:position + length])
+                position += length
+        except struct.error:
+            raise BrokerError('invalid produce request')
+        if not payloads or position != len(body):
+            raise BrokerError('produce request has no records or the wrong size')
+
+        base_offset = topic.log.next_offset
+        for payload in payloads:
+            topic.log.append(payload)
+
+        # the log is flushed once for the produce requests handled until the loop gets to the flush
+        if self.flushed is None:
+            self.flushed = asyncio.get_running_loop().create_future()
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.unflushed_topics.add(topic)
+        await self.flushed
+        return base_offset
+
+    def flush(self):
+        '''
+        Flushes the logs of the produce requests waiting for it, and answers them - with an error if a
+        log could not be flushed (e.g. the disk is full). The records of the other topics are flushed
+        all the same, and fetches waiting for them are answered
+        '''
+        flushed, self.flushed = self.flushed, None
+        topics, self.unflushed_topics = self.unflushed_topics, set()
+        error = None
+        for topic in topics:
+            try:
+                topic.log.flush()
+            except Exception as e:
+                logging.exception('failed to flush topic %s', topic.log.directory.name)
+                error = e
+                continue
+            topic.appended.set()
+            topic.appended = asyncio.Event()
+
+        if error is None:
+            flushed.set_result(None)
+        else:
+            flushed.set_exception(BrokerError(f'failed to write the records: {error}'))
+
+    async def fetch(self, topic: TopicState, offset: int, max_bytes: int, max_wait_ms: int, writer: asyncio.StreamWriter):
+        records = self.find_records(topic, offset, max_bytes)
+        if records is None and max_wait_ms:
+            try:
+                await asyncio.wait_for(topic.appended.wait(), max_wait_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            records = self.find_records(topic, offset, max_bytes)
+
+        if records is None:
+            writer.write(FRAME_HEADER.pack(FETCH_RESPONSE_HEADER.size) + FETCH_RESPONSE_HEADER.pack(STATUS_OK, FORMAT_RECORDS, offset))
+            return
+
+        record_format, first_offset, data = records
+        if isinstance(data, bytes):
+            writer.write(FRAME_HEADER.pack(FETCH_RESPONSE_HEADER.size + len(data)) + FETCH_RESPONSE_HEADER.pack(STATUS_OK, record_format, first_offset) + data)
+            return
+
+        file, position, count = data
+        with file:
+            writer.write(FRAME_HEADER.pack(FETCH_RESPONSE_HEADER.size + count) + FETCH_RESPONSE_HEADER.pack(STATUS_OK, record_format, first_offset))
+            await writer.drain()
+            await asyncio.get_running_loop().sendfile(writer.transport, file, position, count)
+
+    def find_records(self, topic: TopicState, offset: int, max_bytes: int):
+        '''
+        :return: the format and first offset of the records from the given offset on, and either the records
+        (compacted segments) or the segment file, position and number of bytes to send - None at the end of
+        the topic
+        '''
+        topic_log = topic.log
+        for segment in topic_log.segments[topic_log.find_segment(offset):]:
+            file = segment.open_for_read()
+            if file is None:
+                # deleted by the retention
+                continue
+
+            if file.name == str(segment.compacted_path):
+                # the records of a compacted segment are not contiguous - they are copied
+                file.close()
+                records = []
+                size = 0
+                for record_offset, timestamp, payload in segment.read_records(offset):
+                    records.append(COMPACTED_RECORD_HEADER.pack(record_offset, len(payload), timestamp) + payload)
+                    size += len(records[-1])
+                    if size >= max_bytes:
+                        break
+                if records:
+                    return FORMAT_COMPACTED_RECORDS, offset, b''.join(records)
+                continue
+
+            record_offset, position = segment.locate(offset)
+            end = os.fstat(file.fileno()).st_size
+            first_record_bytes = 0
+            while position + RECORD_HEADER.size <= end:
+                length, _ = RECORD_HEADER.unpack(os.pread(file.fileno(), RECORD_HEADER.size, position))
+                first_record_bytes = RECORD_HEADER.size + length
+                if record_offset >= offset:
+                    break
+                record_offset += 1
+                position += first_record_bytes
+                first_record_bytes = 0
+
+            if first_record_bytes and position + first_record_bytes <= end:
+                # at least the first record, even if larger than max_bytes
+                return FORMAT_RECORDS, record_offset, (file, position, min(max(max_bytes, first_record_bytes), end - position))
+            file.close()
+
+        return None
+
+
+async def serve(socket_path: str, data_store_base_path='.'):
+    broker = Broker(data_store_base_path)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = await asyncio.start_unix_server(broker.handle_connection, socket_path)
+    logging.info('serving topics of %s on %s', Path(data_store_base_path).resolve(), socket_path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for topic in broker.topics.values():
+            topic.log.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Broker serving the topics of a directory over a Unix socket')
+    parser.add_argument('--socket', default='broker.sock', help='path of the Unix socket')
+    parser.add_argument('--data-dir', default='.', help='directory of the topics')
+
+    parsed_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(parsed_args.socket, parsed_args.data_dir))
+    except KeyboardInterrupt:
+        pass
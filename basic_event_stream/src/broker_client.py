@@ -0,0 +1,122 @@
+import asyncio
+from typing import AsyncIterator
+
+from broker import (
+    COMPACTED_RECORD_HEADER,
+    FETCH_REQUEST,
+    FETCH_RESPONSE_HEADER,
+    FORMAT_COMPACTED_RECORDS,
+    FRAME_HEADER,
+    PRODUCE_HEADER,
+    PRODUCE_RECORD_HEADER,
+    PRODUCE_RESPONSE,
+    REQUEST_FETCH,
+    REQUEST_HEADER,
+    REQUEST_PRODUCE,
+    STATUS,
+    STATUS_ERROR,
+    BrokerError,
+)
+from log import RECORD_HEADER
+
+DEFAULT_FETCH_BYTES = 1024 * 1024
+DEFAULT_FETCH_WAIT_MS = 1000
+
+
+def parse_records(record_format: int, first_offset: int, data: bytes) -> list[tuple[int, bytes]]:
+    '''
+    :return: the offset and payload of the complete records of a fetch response
+    '''
+    records = []
+    position = 0
+    if record_format == FORMAT_COMPACTED_RECORDS:
+        while position + COMPACTED_RECORD_HEADER.size <= len(data):
+            offset, length, _ = COMPACTED_RECORD_HEADER.unpack_from(data, position)
+            position += COMPACTED_RECORD_HEADER.size
+            if position + length > len(data):
+                break
+            records.append((offset, data[position:position + length]))
+            position += length
+        return records
+
+    offset = first_offset
+    while position + RECORD_HEADER.size <= len(data):
+        length, _ = RECORD_HEADER.unpack_from(data, position)
+        position += RECORD_HEADER.size
+        if position + length > len(data):
+            break
+        records.append((offset, data[position:position + length]))
+        position += length
+        offset += 1
+    return records
+
+
+class BrokerClient:
+    '''
+    Client of a broker (see broker.py) - requests of a client are sent one at a time
+    '''
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, socket_path: str) -> 'BrokerClient':
+        return cls(*await asyncio.open_unix_connection(socket_path, limit=2 ** 20))
+
+    async def request(self, request_type: int, topic: str, body: bytes) -> bytes:
+        topic_name = topic.encode()
+        request = REQUEST_HEADER.pack(request_type, len(topic_name)) + topic_name + body
+        async with self.lock:
+            self.writer.write(FRAME_HEADER.pack(len(request)) + request)
+            await self.writer.drain()
+            (length,) = FRAME_HEADER.unpack(await self.reader.readexactly(FRAME_HEADER.size))
+            response = await self.reader.readexactly(length)
+
+        (status,) = STATUS.unpack_from(response)
+        if status == STATUS_ERROR:
+            raise BrokerError(response[STATUS.size:].decode())
+        return response
+
+    async def produce(self, topic: str, payloads: list[str | bytes]) -> int:
+        '''
+        :return: the offset of the first record - the others follow it
+        '''
+        body = [PRODUCE_HEADER.pack(len(payloads))]
+        for payload in payloads:
+            payload = payload.encode() if isinstance(payload, str) else payload
+            body.append(PRODUCE_RECORD_HEADER.pack(len(payload)))
+            body.append(payload)
+        _, base_offset = PRODUCE_RESPONSE.unpack(await self.request(REQUEST_PRODUCE, topic, b''.join(body)))
+        return base_offset
+
+    async def fetch(self, topic: str, offset: int, max_bytes: int = DEFAULT_FETCH_BYTES, max_wait_ms: int = 0) -> list[tuple[int, bytes]]:
+        '''
+        :param max_wait_ms: time to wait for records when at the end of the topic
+        :return: the offset and payload of records from the given offset on (at least one, unless at the end of the topic)
+        '''
+        response = await self.request(REQUEST_FETCH, topic, FETCH_REQUEST.pack(offset, max_bytes, max_wait_ms))
+        _, record_format, first_offset = FETCH_RESPONSE_HEADER.unpack_from(response)
+        return parse_records(record_format, first_offset, response[FETCH_RESPONSE_HEADER.size:])
+
+    async def subscribe(self, topic: str, offset: int = 0, max_bytes: int = DEFAULT_FETCH_BYTES,
+                        max_wait_ms: int = DEFAULT_FETCH_WAIT_MS) -> AsyncIterator[tuple[int, bytes]]:
+        '''
+        Fetches the records of a topic from the given offset on, then waits for the next ones forever
+        :return: the offset and payload of each record
+        '''
+        while True:
+            for record_offset, payload in await self.fetch(topic, offset, max_bytes, max_wait_ms):
+                yield record_offset, payload
+                offset = record_offset + 1
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
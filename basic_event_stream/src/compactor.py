@@ -0,0 +1,219 @@
+import argparse
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from log import COMPACTED_RECORD_HEADER, Log, Segment, file_size, fsync_path
+
+COMPACTOR_LOCK_FILE_NAME = '.compactor.lock'
+
+
+def json_field_key(field: str) -> Callable[[bytes], object]:
+    '''
+    :return: a key function reading the key of a record from a field of its json payload - records that
+    are not json objects, or whose key can not be a dict key, have no key (so they are always kept)
+    '''
+    def key(payload: bytes):
+        try:
+            record = json.loads(payload)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+
+        record_key = record.get(field)
+        try:
+            hash(record_key)
+        except TypeError:
+            return None
+        return record_key
+
+    return key
+
+
+def segment_path(segment: Segment) -> Path:
+    return segment.compacted_path if segment.compacted_path.exists() else segment.log_path
+
+
+def segment_bytes(segment: Segment) -> int:
+    return sum(file_size(path) for path in [segment.log_path, segment.compacted_path, segment.index_path, segment.time_index_path])
+
+
+def delete_segment(segment: Segment):
+    # the log files first - readers find segments by their log files
+    for path in [segment.log_path, segment.compacted_path, segment.index_path, segment.time_index_path]:
+        path.unlink(missing_ok=True)
+
+
+def apply_retention(directory, max_age_seconds: float | None = None, max_bytes: int | None = None) -> int:
+    '''
+    Deletes the oldest closed segments of a log (all but the last one) while the log is larger than
+    max_bytes, or while their newest record is older than max_age_seconds - whole segments only, so
+    a log keeps a bit more than the retention
+
+    :return: the number of segments deleted
+    '''
+    topic_log = Log(directory)
+    total_bytes = sum(segment_bytes(segment) for segment in topic_log.segments)
+    now = time.time()
+    deleted = 0
+
+    for segment in topic_log.segments[:-1]:
+        too_old = max_age_seconds is not None and now - segment_path(segment).stat().st_mtime > max_age_seconds
+        too_large = max_bytes is not None and total_bytes > max_bytes
+        if not too_old and not too_large:
+            break
+
+        total_bytes -= segment_bytes(segment)
+        delete_segment(segment)
+        deleted += 1
+
+    return deleted
+
+
+def compact_segment(segment: Segment, key: Callable[[bytes], object], newest_offsets: dict) -> int:
+    '''
+    Rewrites a closed segment with the records that are the newest of their key (or have no key) -
+    written to a temporary file, then renamed to the compacted file of the segment, so readers see
+    either the previous or the compacted segment
+
+    :return: the number of records removed
+    '''
+    temporary_path = segment.compacted_path.with_name(f'.{segment.compacted_path.name}.tmp')
+    # the compacted segment keeps the modification time of the segment, for the retention
+    modified_time = segment_path(segment).stat().st_mtime
+    kept = 0
+    removed = 0
+
+    with temporary_path.open('wb') as compacted_file:
+        for offset, timestamp, payload in segment.read_records(segment.base_offset):
+            record_key = key(payload)
+            if record_key is not None and newest_offsets[record_key] != offset:
+                removed += 1
+                continue
+            compacted_file.write(COMPACTED_RECORD_HEADER.pack(offset, len(payload), timestamp))
+            compacted_file.write(payload)
+            kept += 1
+        compacted_file.flush()
+        os.fsync(compacted_file.fileno())
+
+    if removed == 0:
+        temporary_path.unlink()
+        return 0
+
+    if kept == 0:
+        temporary_path.unlink()
+        delete_segment(segment)
+        return removed
+
+    os.utime(temporary_path, (modified_time, modified_time))
+    os.replace(temporary_path, segment.compacted_path)
+    fsync_path(segment.compacted_path.parent)
+    for path in [segment.log_path, segment.index_path, segment.time_index_path]:
+        path.unlink(missing_ok=True)
+    return removed
+
+
+def compact(directory, key: Callable[[bytes], object]) -> int:
+    '''
+    Keeps only the newest record per key in the closed segments of a log (all but the last one, which
+    is being written). Records are kept at their offset - the offsets of the removed records are gone.
+    Records whose key is None are always kept
+
+    :return: the number of records removed
+    '''
+    closed_segments = Log(directory).segments[:-1]
+
+    newest_offsets = {}
+    for segment in closed_segments:
+        for offset, payload in segment.read(segment.base_offset):
+            record_key = key(payload)
+            if record_key is not None:
+                newest_offsets[record_key] = offset
+
+    return sum(compact_segment(segment, key, newest_offsets) for segment in closed_segments)
+
+
+def clean(directory, key: Callable[[bytes], object] | None = None, max_age_seconds: float | None = None, max_bytes: int | None = None) -> tuple[int, int]:
+    '''
+    Applies the retention to a log, and compacts it if given a key function. A single process cleans
+    a log at a time (it holds a lock on the log directory while cleaning)
+
+    :return: the number of segments deleted and of records removed by the compaction
+    '''
+    with (Path(directory) / COMPACTOR_LOCK_FILE_NAME).open('a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        deleted_segments = 0
+        if max_age_seconds is not None or max_bytes is not None:
+            deleted_segments = apply_retention(directory, max_age_seconds, max_bytes)
+        removed_records = compact(directory, key) if key is not None else 0
+        return deleted_segments, removed_records
+
+
+def latest_records(directory, key: Callable[[bytes], object]) -> dict:
+    '''
+    Replays a log
+    :return: the newest record of each key
+    '''
+    return {key(payload): payload for _, payload in Log(directory).read()}
+
+
+class Compactor:
+    '''
+    Cleans a log (see clean) every interval_seconds in a background thread. Only closed segments are
+    rewritten or deleted, so publishers are not blocked, and readers keep reading the files they opened
+    '''
+
+    def __init__(self, directory, key: Callable[[bytes], object] | None = None, max_age_seconds: float | None = None,
+                 max_bytes: int | None = None, interval_seconds: float = 60):
+        self.directory = Path(directory)
+        self.key = key
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.interval_seconds = interval_seconds
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f'compactor-{self.directory.name}', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopping.wait(self.interval_seconds):
+            try:
+                clean(self.directory, self.key, self.max_age_seconds, self.max_bytes)
+            except Exception:
+                # cleaned again at the next interval
+                logging.exception('failed to clean %s', self.directory)
+
+    def close(self):
+        self.stopping.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Applies the retention to a topic and compacts it')
+    parser.add_argument('--topic', default='test_topic', help='topic to compact')
+    parser.add_argument('--key-field', required=False, help='json field with the key of the records - the topic is compacted if given')
+    parser.add_argument('--max-age-hours', type=float, required=False, help='deletes the segments older than this')
+    parser.add_argument('--max-mb', type=int, required=False, help='deletes the oldest segments while the topic is larger than this')
+    parser.add_argument('--interval', type=float, required=False, help='runs every interval seconds instead of once')
+
+    parsed_args = parser.parse_args()
+
+    key = json_field_key(parsed_args.key_field) if parsed_args.key_field else None
+    max_age_seconds = parsed_args.max_age_hours * 3600 if parsed_args.max_age_hours is not None else None
+    max_bytes = parsed_args.max_mb * 1024 * 1024 if parsed_args.max_mb is not None else None
+
+    if parsed_args.interval:
+        Compactor(parsed_args.topic, key, max_age_seconds, max_bytes, parsed_args.interval).thread.join()
+    else:
+        print('deleted %d segments, removed %d records' % clean(parsed_args.topic, key, max_age_seconds, max_bytes))
@@ -1,7 +1,13 @@
 import argparse
 
+from datetime import datetime
 from pathlib import Path
+from batches import decode_block, read_block_records
 from common import EVENT_SEPARATOR
+from log import Log
+from mmap_reader import MmapLogReader
+from offsets import GroupConsumer
+from partitions import consume_partitions, partition_count
 
 
 EMPTY_EVENT = ''
@@ -43,9 +49,80 @@ def _read_event(file):
     return event
 
 
-parser = argparse.ArgumentParser(description='Consumer')
-parser.add_argument('--offset', type=int, default=0, required=False, help='optional offset to read from the stream')
+# topics written by publisher.emit_record - start_from is the offset of a record (0 for the first one)
+def read_records_from_offset(topic: str, start_from: int, data_store_base_path='.', follow=False):
+    if follow:
+        records = MmapLogReader(Path(data_store_base_path) / topic).read(start_from, follow=True)
+    else:
+        records = Log(Path(data_store_base_path) / topic, create=False).read(start_from)
+    for offset, record in records:
+        print(offset, bytes(record).decode(), flush=follow)
 
-parsed_args = parser.parse_args()
 
-read_events_from_position('test_topic', start_from=parsed_args.offset)
\ No newline at end of file
+# topics written by a publisher.Publisher with compression - start_from is the offset of a block
+def read_block_records_from_offset(topic: str, start_from: int, data_store_base_path='.', follow=False):
+    for offset, record in read_block_records(Path(data_store_base_path) / topic, start_from, follow):
+        print(offset, record.decode(), flush=follow)
+
+
+# resumes from the offset committed by the group - start_from, if given, resets the group to that offset
+def read_records_as_group(topic: str, group: str, start_from: int | None = None, data_store_base_path='.', commit_interval_records: int = 1000, compressed=False, follow=False):
+    with GroupConsumer(topic, group, data_store_base_path, commit_interval_records) as consumer:
+        if start_from is not None:
+            consumer.seek(start_from)
+        for offset, record in consumer.read(follow):
+            for event in decode_block(record) if compressed else [record]:
+                print(offset, event.decode(), flush=follow)
+
+
+def print_partition_record(partition: int, offset: int, record: bytes):
+    print(partition, offset, record.decode(), flush=True)
+
+
+def print_partition_block(partition: int, offset: int, block: bytes):
+    for record in decode_block(block):
+        print(partition, offset, record.decode(), flush=True)
+
+
+# epoch milliseconds, or an ISO 8601 date and time (local time if it has no time zone)
+def parse_timestamp(value: str) -> int:
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Consumer')
+    parser.add_argument('--topic', default='test_topic', help='topic to read')
+    parser.add_argument('--offset', type=int, required=False, help='optional offset to read from the stream (resets the offset of the group)')
+    parser.add_argument('--group', required=False, help='optional consumer group - resumes from the offset committed by the group')
+    parser.add_argument('--commit-interval', type=int, default=1000, help='records consumed between commits of the group offset')
+    parser.add_argument('--processes', type=int, required=False, help='processes consuming the partitions of a partitioned topic (one per CPU by default)')
+    parser.add_argument('--compressed', action='store_true', help='the topic is written in compressed blocks')
+    parser.add_argument('--since', type=parse_timestamp, required=False, help='optional time to read from (epoch milliseconds or ISO 8601) - resets the offset of the group')
+    parser.add_argument('--follow', action='store_true', help='keep waiting for new events at the end of the topic')
+
+    parsed_args = parser.parse_args()
+
+    start_from = parsed_args.offset
+    if parsed_args.since is not None:
+        try:
+            start_from = Log(Path(parsed_args.topic), create=False).offset_for_time(parsed_args.since)
+        except FileNotFoundError:
+            parser.error(f'topic {parsed_args.topic} does not exist')
+
+    if partition_count(Path(parsed_args.topic)):
+        if not parsed_args.group:
+            parser.error('partitioned topics are consumed by a --group')
+        if start_from is not None:
+            parser.error('partitioned topics are consumed from the offsets of the group')
+        handler = print_partition_block if parsed_args.compressed else print_partition_record
+        consume_partitions(parsed_args.topic, parsed_args.group, handler, parsed_args.processes, commit_interval_records=parsed_args.commit_interval, follow=parsed_args.follow)
+    elif parsed_args.group:
+        read_records_as_group(parsed_args.topic, parsed_args.group, start_from=start_from, commit_interval_records=parsed_args.commit_interval, compressed=parsed_args.compressed, follow=parsed_args.follow)
+    else:
+        read_topic = read_block_records_from_offset if parsed_args.compressed else read_records_from_offset
+        try:
+            read_topic(parsed_args.topic, start_from=start_from or 0, follow=parsed_args.follow)
+        except FileNotFoundError:
+            parser.error(f'topic {parsed_args.topic} does not exist')
\ No newline at end of file
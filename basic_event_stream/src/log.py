@@ -0,0 +1,490 @@
+import fcntl
+import os
+import struct
+import time
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Iterator
+
+# a record is the length of its payload (4 bytes, big endian) and its append timestamp (milliseconds
+# since the epoch, 8 bytes) followed by the payload
+RECORD_HEADER = struct.Struct('>Iq')
+# an index entry is the offset of a record, relative to the base offset of its segment, followed by
+# its position in the segment file
+INDEX_ENTRY = struct.Struct('>II')
+# a time index entry is a timestamp followed by the offset of the first record appended at or after
+# it, relative to the base offset of its segment
+TIME_INDEX_ENTRY = struct.Struct('>qI')
+# records of compacted segments carry their offset, as some offsets are missing - the offset (8 bytes),
+# the payload length (4 bytes) and the append timestamp (8 bytes) followed by the payload
+COMPACTED_RECORD_HEADER = struct.Struct('>QIq')
+
+LOG_FILE_SUFFIX = '.log'
+INDEX_FILE_SUFFIX = '.index'
+TIME_INDEX_FILE_SUFFIX = '.timeindex'
+COMPACTED_FILE_SUFFIX = '.compacted'
+LOCK_FILE_NAME = '.lock'
+
+DEFAULT_SEGMENT_BYTES = 128 * 1024 * 1024
+DEFAULT_INDEX_INTERVAL_BYTES = 4 * 1024
+READ_BUFFER_BYTES = 1024 * 1024
+
+
+def scan_records(file, position: int, offset: int) -> Iterator[tuple[int, int, int, bytes]]:
+    '''
+    Reads the records of a segment file from the given position (the start of the record with the
+    given offset) in large chunks, and yields the offset, the end position, the timestamp and the
+    payload of each complete record - a record that is still being written ends the scan
+    '''
+    file.seek(position)
+    buffer = b''
+    start = 0
+
+    while chunk := file.read(READ_BUFFER_BYTES):
+        buffer = buffer[start:] + chunk
+        start = 0
+
+        while len(buffer) - start >= RECORD_HEADER.size:
+            length, timestamp = RECORD_HEADER.unpack_from(buffer, start)
+            end = start + RECORD_HEADER.size + length
+            if end > len(buffer):
+                break
+
+            position += end - start
+            yield offset, position, timestamp, buffer[start + RECORD_HEADER.size:end]
+            offset += 1
+            start = end
+
+
+def scan_compacted_records(file) -> Iterator[tuple[int, int, bytes]]:
+    '''
+    Reads the records of a compacted segment file in large chunks
+    '''
+    buffer = b''
+    start = 0
+
+    while chunk := file.read(READ_BUFFER_BYTES):
+        buffer = buffer[start:] + chunk
+        start = 0
+
+        while len(buffer) - start >= COMPACTED_RECORD_HEADER.size:
+            offset, length, timestamp = COMPACTED_RECORD_HEADER.unpack_from(buffer, start)
+            end = start + COMPACTED_RECORD_HEADER.size + length
+            if end > len(buffer):
+                break
+
+            yield offset, timestamp, buffer[start + COMPACTED_RECORD_HEADER.size:end]
+            start = end
+
+
+def read_index(path: Path, entry: struct.Struct) -> tuple[list, list]:
+    '''
+    :return: the first and second fields of the entries of an index file
+    '''
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return [], []
+    # unpacked at once, much faster than entry by entry - a partially written entry at the end is ignored
+    fields = struct.unpack_from(entry.format[0] + entry.format[1:] * (len(data) // entry.size), data)
+    return list(fields[0::2]), list(fields[1::2])
+
+
+def segment_base_offsets(directory: Path) -> list[int]:
+    return sorted({int(path.stem) for suffix in [LOG_FILE_SUFFIX, COMPACTED_FILE_SUFFIX] for path in directory.glob(f'*{suffix}')})
+
+
+def file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def now_milliseconds() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def fsync_path(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Segment:
+    '''
+    A log file with the records from base_offset on, and sparse indexes of the positions of its
+    records and of their timestamps - one entry every index_interval_bytes (and one for the first
+    record in the time index). Time index entries never decrease, even if the clock does.
+
+    Once closed, a segment may be compacted: its log and index files are replaced by a compacted file
+    with some of its records, each with its offset (see compactor.py)
+    '''
+
+    def __init__(self, directory: Path, base_offset: int):
+        self.base_offset = base_offset
+        self.log_path = directory / f'{base_offset:020d}{LOG_FILE_SUFFIX}'
+        self.index_path = directory / f'{base_offset:020d}{INDEX_FILE_SUFFIX}'
+        self.compacted_path = directory / f'{base_offset:020d}{COMPACTED_FILE_SUFFIX}'
+        self.time_index_path = directory / f'{base_offset:020d}{TIME_INDEX_FILE_SUFFIX}'
+        self.index_offsets = []
+        self.index_positions = []
+        self.time_index_timestamps = []
+        self.time_index_offsets = []
+        # indexes are loaded when first needed - a read or seek only needs those of a few segments
+        self.index_loaded = False
+        self.size = 0
+        self.next_offset = base_offset
+        self.bytes_since_index_entry = 0
+        self.log_file = None
+        self.index_file = None
+        self.time_index_file = None
+
+    def load_index(self):
+        self.index_offsets, self.index_positions = read_index(self.index_path, INDEX_ENTRY)
+        self.time_index_timestamps, self.time_index_offsets = read_index(self.time_index_path, TIME_INDEX_ENTRY)
+        self.index_loaded = True
+
+    def load_index_once(self):
+        if not self.index_loaded:
+            self.load_index()
+
+    def recover(self):
+        '''
+        Finds the end of the last complete record and the next offset, discarding what a crashed
+        writer left half written - only to be called by the writer
+        '''
+        self.load_index()
+        log_size = self.log_path.stat().st_size if self.log_path.exists() else 0
+        # index entries are written after the records they point to, but either may be lost in a crash
+        while self.index_positions and self.index_positions[-1] >= log_size:
+            self.index_offsets.pop()
+            self.index_positions.pop()
+
+        next_offset, end_position = self.locate(self.base_offset + (self.index_offsets[-1] if self.index_offsets else 0))
+        if log_size > end_position:
+            with self.log_path.open('rb', buffering=0) as log_file:
+                for offset, end_position, _, _ in scan_records(log_file, end_position, next_offset):
+                    next_offset = offset + 1
+
+        self.size = end_position
+        self.next_offset = next_offset
+        self.bytes_since_index_entry = end_position - (self.index_positions[-1] if self.index_positions else 0)
+
+        if log_size > end_position:
+            os.truncate(self.log_path, end_position)
+        if self.index_path.exists() and self.index_path.stat().st_size != len(self.index_offsets) * INDEX_ENTRY.size:
+            os.truncate(self.index_path, len(self.index_offsets) * INDEX_ENTRY.size)
+
+        while self.time_index_offsets and self.base_offset + self.time_index_offsets[-1] >= next_offset:
+            self.time_index_timestamps.pop()
+            self.time_index_offsets.pop()
+        if self.time_index_path.exists() and self.time_index_path.stat().st_size != len(self.time_index_offsets) * TIME_INDEX_ENTRY.size:
+            os.truncate(self.time_index_path, len(self.time_index_offsets) * TIME_INDEX_ENTRY.size)
+
+    def locate(self, offset: int) -> tuple[int, int]:
+        '''
+        :return: the offset and position of the last indexed record at or before the given offset
+        '''
+        self.load_index_once()
+        i = bisect_right(self.index_offsets, offset - self.base_offset) - 1
+        if i < 0:
+            return self.base_offset, 0
+        return self.base_offset + self.index_offsets[i], self.index_positions[i]
+
+    def open_for_append(self):
+        # the writer keeps the indexes of the segment up to date
+        self.index_loaded = True
+        self.log_file = self.log_path.open('ab')
+        self.index_file = self.index_path.open('ab')
+        self.time_index_file = self.time_index_path.open('ab')
+
+    def append(self, payload: bytes, index_interval_bytes: int, timestamp: int) -> int:
+        if self.bytes_since_index_entry >= index_interval_bytes:
+            self.index_file.write(INDEX_ENTRY.pack(self.next_offset - self.base_offset, self.size))
+            self.index_offsets.append(self.next_offset - self.base_offset)
+            self.index_positions.append(self.size)
+            self.bytes_since_index_entry = 0
+
+        if self.next_offset == self.base_offset or self.bytes_since_index_entry == 0:
+            if not self.time_index_timestamps or timestamp > self.time_index_timestamps[-1]:
+                self.time_index_file.write(TIME_INDEX_ENTRY.pack(timestamp, self.next_offset - self.base_offset))
+                self.time_index_timestamps.append(timestamp)
+                self.time_index_offsets.append(self.next_offset - self.base_offset)
+
+        self.log_file.write(RECORD_HEADER.pack(len(payload), timestamp))
+        self.log_file.write(payload)
+
+        record_size = RECORD_HEADER.size + len(payload)
+        self.size += record_size
+        self.bytes_since_index_entry += record_size
+        offset = self.next_offset
+        self.next_offset += 1
+        return offset
+
+    def flush(self):
+        # the log first - an index entry must not point past the end of the log
+        self.log_file.flush()
+        self.index_file.flush()
+        self.time_index_file.flush()
+
+    def fsync(self):
+        self.flush()
+        os.fsync(self.log_file.fileno())
+        os.fsync(self.index_file.fileno())
+        os.fsync(self.time_index_file.fileno())
+
+    def close(self):
+        if self.log_file is not None:
+            self.flush()
+            self.log_file.close()
+            self.index_file.close()
+            self.time_index_file.close()
+            self.log_file = None
+            self.index_file = None
+            self.time_index_file = None
+
+    def open_for_read(self):
+        '''
+        :return: the compacted file if the segment was compacted, else its log file - None if the
+        segment was deleted (or not written yet)
+        '''
+        # the compacted file is created before the log file is deleted
+        for path in [self.compacted_path, self.log_path, self.compacted_path]:
+            try:
+                return path.open('rb', buffering=0)
+            except FileNotFoundError:
+                pass
+        return None
+
+    def read_records(self, start_offset: int) -> Iterator[tuple[int, int, bytes]]:
+        '''
+        :return: the offset, timestamp and payload of the records from start_offset on
+        '''
+        file = self.open_for_read()
+        if file is None:
+            return
+
+        with file:
+            if file.name == str(self.compacted_path):
+                records = scan_compacted_records(file)
+            else:
+                offset, position = self.locate(start_offset)
+                records = ((offset, timestamp, payload) for offset, _, timestamp, payload in scan_records(file, position, offset))
+
+            for offset, timestamp, payload in records:
+                if offset >= start_offset:
+                    yield offset, timestamp, payload
+
+    def read(self, start_offset: int) -> Iterator[tuple[int, bytes]]:
+        for offset, _, payload in self.read_records(start_offset):
+            yield offset, payload
+
+    def first_timestamp(self) -> int | None:
+        '''
+        :return: the timestamp of the first record of the segment, None if it has no records
+        '''
+        if self.index_loaded and self.time_index_timestamps:
+            return self.time_index_timestamps[0]
+        try:
+            with self.time_index_path.open('rb') as time_index_file:
+                first_entry = time_index_file.read(TIME_INDEX_ENTRY.size)
+            if len(first_entry) == TIME_INDEX_ENTRY.size:
+                return TIME_INDEX_ENTRY.unpack(first_entry)[0]
+        except FileNotFoundError:
+            # compacted segments have no time index
+            pass
+        for _, timestamp, _ in self.read_records(self.base_offset):
+            return timestamp
+        return None
+
+    def end_offset(self) -> int:
+        '''
+        :return: the offset following the last record of the segment
+        '''
+        self.load_index_once()
+        end_offset = self.base_offset
+        for offset, _, _ in self.read_records(self.base_offset + (self.index_offsets[-1] if self.index_offsets else 0)):
+            end_offset = offset + 1
+        return end_offset
+
+    def find_time(self, timestamp: int) -> int | None:
+        '''
+        :return: the offset of the first record of the segment appended at or after the timestamp,
+        None if there is none
+        '''
+        self.load_index_once()
+        i = bisect_left(self.time_index_timestamps, timestamp) - 1
+        start_offset = self.base_offset + self.time_index_offsets[i] if i >= 0 else self.base_offset
+        for offset, record_timestamp, _ in self.read_records(start_offset):
+            if record_timestamp >= timestamp:
+                return offset
+        return None
+
+
+def segment_first_timestamp(segment: Segment) -> float:
+    timestamp = segment.first_timestamp()
+    # segments without records are at the end of the log
+    return float('inf') if timestamp is None else timestamp
+
+
+class Log:
+    '''
+    Append-only log of a topic, stored in a directory as segment files that are rolled over once
+    they reach segment_bytes. Records are identified by their offset - their position in the log.
+
+    Reading from an offset looks up the segment and the closest indexed record (binary searches) and
+    reads sequentially from there. Any number of processes can read a log, a single one can write to
+    it at a time (appending takes a lock on the log directory until closed). Appended records are
+    visible to readers once flushed.
+
+    Closed segments may be compacted or deleted while the log is read (see compactor.py) - readers
+    skip the records that are gone
+    '''
+
+    def __init__(self, directory, segment_bytes: int = DEFAULT_SEGMENT_BYTES, index_interval_bytes: int = DEFAULT_INDEX_INTERVAL_BYTES,
+                 create: bool = True):
+        '''
+        :param create: create the log directory if it does not exist, instead of raising FileNotFoundError -
+        readers that only look at a log should not create it
+        '''
+        self.directory = Path(directory)
+        if not create and not self.directory.is_dir():
+            raise FileNotFoundError(f'no log in {self.directory}')
+        self.segment_bytes = segment_bytes
+        self.index_interval_bytes = index_interval_bytes
+        self.lock_file = None
+        # segments rolled over since the last fsync, and whether segment files were created since then
+        self.unsynced_segments = []
+        self.unsynced_directory = False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.load_segments()
+
+    def load_segments(self):
+        base_offsets = segment_base_offsets(self.directory)
+        self.segments = [Segment(self.directory, base_offset) for base_offset in base_offsets or [0]]
+
+    @property
+    def next_offset(self) -> int:
+        return self.segments[-1].next_offset
+
+    def append(self, payload: bytes, timestamp: int | None = None) -> int:
+        '''
+        :param timestamp: of the record, in milliseconds since the epoch - the current time by default
+        '''
+        if self.lock_file is None:
+            self.open_for_append()
+
+        active_segment = self.segments[-1]
+        if active_segment.size > 0 and active_segment.size + RECORD_HEADER.size + len(payload) > self.segment_bytes:
+            active_segment = self.roll()
+
+        return active_segment.append(payload, self.index_interval_bytes, now_milliseconds() if timestamp is None else timestamp)
+
+    def open_for_append(self, blocking: bool = True):
+        '''
+        :param blocking: wait for another writer to close the log, instead of raising BlockingIOError
+        '''
+        lock_file = (self.directory / LOCK_FILE_NAME).open('a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise
+        self.lock_file = lock_file
+        # another writer may have appended since the log was opened
+        self.load_segments()
+        self.segments[-1].recover()
+        self.unsynced_directory = not self.segments[-1].log_path.exists()
+        self.segments[-1].open_for_append()
+
+    def roll(self) -> Segment:
+        previous_segment = self.segments[-1]
+        previous_segment.close()
+
+        self.unsynced_segments.append(previous_segment)
+        self.unsynced_directory = True
+
+        segment = Segment(self.directory, previous_segment.next_offset)
+        segment.open_for_append()
+        self.segments.append(segment)
+        return segment
+
+    def flush(self):
+        if self.lock_file is not None:
+            self.segments[-1].flush()
+
+    def fsync(self):
+        '''
+        Flushes the appended records and waits for them to be written to disk
+        '''
+        if self.lock_file is None:
+            return
+
+        for segment in self.unsynced_segments:
+            for path in [segment.log_path, segment.index_path, segment.time_index_path]:
+                try:
+                    fsync_path(path)
+                except FileNotFoundError:
+                    # compacted or deleted since it was rolled over - the compacted file is fsynced
+                    pass
+        self.unsynced_segments = []
+
+        self.segments[-1].fsync()
+
+        if self.unsynced_directory:
+            # the entries of the new segment files
+            fsync_path(self.directory)
+            self.unsynced_directory = False
+
+    def close(self):
+        if self.lock_file is not None:
+            self.segments[-1].close()
+            self.lock_file.close()
+            self.lock_file = None
+
+    def refresh_segments(self):
+        '''
+        Adds the segments rolled over by the writer since the log was loaded - for readers
+        '''
+        last_base_offset = self.segments[-1].base_offset
+        for base_offset in segment_base_offsets(self.directory):
+            if base_offset > last_base_offset:
+                self.segments.append(Segment(self.directory, base_offset))
+
+    def find_segment(self, offset: int) -> int:
+        '''
+        :return: the position in segments of the segment with the given offset
+        '''
+        return max(bisect_right([segment.base_offset for segment in self.segments], offset) - 1, 0)
+
+    def offset_for_time(self, timestamp: int) -> int:
+        '''
+        Binary searches for the segment and the closest indexed record, and reads from there
+
+        :param timestamp: in milliseconds since the epoch
+        :return: the offset of the first record appended at or after the timestamp, the offset
+        following the last record of the log if there is none
+        '''
+        i = bisect_left(self.segments, timestamp, key=segment_first_timestamp)
+        # the first records at the timestamp may be at the end of the previous segment
+        for segment in self.segments[max(i - 1, 0):]:
+            offset = segment.find_time(timestamp)
+            if offset is not None:
+                return offset
+        return self.segments[-1].end_offset()
+
+    def read(self, start_offset: int = 0) -> Iterator[tuple[int, bytes]]:
+        '''
+        :return: the offset and payload of the records from start_offset to the end of the log
+        '''
+        for segment in self.segments[self.find_segment(start_offset):]:
+            yield from segment.read(start_offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,124 @@
+import mmap
+import os
+from pathlib import Path
+from typing import Callable, Generator, Iterator
+
+from log import COMPACTED_RECORD_HEADER, RECORD_HEADER, Log, Segment, file_size
+from watcher import InotifyWatcher, PollingWatcher, watch_directory
+
+
+def map_file(path: Path) -> memoryview:
+    with path.open('rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            # empty files can not be mapped
+            return memoryview(b'')
+        # the map stays valid after the file is closed
+        return memoryview(mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ))
+
+
+class MmapLogReader:
+    '''
+    Reads the records of a log (see log.Log) from memory maps of its segment files. Records are
+    memoryview slices of the maps - nothing is copied until the caller does it (e.g. bytes(record)).
+
+    A map covers its file as it was when mapped: when the end of a map is reached, the file is mapped
+    again if it grew. Maps are unmapped once no slice of them is referenced anymore, so slices should
+    not be kept around longer than needed. Compacted segments are read from their compacted file.
+
+    When following a log, the reader waits for the writer with inotify (or polling where it is not
+    available, or use_inotify is False) - on_idle is called before each wait
+    '''
+
+    def __init__(self, directory, on_idle: Callable[[], None] | None = None, use_inotify: bool = True):
+        self.log = Log(directory, create=False)
+        self.on_idle = on_idle
+        self.use_inotify = use_inotify
+
+    def read(self, start_offset: int = 0, follow: bool = False) -> Iterator[tuple[int, memoryview]]:
+        '''
+        :param follow: keep waiting for records appended to the log instead of stopping at its end
+        :return: the offset and payload of the records from start_offset on
+        '''
+        # watching before reading - the writes made while reading end the first wait
+        watcher = watch_directory(self.log.directory, self.use_inotify) if follow else None
+        segment_index = self.log.find_segment(start_offset)
+        offset = start_offset
+
+        try:
+            while True:
+                offset = yield from self.read_segment(self.log.segments[segment_index], offset, watcher)
+                if segment_index == len(self.log.segments) - 1:
+                    # the end of the log, when not following it
+                    return
+                segment_index += 1
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+    def read_segment(self, segment: Segment, start_offset: int, watcher: InotifyWatcher | PollingWatcher | None) -> Generator[tuple[int, memoryview], None, int]:
+        '''
+        Reads the records of a segment from start_offset on, until the writer rolled over to the next
+        segment (or the end of the log, when not following it - without a watcher)
+
+        :return: the offset following the last record read
+        '''
+        offset, position = segment.locate(start_offset)
+        view = memoryview(b'')
+
+        while True:
+            size = len(view)
+            while position + RECORD_HEADER.size <= size:
+                length, _ = RECORD_HEADER.unpack_from(view, position)
+                end = position + RECORD_HEADER.size + length
+                if end > size:
+                    break
+                if offset >= start_offset:
+                    yield offset, view[position + RECORD_HEADER.size:end]
+                offset += 1
+                position = end
+
+            # the end of the map - the segment may have grown since it was mapped, or be complete and
+            # followed by a new one, or have been compacted or deleted
+            if segment is self.log.segments[-1]:
+                self.log.refresh_segments()
+            is_last = segment is self.log.segments[-1]
+
+            # checked after looking for a next segment, as the writer rolls over after its last write
+            # to the previous one
+            if file_size(segment.log_path) > size:
+                try:
+                    view = map_file(segment.log_path)
+                except FileNotFoundError:
+                    pass
+                if watcher is not None:
+                    watcher.reset()
+                continue
+
+            if segment.compacted_path.exists():
+                return (yield from self.read_compacted(segment, max(offset, start_offset)))
+
+            if not is_last or watcher is None:
+                return offset
+            if self.on_idle is not None:
+                self.on_idle()
+            watcher.wait()
+
+    def read_compacted(self, segment: Segment, start_offset: int) -> Generator[tuple[int, memoryview], None, int]:
+        try:
+            view = map_file(segment.compacted_path)
+        except FileNotFoundError:
+            # deleted by the retention
+            return start_offset
+
+        next_offset = start_offset
+        position = 0
+        while position < len(view):
+            offset, length, _ = COMPACTED_RECORD_HEADER.unpack_from(view, position)
+            end = position + COMPACTED_RECORD_HEADER.size + length
+            if offset >= start_offset:
+                yield offset, view[position + COMPACTED_RECORD_HEADER.size:end]
+                next_offset = offset + 1
+            position = end
+
+        return next_offset
@@ -0,0 +1,103 @@
+import fcntl
+import json
+import os
+from pathlib import Path
+from typing import Iterator
+
+from log import Log, fsync_path
+from mmap_reader import MmapLogReader
+
+OFFSETS_FILE_SUFFIX = '.offsets'
+
+
+def offsets_path(topic_directory: Path, group: str) -> Path:
+    return Path(topic_directory) / f'{group}{OFFSETS_FILE_SUFFIX}'
+
+
+def load_committed_offset(path: Path) -> int:
+    '''
+    :return: the offset committed in the given checkpoint file - the next record to consume, 0 if
+    nothing was committed yet
+    '''
+    if not path.exists():
+        return 0
+    return json.loads(path.read_text())['offset']
+
+
+def save_committed_offset(path: Path, offset: int):
+    '''
+    Replaces the checkpoint file atomically: a crash leaves either the previous or the new offset
+    '''
+    temporary_path = path.with_name(f'.{path.name}.tmp')
+    with temporary_path.open('w') as temporary_file:
+        json.dump({'offset': offset}, temporary_file)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_path, path)
+    fsync_path(path.parent)
+
+
+class GroupConsumer:
+    '''
+    Consumes a topic (segmented log) as a member of a consumer group. The group commits the offset of
+    the next record to consume in a checkpoint file in the topic directory, and resumes from there.
+
+    Offsets are committed every commit_interval_records consumed records (0 to only commit explicitly
+    with commit) and when the consumer is closed - a record counts as consumed once the next one is
+    requested, so records are consumed at least once. A single consumer of a group can consume a topic
+    at a time
+    '''
+
+    def __init__(self, topic: str, group: str, data_store_base_path='.', commit_interval_records: int = 1000):
+        self.topic_directory = Path(data_store_base_path) / topic
+        self.topic_directory.mkdir(parents=True, exist_ok=True)
+        self.offsets_path = offsets_path(self.topic_directory, group)
+        self.commit_interval_records = commit_interval_records
+
+        self.lock_file = self.offsets_path.with_name(f'.{self.offsets_path.name}.lock').open('a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            raise RuntimeError(f'group {group} is already consuming {topic}')
+
+        self.committed_offset = load_committed_offset(self.offsets_path)
+        self.position = self.committed_offset
+
+    def read(self, follow: bool = False) -> Iterator[tuple[int, bytes]]:
+        '''
+        :param follow: keep waiting for records appended to the log instead of stopping at its end - the
+        offset is committed before each wait (unless only committed explicitly)
+        :return: the offset and payload of the records from the position of the consumer to the end of the log
+        '''
+        if follow:
+            reader = MmapLogReader(self.topic_directory, on_idle=self.commit if self.commit_interval_records else None)
+            records = ((offset, bytes(record)) for offset, record in reader.read(self.position, follow=True))
+        else:
+            records = Log(self.topic_directory).read(self.position)
+
+        for offset, record in records:
+            if self.commit_interval_records and self.position - self.committed_offset >= self.commit_interval_records:
+                self.commit()
+            yield offset, record
+            self.position = offset + 1
+
+    def seek(self, offset: int):
+        self.position = offset
+
+    def commit(self):
+        if self.position != self.committed_offset:
+            save_committed_offset(self.offsets_path, self.position)
+            self.committed_offset = self.position
+
+    def close(self):
+        if self.lock_file is not None:
+            self.commit()
+            self.lock_file.close()
+            self.lock_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,106 @@
+import os
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+from offsets import GroupConsumer
+from publisher import Publisher
+
+PARTITION_DIRECTORY_PREFIX = 'partition-'
+
+
+def partition_name(partition: int) -> str:
+    return f'{PARTITION_DIRECTORY_PREFIX}{partition}'
+
+
+def partition_for_key(key: str | bytes, partitions: int) -> int:
+    # crc32 rather than hash - the partition of a key must not depend on the process
+    return zlib.crc32(key.encode() if isinstance(key, str) else key) % partitions
+
+
+def create_partitioned_topic(topic: str, partitions: int, data_store_base_path='.') -> Path:
+    topic_directory = Path(data_store_base_path) / topic
+    existing_partitions = partition_count(topic_directory)
+    if existing_partitions and existing_partitions != partitions:
+        raise ValueError(f'{topic} already has {existing_partitions} partitions')
+
+    for partition in range(partitions):
+        (topic_directory / partition_name(partition)).mkdir(parents=True, exist_ok=True)
+    return topic_directory
+
+
+def partition_count(topic_directory: Path) -> int:
+    return len(list(Path(topic_directory).glob(f'{PARTITION_DIRECTORY_PREFIX}*')))
+
+
+class PartitionedPublisher:
+    '''
+    Publishes to a topic with a segmented log per partition (<topic>/partition-<n>). The partition of an
+    event is chosen by the hash of its key, so the events with the same key are in the same partition,
+    in the order they were published. Each partition is written by its own Publisher (see
+    publisher.Publisher for the publisher_options)
+    '''
+
+    def __init__(self, topic: str, partitions: int, data_store_base_path='.', **publisher_options):
+        topic_directory = create_partitioned_topic(topic, partitions, data_store_base_path)
+        self.publishers = [Publisher(partition_name(partition), topic_directory, **publisher_options) for partition in range(partitions)]
+
+    def publish(self, key: str | bytes, event: str | bytes) -> tuple[int, Future]:
+        '''
+        :return: the partition of the event, and a future resolved with its offset in the partition
+        '''
+        partition = partition_for_key(key, len(self.publishers))
+        return partition, self.publishers[partition].publish(event)
+
+    def close(self):
+        for publisher in self.publishers:
+            publisher.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def consume_partition(topic_directory: Path, partition: int, group: str, handler: Callable[[int, int, bytes], None], commit_interval_records: int,
+                      follow: bool = False) -> int:
+    '''
+    Consumes a partition from the offset committed by the group to its end (or forever, when following it)
+
+    :return: the number of records consumed
+    '''
+    records = 0
+    with GroupConsumer(partition_name(partition), group, topic_directory, commit_interval_records) as consumer:
+        for offset, record in consumer.read(follow):
+            handler(partition, offset, record)
+            records += 1
+
+    return records
+
+
+def consume_partitions(topic: str, group: str, handler: Callable[[int, int, bytes], None], processes: int | None = None,
+                       data_store_base_path='.', commit_interval_records: int = 1000, follow: bool = False) -> dict[int, int]:
+    '''
+    Consumes the partitions of a topic in a pool of processes (one per CPU by default). A partition is
+    consumed by a single process, in order, with its own committed offset - so the events with the same
+    key are handled in the order they were published. The handler is called with the partition, offset
+    and payload of each record and needs to be picklable (e.g. a module level function). When following
+    the partitions, there needs to be a process per partition
+
+    :return: the number of records consumed per partition
+    '''
+    topic_directory = Path(data_store_base_path) / topic
+    partitions = partition_count(topic_directory)
+    if partitions == 0:
+        raise ValueError(f'{topic} is not a partitioned topic')
+
+    if follow:
+        processes = partitions
+    with ProcessPoolExecutor(min(processes or os.cpu_count(), partitions)) as pool:
+        futures = {
+            partition: pool.submit(consume_partition, topic_directory, partition, group, handler, commit_interval_records, follow)
+            for partition in range(partitions)
+        }
+        return {partition: future.result() for partition, future in futures.items()}
@@ -1,6 +1,21 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
 from os import linesep
+from batches import CODECS, encode_block
 from common import EVENT_SEPARATOR
+from log import Log
+
+# fsync modes of Publisher
+FSYNC_NONE = 'none'
+FSYNC_BATCH = 'batch'
+FSYNC_INTERVAL = 'interval'
+FSYNC_MODES = [FSYNC_NONE, FSYNC_BATCH, FSYNC_INTERVAL]
+
+_STOP = object()
 
 
 def emit(event: str, topic: str, data_store_base_path='.'):
@@ -15,5 +30,160 @@ def emit_bytes(event: str, topic: str, data_store_base_path='.'):
     with topic_path.open('at') as topic_store_file:
         topic_store_file.write(event + EVENT_SEPARATOR)
 
+def emit_record(event: str, topic: str, data_store_base_path='.') -> int:
+    with Log(Path(data_store_base_path) / topic) as topic_log:
+        return topic_log.append(event.encode())
+
+
+class Publisher:
+    '''
+    Long lived publisher to a topic (segmented log). Events can be published by any number of threads:
+    they are queued and written by a single writer thread in batches (group commit) - whatever was
+    queued while the previous batch was written, up to batch_bytes, waiting up to linger_seconds for
+    more events if linger_seconds is set.
+
+    Each batch is flushed to the OS, so readers see it, and:
+    - FSYNC_NONE: left to the OS to write to disk
+    - FSYNC_BATCH: fsynced - events are durable once published
+    - FSYNC_INTERVAL: fsynced at most every fsync_interval_seconds - events published in between can be
+    lost in a crash of the machine (not of the process)
+
+    publish returns a future resolved with the offset of the event once its batch is written (and
+    fsynced, with FSYNC_BATCH).
+
+    With a compression codec (see batches.CODECS), each batch is written as a single compressed block
+    record - the events of a batch share the offset of its block, and are read with
+    batches.read_block_records
+    '''
+
+    def __init__(self, topic: str, data_store_base_path='.', fsync: str = FSYNC_BATCH, batch_bytes: int = 1024 * 1024,
+                 linger_seconds: float = 0, fsync_interval_seconds: float = 1.0, compression: str | None = None):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f'fsync needs to be one of {FSYNC_MODES}')
+        if compression is not None and compression not in CODECS:
+            raise ValueError(f'compression needs to be one of {CODECS}')
+
+        self.log = Log(Path(data_store_base_path) / topic)
+        self.fsync = fsync
+        self.batch_bytes = batch_bytes
+        self.linger_seconds = linger_seconds
+        self.fsync_interval_seconds = fsync_interval_seconds
+        self.compression = compression
+        self.queue = queue.SimpleQueue()
+        # guards closing and failing against concurrent publishing - no event is queued once the writer stopped
+        self.lock = threading.Lock()
+        self.closed = False
+        self.error = None
+        self.writer = threading.Thread(target=self._write_batches, name=f'publisher-{topic}', daemon=True)
+        self.writer.start()
+
+    def publish(self, event: str | bytes) -> Future:
+        future = Future()
+        with self.lock:
+            if self.error is not None:
+                raise RuntimeError('publisher failed') from self.error
+            if self.closed:
+                raise RuntimeError('publisher is closed')
+            self.queue.put((event.encode() if isinstance(event, str) else event, future))
+        return future
+
+    def close(self):
+        '''
+        Writes the events published so far and stops the writer
+        '''
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.queue.put(_STOP)
+        self.writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_batches(self):
+        batch = []
+        try:
+            last_fsync = time.monotonic()
+            unsynced = False
+            stopping = False
+
+            while not stopping:
+                # with FSYNC_INTERVAL, unsynced events are fsynced in time even if nothing else is published
+                timeout = max(last_fsync + self.fsync_interval_seconds - time.monotonic(), 0) if unsynced else None
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    self.log.fsync()
+                    last_fsync = time.monotonic()
+                    unsynced = False
+                    continue
+
+                batch, stopping = self._next_batch(item)
+                if not batch:
+                    continue
+
+                if self.compression is None:
+                    offsets = [self.log.append(payload) for payload, _ in batch]
+                else:
+                    offsets = [self.log.append(encode_block([payload for payload, _ in batch], self.compression))] * len(batch)
+                self.log.flush()
+                if self.fsync == FSYNC_BATCH or (self.fsync == FSYNC_INTERVAL and time.monotonic() >= last_fsync + self.fsync_interval_seconds):
+                    self.log.fsync()
+                    last_fsync = time.monotonic()
+                    unsynced = False
+                else:
+                    unsynced = self.fsync == FSYNC_INTERVAL
+
+                for offset, (_, future) in zip(offsets, batch):
+                    future.set_result(offset)
+                batch = []
+
+            if self.fsync != FSYNC_NONE:
+                self.log.fsync()
+        except Exception as e:
+            logging.exception('publisher writer failed')
+            with self.lock:
+                self.error = e
+                # the batch being written and the events queued after it
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        batch.append(item)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self.log.close()
+
+    def _next_batch(self, item) -> tuple[list, bool]:
+        '''
+        :return: the events of the batch starting with the given queue item, and whether the publisher is stopping
+        '''
+        batch = []
+        batch_size = 0
+        deadline = time.monotonic() + self.linger_seconds
+
+        while item is not _STOP:
+            batch.append(item)
+            batch_size += len(item[0])
+            if batch_size >= self.batch_bytes:
+                return batch, False
+
+            try:
+                if self.linger_seconds:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                else:
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+
+        return batch, True
 
-emit_bytes('{"payload": "dummy"}', 'test_topic')
\ No newline at end of file
+if __name__ == '__main__':
+    emit_record('{"payload": "dummy"}', 'test_topic')
\ No newline at end of file
@@ -0,0 +1,101 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import sys
+import time
+from pathlib import Path
+
+# inotify events (see inotify(7))
+IN_MODIFY = 0x2
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+
+INOTIFY_READ_BYTES = 64 * 1024
+
+_libc = None
+
+
+def libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    return _libc
+
+
+class InotifyWatcher:
+    '''
+    Waits for the files of a directory to be written, created or renamed, with inotify (Linux only).
+    Changes made after the watcher was created and before wait is called end the wait right away,
+    so nothing is missed between reading the files and waiting
+    '''
+
+    def __init__(self, directory):
+        try:
+            inotify_init1 = libc().inotify_init1
+            inotify_add_watch = libc().inotify_add_watch
+        except AttributeError:
+            raise OSError('inotify is not available')
+
+        self.fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if inotify_add_watch(self.fd, os.fsencode(Path(directory)), IN_MODIFY | IN_CREATE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch of {directory} failed')
+
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLIN)
+
+    def wait(self, timeout_seconds: float | None = None):
+        self.poller.poll(None if timeout_seconds is None else timeout_seconds * 1000)
+        # the events themselves do not matter - the caller checks the files
+        try:
+            while os.read(self.fd, INOTIFY_READ_BYTES):
+                pass
+        except BlockingIOError:
+            pass
+
+    def reset(self):
+        pass
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class PollingWatcher:
+    '''
+    Sleeps before the caller checks the files again - twice as long after every wait until reset
+    (when the caller found something new), from min_interval_seconds to max_interval_seconds
+    '''
+
+    def __init__(self, min_interval_seconds: float = 0.0005, max_interval_seconds: float = 0.1):
+        self.min_interval_seconds = min_interval_seconds
+        self.max_interval_seconds = max_interval_seconds
+        self.interval_seconds = min_interval_seconds
+
+    def wait(self, timeout_seconds: float | None = None):
+        time.sleep(self.interval_seconds if timeout_seconds is None else min(self.interval_seconds, timeout_seconds))
+        self.interval_seconds = min(self.interval_seconds * 2, self.max_interval_seconds)
+
+    def reset(self):
+        self.interval_seconds = self.min_interval_seconds
+
+    def close(self):
+        pass
+
+
+def watch_directory(directory, use_inotify: bool = True) -> InotifyWatcher | PollingWatcher:
+    '''
+    :return: an inotify watcher of the directory, or a polling one where inotify is not available
+    '''
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directory)
+        except OSError as e:
+            logging.warning('inotify is not available (%s) - polling %s', e, directory)
+    return PollingWatcher()
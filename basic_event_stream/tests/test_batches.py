@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+from batches import BLOCK_HEADER, CODEC_NONE, CODEC_ZLIB, CODECS, decode_block, encode_block, read_block_records
+from log import Log
+
+PAYLOADS = [f'{{"order": {order}, "status": "created"}}'.encode() for order in range(20)] + [b'']
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_blocks_decode_to_their_records(codec):
+    assert decode_block(encode_block(PAYLOADS, codec)) == PAYLOADS
+    assert decode_block(encode_block([], codec)) == []
+
+
+def test_compressed_blocks_are_smaller():
+    assert len(encode_block(PAYLOADS, CODEC_ZLIB)) < len(encode_block(PAYLOADS, CODEC_NONE))
+
+
+def test_unknown_codecs_are_rejected():
+    with pytest.raises(ValueError, match='codec needs to be one of'):
+        encode_block(PAYLOADS, 'rot13')
+
+    block = bytearray(encode_block(PAYLOADS, CODEC_NONE))
+    block[0] = 255
+    with pytest.raises(ValueError, match='unknown'):
+        decode_block(bytes(block))
+
+
+def test_the_records_of_a_block_share_its_offset(tmp_path):
+    with Log(tmp_path) as topic_log:
+        topic_log.append(encode_block([b'a', b'b']))
+        topic_log.append(encode_block([b'c'], CODEC_NONE))
+        topic_log.append(encode_block([b'd', b'e', b'f']))
+
+    assert list(read_block_records(tmp_path)) == [(0, b'a'), (0, b'b'), (1, b'c'), (2, b'd'), (2, b'e'), (2, b'f')]
+    assert list(read_block_records(tmp_path, 2)) == [(2, b'd'), (2, b'e'), (2, b'f')]
+
+
+def test_blocks_appended_to_a_followed_log_are_read(tmp_path):
+    with Log(tmp_path) as topic_log:
+        topic_log.append(encode_block([b'a', b'b']))
+
+        records = []
+        read_all = threading.Event()
+
+        def follow():
+            for record in read_block_records(tmp_path, follow=True):
+                records.append(record)
+                if len(records) == 4:
+                    read_all.set()
+                    return
+
+        threading.Thread(target=follow, daemon=True).start()
+        topic_log.append(encode_block([b'c', b'd']))
+        topic_log.flush()
+
+        assert read_all.wait(5)
+    assert records == [(0, b'a'), (0, b'b'), (1, b'c'), (1, b'd')]
+
+
+def test_the_header_holds_the_codec_and_record_count():
+    assert BLOCK_HEADER.unpack_from(encode_block(PAYLOADS, CODEC_ZLIB)) == (1, len(PAYLOADS))
+
+
+def test_a_missing_log_of_blocks_is_not_created(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(read_block_records(tmp_path / 'typo'))
+
+    assert not (tmp_path / 'typo').exists()
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from broker import Broker, BrokerError
+from broker_client import BrokerClient
+from log import Log
+
+
+def run_with_broker(data_directory, client_requests):
+    '''
+    Serves the topics of data_directory while client_requests runs with a connected client
+    :return: the result of client_requests
+    '''
+    async def run():
+        broker = Broker(data_directory)
+        socket_path = str(data_directory / 'broker.sock')
+        server = await asyncio.start_unix_server(broker.handle_connection, socket_path)
+        try:
+            async with server, await BrokerClient.connect(socket_path) as client:
+                return await client_requests(client)
+        finally:
+            for topic in broker.topics.values():
+                topic.log.close()
+
+    return asyncio.run(run())
+
+
+def test_produced_records_are_fetched_from_their_offset(tmp_path):
+    async def requests(client: BrokerClient):
+        first_offsets = [await client.produce('topic', [f'event {i}', f'event {i} bis']) for i in range(3)]
+        return first_offsets, await client.fetch('topic', 3), await client.fetch('topic', 6)
+
+    first_offsets, records, end_of_topic = run_with_broker(tmp_path, requests)
+
+    assert first_offsets == [0, 2, 4]
+    assert records == [(3, b'event 1 bis'), (4, b'event 2'), (5, b'event 2 bis')]
+    assert end_of_topic == []
+
+
+def test_a_fetch_returns_at_least_one_record_up_to_max_bytes(tmp_path):
+    async def requests(client: BrokerClient):
+        await client.produce('topic', [b'x' * 100, b'y' * 100])
+        return await client.fetch('topic', 0, max_bytes=10)
+
+    assert run_with_broker(tmp_path, requests) == [(0, b'x' * 100)]
+
+
+def test_a_fetch_at_the_end_of_a_topic_waits_for_produced_records(tmp_path):
+    async def requests(client: BrokerClient):
+        async with await BrokerClient.connect(str(tmp_path / 'broker.sock')) as producer:
+            await producer.produce('topic', ['event'])
+            fetch = asyncio.create_task(client.fetch('topic', 1, max_wait_ms=10_000))
+            await asyncio.sleep(0.05)
+            await producer.produce('topic', ['produced while waiting'])
+            return await fetch
+
+    assert run_with_broker(tmp_path, requests) == [(1, b'produced while waiting')]
+
+
+def test_invalid_topic_names_are_rejected(tmp_path):
+    async def requests(client: BrokerClient):
+        with pytest.raises(BrokerError):
+            await client.produce('../outside', ['event'])
+        # the connection is still usable
+        return await client.produce('topic', ['event'])
+
+    assert run_with_broker(tmp_path, requests) == 0
+
+
+def test_fetching_an_unknown_topic_does_not_create_it(tmp_path):
+    async def requests(client: BrokerClient):
+        with pytest.raises(BrokerError, match='unknown topic'):
+            await client.fetch('typo', 0)
+
+    run_with_broker(tmp_path, requests)
+
+    assert not (tmp_path / 'typo').exists()
+
+
+def test_producers_get_an_error_when_the_log_cannot_be_flushed(tmp_path, monkeypatch):
+    def flush_failing(_):
+        raise OSError(28, 'No space left on device')
+
+    async def requests(client: BrokerClient):
+        await client.produce('topic', ['event'])
+        with monkeypatch.context() as patched:
+            patched.setattr(Log, 'flush', flush_failing)
+            with pytest.raises(BrokerError, match='No space left on device'):
+                await asyncio.wait_for(client.produce('topic', ['not flushed']), 5)
+        # the broker still serves the topic
+        await client.produce('topic', ['flushed'])
+        return await client.fetch('topic', 0)
+
+    assert run_with_broker(tmp_path, requests) == [(0, b'event'), (1, b'not flushed'), (2, b'flushed')]
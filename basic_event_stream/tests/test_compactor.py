@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+import time
+
+import compactor
+from compactor import Compactor, clean, json_field_key, latest_records, segment_bytes
+from log import RECORD_HEADER, Log, segment_base_offsets
+
+SEGMENT_RECORDS = 10
+
+
+def update(key: str, version: int) -> bytes:
+    return json.dumps({'key': key, 'version': f'{version:03d}'}).encode()
+
+
+def write_log(directory, payloads: list[bytes]):
+    # payloads of the same size, so each segment has SEGMENT_RECORDS records
+    segment_bytes = SEGMENT_RECORDS * (RECORD_HEADER.size + len(payloads[0]))
+    with Log(directory, segment_bytes=segment_bytes) as topic_log:
+        for payload in payloads:
+            topic_log.append(payload)
+
+
+def test_compaction_keeps_the_newest_record_of_each_key_at_its_offset(tmp_path):
+    payloads = [update(key, version) for version in range(10) for key in 'abc'] + [update('a', 10)]
+    write_log(tmp_path, payloads)
+    key = json_field_key('key')
+
+    deleted_segments, removed_records = clean(tmp_path, key)
+
+    assert deleted_segments == 0
+    # the newest records of the closed segments (0 to 29) are kept, the active segment is untouched
+    assert removed_records == 27
+    assert list(Log(tmp_path).read()) == [(27, update('a', 9)), (28, update('b', 9)), (29, update('c', 9)), (30, update('a', 10))]
+    assert latest_records(tmp_path, key) == {'a': update('a', 10), 'b': update('b', 9), 'c': update('c', 9)}
+
+
+def test_compaction_keeps_records_without_a_key(tmp_path):
+    payloads = [update(None, version) for version in range(SEGMENT_RECORDS)] + [update(None, SEGMENT_RECORDS)]
+    write_log(tmp_path, payloads)
+
+    assert clean(tmp_path, json_field_key('key')) == (0, 0)
+    assert len(list(Log(tmp_path).read())) == SEGMENT_RECORDS + 1
+
+
+def test_records_that_are_not_json_objects_have_no_key():
+    key = json_field_key('key')
+
+    assert key(b'not json') is None
+    assert key(b'["a", 1]') is None
+    assert key(b'{"key": ["a"]}') is None
+    assert key(b'{"key": "a"}') == 'a'
+
+
+def test_compaction_keeps_records_that_are_not_json_objects(tmp_path):
+    payloads = [update('a', version) for version in range(SEGMENT_RECORDS)] + [update('a', SEGMENT_RECORDS)]
+    payloads[3] = b'{"key": [1, 2], "vers": "003"}'
+    payloads[5] = b'not json, padded to the size'
+    payloads[5] += b' ' * (len(payloads[0]) - len(payloads[5]))
+    write_log(tmp_path, payloads)
+
+    assert clean(tmp_path, json_field_key('key')) == (0, SEGMENT_RECORDS - 3)
+    assert [offset for offset, _ in Log(tmp_path).read()] == [3, 5, SEGMENT_RECORDS - 1, SEGMENT_RECORDS]
+
+
+def test_compactors_keep_cleaning_after_a_failure(tmp_path, monkeypatch):
+    cleaned = threading.Event()
+    calls = []
+
+    def clean(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OSError('disk error')
+        cleaned.set()
+        return 0, 0
+
+    monkeypatch.setattr(compactor, 'clean', clean)
+    with Compactor(tmp_path, interval_seconds=0.01):
+        assert cleaned.wait(5)
+
+
+def test_compacted_segments_can_be_compacted_again(tmp_path):
+    payloads = [update(key, version) for version in range(10) for key in 'ab'] + [update('c', 0)]
+    write_log(tmp_path, payloads)
+    key = json_field_key('key')
+    clean(tmp_path, key)
+    assert [offset for offset, _ in Log(tmp_path).read()] == [18, 19, 20]
+
+    with Log(tmp_path, segment_bytes=1) as topic_log:
+        # each record rolls the active segment over, so the previous one is closed
+        topic_log.append(update('b', 10))
+        topic_log.append(update('c', 1))
+    clean(tmp_path, key)
+
+    # 19 is replaced by 21 - the active segment (22) is not compacted
+    assert [offset for offset, _ in Log(tmp_path).read()] == [18, 20, 21, 22]
+
+
+def test_retention_deletes_the_oldest_segments_while_the_log_is_too_large(tmp_path):
+    write_log(tmp_path, [update('a', version) for version in range(45)])
+    newest_segments_bytes = sum(segment_bytes(segment) for segment in Log(tmp_path).segments[2:])
+
+    deleted_segments, _ = clean(tmp_path, max_bytes=newest_segments_bytes)
+
+    assert deleted_segments == 2
+    assert segment_base_offsets(tmp_path) == [20, 30, 40]
+    assert next(Log(tmp_path).read())[0] == 20
+
+
+def test_retention_deletes_the_segments_older_than_the_max_age(tmp_path):
+    write_log(tmp_path, [update('a', version) for version in range(25)])
+    an_hour_ago = time.time() - 3600
+    os.utime(tmp_path / '00000000000000000000.log', (an_hour_ago, an_hour_ago))
+
+    assert clean(tmp_path, max_age_seconds=60) == (1, 0)
+    assert segment_base_offsets(tmp_path) == [10, 20]
+
+
+def test_retention_keeps_the_active_segment(tmp_path):
+    write_log(tmp_path, [update('a', version) for version in range(5)])
+
+    assert clean(tmp_path, max_bytes=0) == (0, 0)
+    assert len(list(Log(tmp_path).read())) == 5
@@ -0,0 +1,106 @@
+import pytest
+
+from log import INDEX_ENTRY, RECORD_HEADER, Log, segment_base_offsets
+
+
+def payload(offset: int) -> bytes:
+    return f'event {offset:04d}'.encode()
+
+
+def write_log(directory, records: int, timestamps=None, **kwargs) -> Log:
+    topic_log = Log(directory, **kwargs)
+    for offset in range(records):
+        topic_log.append(payload(offset), None if timestamps is None else timestamps[offset])
+    topic_log.close()
+    return topic_log
+
+
+def test_segments_roll_over_once_they_reach_segment_bytes(tmp_path):
+    record_bytes = RECORD_HEADER.size + len(payload(0))
+    write_log(tmp_path, 100, segment_bytes=10 * record_bytes)
+
+    assert segment_base_offsets(tmp_path) == list(range(0, 100, 10))
+    assert list(Log(tmp_path).read()) == [(offset, payload(offset)) for offset in range(100)]
+
+
+def test_reading_from_an_offset_starts_from_the_closest_indexed_record(tmp_path):
+    record_bytes = RECORD_HEADER.size + len(payload(0))
+    write_log(tmp_path, 100, segment_bytes=50 * record_bytes, index_interval_bytes=8 * record_bytes)
+
+    topic_log = Log(tmp_path)
+    segment = topic_log.segments[topic_log.find_segment(73)]
+    # an entry every 8 records of the segment starting at 50 - the first one at 58
+    assert segment.base_offset == 50
+    assert segment.locate(73) == (66, 16 * record_bytes)
+    assert segment.locate(57) == (50, 0)
+    assert list(topic_log.read(73)) == [(offset, payload(offset)) for offset in range(73, 100)]
+
+
+def test_appending_to_a_reopened_log_continues_from_its_last_offset(tmp_path):
+    write_log(tmp_path, 10, index_interval_bytes=1)
+
+    with Log(tmp_path) as topic_log:
+        assert topic_log.append(b'next') == 10
+
+    assert list(Log(tmp_path).read(9)) == [(9, payload(9)), (10, b'next')]
+
+
+def test_a_torn_final_record_is_skipped_by_readers_and_discarded_by_the_next_writer(tmp_path):
+    write_log(tmp_path, 10, index_interval_bytes=1)
+    segment = Log(tmp_path).segments[-1]
+    log_size = segment.log_path.stat().st_size
+    index_size = segment.index_path.stat().st_size
+    # a writer crashed in the middle of a record, after writing part of an index entry
+    with segment.log_path.open('ab') as log_file:
+        log_file.write(RECORD_HEADER.pack(100, 0) + b'half')
+    with segment.index_path.open('ab') as index_file:
+        index_file.write(INDEX_ENTRY.pack(10, log_size)[:5])
+
+    assert list(Log(tmp_path).read(8)) == [(8, payload(8)), (9, payload(9))]
+
+    with Log(tmp_path) as topic_log:
+        assert topic_log.append(b'after the crash') == 10
+
+    assert segment.log_path.stat().st_size == log_size + RECORD_HEADER.size + len(b'after the crash')
+    assert segment.index_path.stat().st_size in (index_size, index_size + INDEX_ENTRY.size)
+    assert list(Log(tmp_path).read(8)) == [(8, payload(8)), (9, payload(9)), (10, b'after the crash')]
+
+
+def test_an_index_entry_past_the_end_of_the_log_is_discarded_by_the_next_writer(tmp_path):
+    write_log(tmp_path, 10, index_interval_bytes=1)
+    segment = Log(tmp_path).segments[-1]
+    # the index entry of a record was written, the record itself was lost
+    with segment.index_path.open('ab') as index_file:
+        index_file.write(INDEX_ENTRY.pack(10, segment.log_path.stat().st_size))
+
+    with Log(tmp_path) as topic_log:
+        assert topic_log.append(b'after the crash') == 10
+
+    assert list(Log(tmp_path).read(9)) == [(9, payload(9)), (10, b'after the crash')]
+
+
+def test_offset_for_time_finds_the_first_record_appended_at_or_after_a_time(tmp_path):
+    record_bytes = RECORD_HEADER.size + len(payload(0))
+    # two records per timestamp, the clock going backwards once
+    timestamps = [1000 + offset // 2 * 10 for offset in range(60)]
+    timestamps[41] = 900
+    write_log(tmp_path, 60, timestamps, segment_bytes=20 * record_bytes, index_interval_bytes=4 * record_bytes)
+
+    topic_log = Log(tmp_path)
+    assert len(topic_log.segments) == 3
+    assert topic_log.offset_for_time(0) == 0
+    assert topic_log.offset_for_time(1000) == 0
+    assert topic_log.offset_for_time(1005) == 2
+    # records at the same time across a segment boundary
+    assert topic_log.offset_for_time(1090) == 18
+    assert topic_log.offset_for_time(1100) == 20
+    assert topic_log.offset_for_time(1200) == 40
+    assert topic_log.offset_for_time(1290) == 58
+    assert topic_log.offset_for_time(5000) == 60
+
+
+def test_a_log_is_only_created_when_asked_to(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Log(tmp_path / 'typo', create=False)
+
+    assert not (tmp_path / 'typo').exists()
@@ -0,0 +1,63 @@
+import pytest
+
+from compactor import compact, json_field_key
+from log import RECORD_HEADER, Log
+from mmap_reader import MmapLogReader
+
+
+def payload(offset: int) -> bytes:
+    return f'{{"key": "{offset % 3}", "offset": "{offset:04d}"}}'.encode()
+
+
+def write_log(directory, first_offset: int, last_offset: int):
+    segment_bytes = 10 * (RECORD_HEADER.size + len(payload(0)))
+    with Log(directory, segment_bytes=segment_bytes, index_interval_bytes=64) as topic_log:
+        for offset in range(first_offset, last_offset):
+            topic_log.append(payload(offset))
+
+
+def read(reader: MmapLogReader, start_offset: int = 0) -> list[tuple[int, bytes]]:
+    return [(offset, bytes(record)) for offset, record in reader.read(start_offset)]
+
+
+def test_reads_the_same_records_as_the_log(tmp_path):
+    write_log(tmp_path, 0, 45)
+    reader = MmapLogReader(tmp_path)
+
+    assert read(reader) == list(Log(tmp_path).read())
+    assert read(reader, 23) == list(Log(tmp_path).read(23))
+    assert read(reader, 45) == []
+
+
+def test_records_are_slices_of_the_maps(tmp_path):
+    write_log(tmp_path, 0, 5)
+
+    records = [record for _, record in MmapLogReader(tmp_path).read()]
+
+    assert all(isinstance(record, memoryview) for record in records)
+    assert records[0].obj is records[-1].obj
+
+
+def test_records_appended_after_a_read_are_read_from_a_new_map(tmp_path):
+    write_log(tmp_path, 0, 5)
+    reader = MmapLogReader(tmp_path)
+    assert [offset for offset, _ in reader.read()] == [0, 1, 2, 3, 4]
+
+    write_log(tmp_path, 5, 25)
+
+    assert read(reader, 3) == list(Log(tmp_path).read(3))
+
+
+def test_compacted_segments_are_read_from_their_compacted_file(tmp_path):
+    write_log(tmp_path, 0, 25)
+    assert compact(tmp_path, json_field_key('key')) > 0
+
+    assert read(MmapLogReader(tmp_path)) == list(Log(tmp_path).read())
+    assert read(MmapLogReader(tmp_path), 18) == list(Log(tmp_path).read(18))
+
+
+def test_a_missing_log_is_not_created(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        MmapLogReader(tmp_path / 'typo')
+
+    assert not (tmp_path / 'typo').exists()
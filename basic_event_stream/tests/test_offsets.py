@@ -0,0 +1,58 @@
+import pytest
+
+from log import Log
+from offsets import GroupConsumer, load_committed_offset, offsets_path
+
+
+def write_topic(base_path, topic: str, records: int):
+    with Log(base_path / topic) as topic_log:
+        for offset in range(records):
+            topic_log.append(f'event {offset}'.encode())
+
+
+def test_a_group_resumes_from_its_committed_offset(tmp_path):
+    write_topic(tmp_path, 'topic', 10)
+
+    with GroupConsumer('topic', 'group', tmp_path, commit_interval_records=0) as consumer:
+        records = consumer.read()
+        assert [offset for offset, _ in zip(range(4), records)] == [0, 1, 2, 3]
+        records.close()
+
+    # the last record read was not consumed yet - it is read again (at least once)
+    assert load_committed_offset(offsets_path(tmp_path / 'topic', 'group')) == 3
+    with GroupConsumer('topic', 'group', tmp_path) as consumer:
+        assert [offset for offset, _ in consumer.read()] == list(range(3, 10))
+    # other groups consume the topic from the start
+    with GroupConsumer('topic', 'other group', tmp_path) as consumer:
+        assert [offset for offset, _ in consumer.read()] == list(range(10))
+
+
+def test_offsets_are_committed_every_commit_interval_records(tmp_path):
+    write_topic(tmp_path, 'topic', 10)
+    path = offsets_path(tmp_path / 'topic', 'group')
+
+    consumer = GroupConsumer('topic', 'group', tmp_path, commit_interval_records=3)
+    committed_offsets = [load_committed_offset(path) for _ in consumer.read()]
+
+    # a record counts as consumed once the next one is read
+    assert committed_offsets == [0, 0, 0, 3, 3, 3, 6, 6, 6, 9]
+    consumer.close()
+    assert load_committed_offset(path) == 10
+
+
+def test_a_seek_is_committed(tmp_path):
+    write_topic(tmp_path, 'topic', 10)
+
+    with GroupConsumer('topic', 'group', tmp_path) as consumer:
+        consumer.seek(7)
+
+    with GroupConsumer('topic', 'group', tmp_path) as consumer:
+        assert [offset for offset, _ in consumer.read()] == [7, 8, 9]
+
+
+def test_a_single_consumer_of_a_group_consumes_a_topic_at_a_time(tmp_path):
+    write_topic(tmp_path, 'topic', 1)
+
+    with GroupConsumer('topic', 'group', tmp_path):
+        with pytest.raises(RuntimeError):
+            GroupConsumer('topic', 'group', tmp_path)
@@ -0,0 +1,101 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from log import Log
+from offsets import GroupConsumer
+from partitions import (PartitionedPublisher, consume_partitions, create_partitioned_topic, partition_count, partition_for_key,
+                        partition_name)
+
+# where record_consumed writes the records - the handler runs in the processes of the pool (forked)
+consumed_records_path: Path | None = None
+
+
+def record_consumed(partition: int, offset: int, record: bytes):
+    with (consumed_records_path / partition_name(partition)).open('a') as consumed_records:
+        consumed_records.write(f'{offset} {record.decode()}\n')
+
+
+def consumed(partition: int) -> list[tuple[int, str]]:
+    path = consumed_records_path / partition_name(partition)
+    if not path.exists():
+        return []
+    return [(int(offset), record) for offset, record in (line.split(' ', 1) for line in path.read_text().splitlines())]
+
+
+@pytest.fixture
+def consumed_records(tmp_path, monkeypatch) -> Path:
+    path = tmp_path / 'consumed'
+    path.mkdir()
+    monkeypatch.setattr(sys.modules[__name__], 'consumed_records_path', path)
+    return path
+
+
+def publish(data_store_base_path: Path, events: list[tuple[str, str]], partitions: int = 3) -> dict[str, int]:
+    '''
+    :return: the partition of each key
+    '''
+    key_partitions = {}
+    with PartitionedPublisher('topic', partitions, data_store_base_path) as publisher:
+        futures = []
+        for key, event in events:
+            key_partitions[key], future = publisher.publish(key, event)
+            futures.append(future)
+        for future in futures:
+            future.result(timeout=5)
+    return key_partitions
+
+
+def test_the_partition_of_a_key_is_stable():
+    assert partition_for_key('order-1', 4) == partition_for_key(b'order-1', 4)
+    assert {partition_for_key(f'order-{order}', 4) for order in range(100)} == {0, 1, 2, 3}
+
+
+def test_a_partitioned_topic_keeps_its_partition_count(tmp_path):
+    topic_directory = create_partitioned_topic('topic', 3, tmp_path)
+
+    assert partition_count(topic_directory) == 3
+    assert create_partitioned_topic('topic', 3, tmp_path) == topic_directory
+    with pytest.raises(ValueError, match='already has 3 partitions'):
+        create_partitioned_topic('topic', 4, tmp_path)
+
+
+def test_the_events_of_a_key_are_published_to_its_partition_in_order(tmp_path):
+    events = [(f'order-{event % 5}', f'order-{event % 5} event-{event}') for event in range(30)]
+
+    key_partitions = publish(tmp_path, events)
+
+    for key, partition in key_partitions.items():
+        assert partition == partition_for_key(key, 3)
+        records = [record.decode() for _, record in Log(tmp_path / 'topic' / partition_name(partition)).read()]
+        assert [record for record in records if record.startswith(f'{key} ')] == [event for event_key, event in events if event_key == key]
+
+
+def test_partitions_are_consumed_in_order_from_their_committed_offsets(tmp_path, consumed_records):
+    events = [(f'order-{event % 5}', f'order-{event % 5} event-{event}') for event in range(30)]
+    key_partitions = publish(tmp_path, events)
+    partition_events = {partition: [event for key, event in events if key_partitions[key] == partition] for partition in range(3)}
+
+    counts = consume_partitions('topic', 'group', record_consumed, processes=2, data_store_base_path=tmp_path)
+
+    assert counts == {partition: len(partition_events[partition]) for partition in range(3)}
+    for partition in range(3):
+        assert consumed(partition) == list(enumerate(partition_events[partition]))
+
+    # each partition resumes from the offset committed by the group
+    publish(tmp_path, [('order-0', 'order-0 event-30')])
+    partition = key_partitions['order-0']
+    counts = consume_partitions('topic', 'group', record_consumed, data_store_base_path=tmp_path)
+
+    assert counts == {0: 0, 1: 0, 2: 0} | {partition: 1}
+    assert consumed(partition)[-1] == (len(partition_events[partition]), 'order-0 event-30')
+    with GroupConsumer(partition_name(partition), 'group', tmp_path / 'topic') as consumer:
+        assert consumer.committed_offset == len(partition_events[partition]) + 1
+
+
+def test_only_partitioned_topics_can_be_consumed_by_partition(tmp_path):
+    (tmp_path / 'topic').mkdir()
+
+    with pytest.raises(ValueError, match='not a partitioned topic'):
+        consume_partitions('topic', 'group', record_consumed, data_store_base_path=tmp_path)
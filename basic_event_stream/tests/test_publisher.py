@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+from batches import CODEC_ZLIB, read_block_records
+from log import Log
+from publisher import FSYNC_BATCH, FSYNC_INTERVAL, FSYNC_NONE, Publisher
+
+
+@pytest.fixture
+def fsyncs(monkeypatch) -> list[float]:
+    '''
+    :return: the time of each fsync of a log
+    '''
+    calls = []
+    log_fsync = Log.fsync
+
+    def fsync(self):
+        calls.append(time.monotonic())
+        log_fsync(self)
+
+    monkeypatch.setattr(Log, 'fsync', fsync)
+    return calls
+
+
+def test_events_published_by_threads_are_all_written_at_their_offsets(tmp_path):
+    with Publisher('topic', tmp_path) as publisher:
+        futures = {}
+
+        def publish(thread: int):
+            for event in range(50):
+                payload = f'{thread}-{event}'
+                futures[payload] = publisher.publish(payload)
+
+        threads = [threading.Thread(target=publish, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        offsets = {payload: future.result(timeout=5) for payload, future in futures.items()}
+
+    records = dict(Log(tmp_path / 'topic').read())
+    assert sorted(offsets.values()) == list(range(200))
+    assert all(records[offset] == payload.encode() for payload, offset in offsets.items())
+    # the events of a thread are written in the order it published them
+    for thread in range(4):
+        thread_offsets = [offsets[f'{thread}-{event}'] for event in range(50)]
+        assert thread_offsets == sorted(thread_offsets)
+
+
+def test_events_queued_while_lingering_are_written_in_one_batch(tmp_path):
+    # with compression, a batch is a single block - its events share the offset of the block
+    with Publisher('topic', tmp_path, linger_seconds=0.2, compression=CODEC_ZLIB) as publisher:
+        futures = [publisher.publish(f'event-{event}') for event in range(5)]
+        offsets = [future.result(timeout=5) for future in futures]
+
+    assert offsets == [0] * 5
+    assert list(read_block_records(tmp_path / 'topic')) == [(0, f'event-{event}'.encode()) for event in range(5)]
+
+
+def test_batches_are_cut_at_batch_bytes(tmp_path):
+    with Publisher('topic', tmp_path, batch_bytes=len('event-0') * 2, linger_seconds=0.2, compression=CODEC_ZLIB) as publisher:
+        futures = [publisher.publish(f'event-{event}') for event in range(6)]
+        offsets = [future.result(timeout=5) for future in futures]
+
+    assert offsets == [0, 0, 1, 1, 2, 2]
+    assert [record for _, record in read_block_records(tmp_path / 'topic', 1)] == [f'event-{event}'.encode() for event in range(2, 6)]
+
+
+def test_each_batch_is_fsynced_before_its_events_are_resolved(tmp_path, fsyncs):
+    with Publisher('topic', tmp_path, fsync=FSYNC_BATCH) as publisher:
+        for event in range(3):
+            publisher.publish(f'event-{event}').result(timeout=5)
+            assert len(fsyncs) == event + 1
+
+
+def test_nothing_is_fsynced_without_fsync(tmp_path, fsyncs):
+    with Publisher('topic', tmp_path, fsync=FSYNC_NONE) as publisher:
+        for event in range(3):
+            publisher.publish(f'event-{event}').result(timeout=5)
+
+    assert fsyncs == []
+    assert [record for _, record in Log(tmp_path / 'topic').read()] == [b'event-0', b'event-1', b'event-2']
+
+
+def test_events_are_fsynced_every_interval(tmp_path, fsyncs):
+    with Publisher('topic', tmp_path, fsync=FSYNC_INTERVAL, fsync_interval_seconds=0.1) as publisher:
+        start = time.monotonic()
+        publisher.publish('event-0').result(timeout=5)
+        publisher.publish('event-1').result(timeout=5)
+        assert fsyncs == []
+
+        # fsynced once the interval passed, although nothing else is published
+        time.sleep(0.3)
+        assert len(fsyncs) == 1
+        assert fsyncs[0] - start >= 0.1
+
+    # and on closing
+    assert len(fsyncs) == 2
+
+
+@pytest.mark.parametrize('options', [{'fsync': 'always'}, {'compression': 'rot13'}])
+def test_unknown_options_are_rejected(tmp_path, options):
+    with pytest.raises(ValueError):
+        Publisher('topic', tmp_path, **options)
+
+
+def test_events_can_not_be_published_once_closed(tmp_path):
+    publisher = Publisher('topic', tmp_path)
+    future = publisher.publish('event')
+    publisher.close()
+
+    assert future.result(timeout=5) == 0
+    with pytest.raises(RuntimeError, match='closed'):
+        publisher.publish('another event')
+
+
+def test_a_failed_write_fails_the_events_and_the_publisher(tmp_path, monkeypatch):
+    def append(self, payload, timestamp=None):
+        raise OSError('no space left on device')
+
+    monkeypatch.setattr(Log, 'append', append)
+    publisher = Publisher('topic', tmp_path)
+
+    future = publisher.publish('event')
+    with pytest.raises(OSError, match='no space left'):
+        future.result(timeout=5)
+    with pytest.raises(RuntimeError, match='failed'):
+        publisher.publish('another event')
+    publisher.close()
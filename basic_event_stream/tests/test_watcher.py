@@ -0,0 +1,78 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from log import RECORD_HEADER, Log
+from mmap_reader import MmapLogReader
+from watcher import InotifyWatcher, PollingWatcher, watch_directory
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+
+
+@linux_only
+def test_inotify_wait_ends_when_a_file_is_written(tmp_path):
+    watcher = InotifyWatcher(tmp_path)
+    try:
+        started = time.monotonic()
+        watcher.wait(0.05)
+        assert time.monotonic() - started >= 0.04
+
+        # written before waiting - not missed
+        (tmp_path / 'file').write_bytes(b'x')
+        started = time.monotonic()
+        watcher.wait(5)
+        assert time.monotonic() - started < 1
+    finally:
+        watcher.close()
+
+
+def test_polling_interval_doubles_until_reset():
+    watcher = PollingWatcher(min_interval_seconds=0.001, max_interval_seconds=0.004)
+
+    intervals = []
+    for _ in range(4):
+        intervals.append(watcher.interval_seconds)
+        watcher.wait()
+    assert intervals == [0.001, 0.002, 0.004, 0.004]
+
+    watcher.reset()
+    assert watcher.interval_seconds == 0.001
+
+
+def test_polling_is_used_without_inotify(tmp_path):
+    assert isinstance(watch_directory(tmp_path, use_inotify=False), PollingWatcher)
+
+
+@pytest.mark.parametrize('use_inotify', [pytest.param(True, marks=linux_only), False])
+def test_following_a_log_reads_the_records_appended_across_segments(tmp_path, use_inotify):
+    payloads = [f'event {offset:02d}'.encode() for offset in range(30)]
+    segment_bytes = 10 * (RECORD_HEADER.size + len(payloads[0]))
+    topic_log = Log(tmp_path, segment_bytes=segment_bytes)
+    topic_log.append(payloads[0])
+    topic_log.flush()
+
+    idle_calls = []
+    reader = MmapLogReader(tmp_path, on_idle=lambda: idle_calls.append(1), use_inotify=use_inotify)
+    records = []
+
+    def follow():
+        for offset, record in reader.read(follow=True):
+            records.append((offset, bytes(record)))
+            if len(records) == len(payloads):
+                return
+
+    follower = threading.Thread(target=follow, daemon=True)
+    follower.start()
+    for payload in payloads[1:]:
+        time.sleep(0.002)
+        topic_log.append(payload)
+        topic_log.flush()
+    follower.join(10)
+    topic_log.close()
+
+    assert not follower.is_alive()
+    assert records == list(enumerate(payloads))
+    # the reader waited for the writer
+    assert idle_calls
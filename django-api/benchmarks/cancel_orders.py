@@ -0,0 +1,170 @@
+"""
+Compares cancelling a backlog of elapsed pending orders one order at a time (Order.revert) with the
+set-based, chunked cancellation of store_async_jobs.jobs.
+
+Usage (from the django-api directory, with the docker-compose DB running):
+    PYTHONPATH=. DB_HOST=localhost python benchmarks/cancel_orders.py --orders 100000
+"""
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+BENCHMARK_USERNAME = "cancel-orders-benchmark"
+VARIANTS = ["default", "red", "blue"]
+LINE_ITEMS_PER_ORDER = 3
+
+
+def seed(orders: int, products: int):
+    from django.db import connection, transaction
+
+    from store_api.models import User
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        user, _ = User.objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={"email": "benchmark@test.com"}
+        )
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE benchmark_product ON COMMIT DROP AS
+            SELECT gen_random_uuid() AS id, i FROM generate_series(0, %(products)s - 1) i
+            """,
+            {"products": products},
+        )
+        cursor.execute(
+            """
+            INSERT INTO store_api_product
+                (id, created, updated, title, description, price, state, owner_user_id)
+            SELECT id, now(), now(), 'product ' || i, 'description', 100, 'AVAILABLE', %(user)s
+            FROM benchmark_product
+            """,
+            {"user": user.id},
+        )
+        cursor.execute(
+            """
+            INSERT INTO store_api_productstock (product_id, variant, available)
+            SELECT p.id, v, 0 FROM benchmark_product p, unnest(%(variants)s::text[]) v
+            """,
+            {"variants": VARIANTS},
+        )
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE benchmark_order ON COMMIT DROP AS
+            SELECT gen_random_uuid() AS id, i FROM generate_series(1, %(orders)s) i
+            """,
+            {"orders": orders},
+        )
+        cursor.execute(
+            """
+            INSERT INTO store_api_order (id, created, updated, state, customer_id)
+            SELECT id, now() - interval '1 hour', now(), 'PENDING', %(user)s
+            FROM benchmark_order
+            """,
+            {"user": user.id},
+        )
+        # each order has distinct products, spread over the catalog
+        cursor.execute(
+            """
+            INSERT INTO store_api_orderlineitem (order_id, product_id, variant, quantity)
+            SELECT o.id, p.id, (%(variants)s::text[])[1 + (o.i %% cardinality(%(variants)s::text[]))], 1
+            FROM benchmark_order o, generate_series(0, %(items)s - 1) item
+            JOIN benchmark_product p ON true
+            WHERE p.i = (o.i * %(items)s + item) %% %(products)s
+            """,
+            {"variants": VARIANTS, "items": LINE_ITEMS_PER_ORDER, "products": products},
+        )
+        cursor.execute(
+            "ANALYZE store_api_order, store_api_orderlineitem, store_api_productstock"
+        )
+
+
+def cleanup():
+    from django.db import connection, transaction
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in [
+            """
+            DELETE FROM store_api_orderlineitem WHERE order_id IN (
+                SELECT o.id FROM store_api_order o
+                JOIN store_api_user u ON u.id = o.customer_id WHERE u.username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_order WHERE customer_id IN (
+                SELECT id FROM store_api_user WHERE username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_productstock WHERE product_id IN (
+                SELECT p.id FROM store_api_product p
+                JOIN store_api_user u ON u.id = p.owner_user_id WHERE u.username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_product WHERE owner_user_id IN (
+                SELECT id FROM store_api_user WHERE username = %(username)s
+            )
+            """,
+            "DELETE FROM store_api_user WHERE username = %(username)s",
+        ]:
+            cursor.execute(sql, {"username": BENCHMARK_USERNAME})
+
+
+def cancel_one_by_one(confirmation_max_duration_seconds: int):
+    # the cancellation as it was before store_async_jobs.jobs reverted orders in bulk
+    from django.db import transaction
+
+    from store_api.models import Order
+
+    threshold = datetime.now(timezone.utc) - timedelta(
+        seconds=confirmation_max_duration_seconds
+    )
+    with transaction.atomic():
+        for order in (
+            Order.objects.prefetch_related("orderlineitem_set")
+            .filter(state=Order.States.PENDING, created__lte=threshold)
+            .select_for_update()
+        ):
+            order.revert()
+            order.save()
+
+
+def run(args):
+    from store_async_jobs.jobs import cancel_elapsed_unconfirmed_orders
+
+    strategies = {
+        "one by one": cancel_one_by_one,
+        f"bulk (chunks of {args.chunk_size})": lambda seconds: cancel_elapsed_unconfirmed_orders(
+            seconds, chunk_size=args.chunk_size
+        ),
+    }
+    for name, cancel in strategies.items():
+        seed(args.orders, args.products)
+        try:
+            start = time.perf_counter()
+            cancel(30)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<25} {elapsed:8.2f}s {args.orders / elapsed:10.0f} orders/s")
+        finally:
+            cleanup()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        prog="cancel orders benchmark",
+        description="Seeds elapsed pending orders and compares how long it takes to cancel them",
+    )
+    argparser.add_argument("--orders", type=int, default=100_000)
+    argparser.add_argument("--products", type=int, default=1000)
+    argparser.add_argument("--chunk-size", type=int, default=1000)
+    args = argparser.parse_args()
+    logging.root.setLevel(logging.WARN)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_api.settings")
+    import django
+
+    django.setup()
+
+    run(args)
@@ -0,0 +1,94 @@
+"""
+Microbenchmark of decoding debezium change events of orders (recorded from the debezium redis sink,
+see benchmarks/data), in events per second of CPU time of a single core:
+- full: the whole envelope parsed with the standard library json (how events were decoded before
+  DebeziumEventDecoder)
+- DebeziumEventDecoder, with the standard library json and with orjson (if installed), decoding
+  all fields and only the fields that the order consumer uses
+
+Usage (from the django-api directory):
+    PYTHONPATH=. python benchmarks/debezium_decoding.py
+"""
+
+import argparse
+import json
+import os
+import time
+
+from store_async_jobs.consumer import (
+    DebeziumEventDecoder,
+    DebeziumRedisEvent,
+    RedisStreamEvent,
+)
+from store_async_jobs.order_events_consumer import OrderEventConsumer
+
+RECORDED_EVENTS_PATH = os.path.join(
+    os.path.dirname(__file__), "data", "debezium_order_events.jsonl"
+)
+STREAM_NAME = "store.public.store_api_order"
+
+
+def load_recorded_events() -> list[RedisStreamEvent]:
+    with open(RECORDED_EVENTS_PATH) as f:
+        return [
+            RedisStreamEvent(f"{i}-0", {recorded["key"]: recorded["value"]})
+            for i, recorded in enumerate(map(json.loads, f))
+        ]
+
+
+def decode_full_envelope(event: RedisStreamEvent) -> DebeziumRedisEvent:
+    json_data = json.loads(next(iter(event.payload.values())))
+    return DebeziumRedisEvent(
+        id=event.id,
+        before=json_data["payload"]["before"],
+        after=json_data["payload"]["after"],
+    )
+
+
+def measure(decode, events: list[RedisStreamEvent], repetitions: int) -> float:
+    start = time.process_time()
+    for _ in range(repetitions):
+        for event in events:
+            decode(event)
+    return repetitions * len(events) / (time.process_time() - start)
+
+
+def run(args):
+    events = load_recorded_events()
+    decoders = {"full (json)": decode_full_envelope}
+
+    loads_by_library = {"json": json.loads}
+    try:
+        import orjson
+
+        loads_by_library["orjson"] = orjson.loads
+    except ImportError:
+        print("orjson is not installed - skipping it")
+
+    for library, loads in loads_by_library.items():
+        for fields_name, fields in [
+            ("all fields", None),
+            ("order fields", OrderEventConsumer.event_fields),
+        ]:
+            decoder = DebeziumEventDecoder(fields, loads=loads)
+            decoders[f"decoder ({library}, {fields_name})"] = (
+                lambda event, decoder=decoder: decoder.decode(STREAM_NAME, event)
+            )
+
+    baseline = None
+    for name, decode in decoders.items():
+        events_per_second = measure(decode, events, args.repetitions)
+        baseline = baseline or events_per_second
+        print(
+            f"{name:<35} {events_per_second:10.0f} events/s/core ({events_per_second / baseline:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        prog="debezium decoding benchmark",
+        description="Measures decoding throughput of recorded debezium change events",
+    )
+    argparser.add_argument("--repetitions", type=int, default=20_000)
+
+    run(argparser.parse_args())
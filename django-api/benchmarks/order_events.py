@@ -0,0 +1,259 @@
+"""
+Compares throughput of processing order confirmations from debezium change events of the orders
+table (OrderEventConsumer) against the transactional outbox (OrderOutboxRelay publishing to the
+stream consumed by OrderOutboxEventConsumer).
+
+Usage (from the django-api directory, with the docker-compose DB running):
+    PYTHONPATH=. DB_HOST=localhost python benchmarks/order_events.py --orders 20000
+Without --redis-host, fakeredis is used as a stand-in for redis (it has to be installed).
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import redis
+
+BENCHMARK_USERNAME = "order-events-benchmark"
+CDC_STREAM = "benchmark.public.store_api_order"
+OUTBOX_STREAM = "benchmark.order_events"
+CONSUMER_GROUP_NAME = "benchmark_consumer_group"
+
+ORDER_FIELDS_SCHEMA = [
+    {"type": "string", "optional": False, "name": "io.debezium.data.Uuid", "version": 1, "field": "id"},
+    {"type": "string", "optional": False, "name": "io.debezium.time.ZonedTimestamp", "version": 1, "field": "created"},
+    {"type": "string", "optional": False, "name": "io.debezium.time.ZonedTimestamp", "version": 1, "field": "updated"},
+    {"type": "string", "optional": True, "name": "io.debezium.time.ZonedTimestamp", "version": 1, "field": "deleted"},
+    {"type": "string", "optional": False, "field": "state"},
+    {"type": "string", "optional": False, "name": "io.debezium.data.Uuid", "version": 1, "field": "customer_id"},
+]  # fmt: skip
+SOURCE_SCHEMA = [
+    {"type": "string", "optional": False, "field": field}
+    for field in ["version", "connector", "name", "db", "schema", "table"]
+] + [
+    {"type": "int64", "optional": False, "field": field}
+    for field in ["ts_ms", "txId", "lsn"]
+]
+
+
+def debezium_order_change(
+    order_id: str, customer_id: str, before_state: str, after_state: str
+):
+    """
+    Key and value of the debezium change event of an order update, as stored in redis by debezium
+    server (with schemas, REPLICA IDENTITY FULL)
+    """
+    row = {
+        "id": order_id,
+        "created": "2025-02-22T09:57:48.517360Z",
+        "updated": "2025-02-22T09:57:48.517831Z",
+        "deleted": None,
+        "customer_id": customer_id,
+    }
+    key = {
+        "schema": {
+            "type": "struct",
+            "fields": [ORDER_FIELDS_SCHEMA[0]],
+            "optional": False,
+            "name": "store.public.store_api_order.Key",
+        },
+        "payload": {"id": order_id},
+    }
+    value = {
+        "schema": {
+            "type": "struct",
+            "fields": [
+                {"type": "struct", "fields": ORDER_FIELDS_SCHEMA, "optional": True, "name": "store.public.store_api_order.Value", "field": "before"},
+                {"type": "struct", "fields": ORDER_FIELDS_SCHEMA, "optional": True, "name": "store.public.store_api_order.Value", "field": "after"},
+                {"type": "struct", "fields": SOURCE_SCHEMA, "optional": False, "name": "io.debezium.connector.postgresql.Source", "field": "source"},
+                {"type": "string", "optional": False, "field": "op"},
+                {"type": "int64", "optional": True, "field": "ts_ms"},
+            ],
+            "optional": False,
+            "name": "store.public.store_api_order.Envelope",
+            "version": 2,
+        },
+        "payload": {
+            "before": {**row, "state": before_state},
+            "after": {**row, "state": after_state},
+            "source": {
+                "version": "3.0.7.Final",
+                "connector": "postgresql",
+                "name": "store",
+                "db": "store",
+                "schema": "public",
+                "table": "store_api_order",
+                "ts_ms": 1740218268517,
+                "txId": 1234,
+                "lsn": 56789012,
+            },
+            "op": "u",
+            "ts_ms": 1740218269017,
+        },
+    }  # fmt: skip
+    return json.dumps(key), json.dumps(value)
+
+
+def redis_client_for(redis_host: str | None) -> redis.Redis:
+    if redis_host:
+        return redis.Redis(redis_host, decode_responses=True, protocol=3)
+
+    import fakeredis
+
+    return fakeredis.FakeRedis(decode_responses=True, protocol=3)
+
+
+def seed_confirmed_orders(orders: int) -> tuple[list[str], str]:
+    from django.db import connection, transaction
+
+    from store_api.models import User
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        user = User.objects.create(
+            username=BENCHMARK_USERNAME, email="benchmark@test.com"
+        )
+        cursor.execute(
+            """
+            INSERT INTO store_api_order (id, created, updated, state, customer_id)
+            SELECT gen_random_uuid(), now(), now(), 'CONFIRMED', %(user)s
+            FROM generate_series(1, %(orders)s)
+            RETURNING id
+            """,
+            {"user": user.id, "orders": orders},
+        )
+        return [str(order_id) for (order_id,) in cursor.fetchall()], str(user.id)
+
+
+def cleanup():
+    from django.db import connection, transaction
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in [
+            """
+            DELETE FROM store_api_orderoutboxevent WHERE order_id IN (
+                SELECT o.id FROM store_api_order o
+                JOIN store_api_user u ON u.id = o.customer_id WHERE u.username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_order WHERE customer_id IN (
+                SELECT id FROM store_api_user WHERE username = %(username)s
+            )
+            """,
+            "DELETE FROM store_api_user WHERE username = %(username)s",
+        ]:
+            cursor.execute(sql, {"username": BENCHMARK_USERNAME})
+
+
+def consume(consumer, redis_client: redis.Redis):
+    consumer.init()
+    while (
+        redis_client.xpending(consumer.stream_name, CONSUMER_GROUP_NAME)["pending"]
+        or redis_client.xinfo_groups(consumer.stream_name)[0]["lag"]
+    ):
+        consumer.process_events_in_batch()
+
+
+def measure_cdc(redis_client: redis.Redis, args) -> float:
+    from store_async_jobs.order_events_consumer import OrderEventConsumer
+
+    order_ids, customer_id = seed_confirmed_orders(args.orders)
+    try:
+        pipeline = redis_client.pipeline(transaction=False)
+        for order_id in order_ids:
+            key, value = debezium_order_change(
+                order_id, customer_id, "PENDING", "CONFIRMED"
+            )
+            pipeline.xadd(CDC_STREAM, {key: value})
+        pipeline.execute()
+
+        consumer = OrderEventConsumer(
+            redis_client,
+            CDC_STREAM,
+            CONSUMER_GROUP_NAME,
+            "benchmark-consumer",
+            consumer_group_start_id="0",
+            batch_size=args.batch_size,
+        )
+        start = time.perf_counter()
+        consume(consumer, redis_client)
+        return time.perf_counter() - start
+    finally:
+        redis_client.delete(CDC_STREAM)
+        cleanup()
+
+
+def measure_outbox(redis_client: redis.Redis, args) -> tuple[float, float]:
+    from store_api.models import OrderOutboxEvent
+    from store_async_jobs.order_events_consumer import OrderOutboxEventConsumer
+    from store_async_jobs.order_outbox_relay import OrderOutboxRelay
+
+    order_ids, _ = seed_confirmed_orders(args.orders)
+    try:
+        # as written by Order.confirm
+        OrderOutboxEvent.objects.bulk_create(
+            [
+                OrderOutboxEvent(
+                    order_id=order_id, from_state="PENDING", to_state="CONFIRMED"
+                )
+                for order_id in order_ids
+            ]
+        )
+
+        relay = OrderOutboxRelay(
+            redis_client, stream_name=OUTBOX_STREAM, batch_size=args.batch_size
+        )
+        start = time.perf_counter()
+        while relay.relay_events():
+            pass
+        relay_elapsed = time.perf_counter() - start
+
+        consumer = OrderOutboxEventConsumer(
+            redis_client,
+            OUTBOX_STREAM,
+            CONSUMER_GROUP_NAME,
+            "benchmark-consumer",
+            consumer_group_start_id="0",
+            batch_size=args.batch_size,
+        )
+        start = time.perf_counter()
+        consume(consumer, redis_client)
+        return relay_elapsed, time.perf_counter() - start
+    finally:
+        redis_client.delete(OUTBOX_STREAM)
+        cleanup()
+
+
+def run(args):
+    redis_client = redis_client_for(args.redis_host)
+
+    cdc_elapsed = measure_cdc(redis_client, args)
+    print(f"{'debezium consumer':<30} {args.orders / cdc_elapsed:10.0f} events/s")
+
+    relay_elapsed, consumer_elapsed = measure_outbox(redis_client, args)
+    print(f"{'outbox consumer':<30} {args.orders / consumer_elapsed:10.0f} events/s")
+    print(f"{'outbox relay':<30} {args.orders / relay_elapsed:10.0f} events/s")
+    print(
+        f"{'outbox relay + consumer':<30} {args.orders / (relay_elapsed + consumer_elapsed):10.0f} events/s"
+    )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        prog="order events benchmark",
+        description="Compares processing order events from debezium change events and from the outbox",
+    )
+    argparser.add_argument("--redis-host", default=None)
+    argparser.add_argument("--orders", type=int, default=20_000)
+    argparser.add_argument("--batch-size", type=int, default=100)
+    args = argparser.parse_args()
+    logging.root.setLevel(logging.WARN)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_api.settings")
+    import django
+
+    django.setup()
+
+    run(args)
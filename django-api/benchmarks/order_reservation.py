@@ -0,0 +1,258 @@
+"""
+Compares stock reservation strategies for order creation under contention: many parallel buyers
+ordering a few units of a small set of hot product variants.
+
+- "select for update": locks the stock rows, subtracts in python and saves them with bulk_update
+  (how orders were created before store_api.reservations)
+- "guarded update": store_api.reservations.reserve_stock
+
+Checks that no stock is oversold, and reports throughput and latency percentiles.
+
+Usage (from the django-api directory, with the docker-compose DB running):
+    PYTHONPATH=. DB_HOST=localhost python benchmarks/order_reservation.py --buyers 32
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+from functools import reduce
+
+BENCHMARK_USERNAME = "order-reservation-benchmark"
+VARIANTS = ["s", "m", "l"]
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def seed(hot_products: int, stock: int):
+    from django.db import transaction
+
+    from store_api.models import Product, ProductStock, User
+
+    with transaction.atomic():
+        user = User.objects.create(
+            username=BENCHMARK_USERNAME, email="benchmark@test.com"
+        )
+        products = [
+            Product.objects.create(
+                title=f"hot product {i}",
+                description="hot",
+                price=100,
+                state=Product.STATE_AVAILABLE,
+                owner_user=user,
+            )
+            for i in range(hot_products)
+        ]
+        ProductStock.objects.bulk_create(
+            [
+                ProductStock(product=product, variant=variant, available=stock)
+                for product in products
+                for variant in VARIANTS
+            ]
+        )
+
+    return user, [(product.id, variant) for product in products for variant in VARIANTS]
+
+
+def cleanup():
+    from django.db import connection, transaction
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in [
+            """
+            DELETE FROM store_api_orderlineitem WHERE order_id IN (
+                SELECT o.id FROM store_api_order o
+                JOIN store_api_user u ON u.id = o.customer_id WHERE u.username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_order WHERE customer_id IN (
+                SELECT id FROM store_api_user WHERE username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_productstock WHERE product_id IN (
+                SELECT p.id FROM store_api_product p
+                JOIN store_api_user u ON u.id = p.owner_user_id WHERE u.username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_product WHERE owner_user_id IN (
+                SELECT id FROM store_api_user WHERE username = %(username)s
+            )
+            """,
+            "DELETE FROM store_api_user WHERE username = %(username)s",
+        ]:
+            cursor.execute(sql, {"username": BENCHMARK_USERNAME})
+
+
+def reserve_with_select_for_update(requested_quantities: dict):
+    from django.db.models import Q
+
+    from store_api.models import ProductStock
+
+    lookup = reduce(
+        lambda acc, q: acc | q,
+        [
+            Q(product_id=product_id) & Q(variant=variant)
+            for product_id, variant in requested_quantities
+        ],
+    )
+    stock = list(
+        ProductStock.objects.filter(product__deleted__isnull=True)
+        .select_for_update()
+        .prefetch_related("product")
+        .filter(lookup)
+    )
+    for product_stock in stock:
+        product_stock.available -= requested_quantities[
+            (product_stock.product.id, product_stock.variant)
+        ]
+        if product_stock.available < 0:
+            raise OutOfStock()
+    ProductStock.objects.bulk_update(stock, fields=["available"])
+
+
+def reserve_with_guarded_update(requested_quantities: dict):
+    from store_api.reservations import InsufficientStock, reserve_stock
+
+    try:
+        reserve_stock(requested_quantities)
+    except InsufficientStock:
+        raise OutOfStock()
+
+
+def create_order(user, requested_quantities: dict, reserve) -> bool:
+    """
+    :return: whether the order was created
+    :raises DatabaseError: e.g. deadlocks
+    """
+    from django.db import transaction
+
+    from store_api.models import Order, OrderLineItem
+
+    try:
+        with transaction.atomic():
+            order = Order.objects.create(customer=user)
+            reserve(requested_quantities)
+            OrderLineItem.objects.bulk_create(
+                [
+                    OrderLineItem(
+                        order=order, product_id=product_id, variant=variant, quantity=q
+                    )
+                    for (product_id, variant), q in requested_quantities.items()
+                ]
+            )
+        return True
+    except OutOfStock:
+        return False
+
+
+def buyer(user, product_variants, reserve, args, results: list, start_barrier):
+    from django.db import DatabaseError, connection
+
+    rng = random.Random()
+    latencies = []
+    sold = 0
+    errors = 0
+    start_barrier.wait()
+    try:
+        for _ in range(args.orders_per_buyer):
+            requested = {
+                product_variant: rng.randint(1, 3)
+                for product_variant in rng.sample(
+                    product_variants, args.line_items_per_order
+                )
+            }
+            start = time.perf_counter()
+            try:
+                if create_order(user, requested, reserve):
+                    sold += sum(requested.values())
+            except DatabaseError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connection.close()
+    results.append((latencies, sold, errors))
+
+
+def run_strategy(name: str, reserve, args):
+    from django.db.models import Sum
+
+    from store_api.models import ProductStock
+
+    user, product_variants = seed(args.hot_products, args.stock)
+    try:
+        results = []
+        start_barrier = threading.Barrier(args.buyers + 1)
+        threads = [
+            threading.Thread(
+                target=buyer,
+                args=(user, product_variants, reserve, args, results, start_barrier),
+            )
+            for _ in range(args.buyers)
+        ]
+        for thread in threads:
+            thread.start()
+        start_barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = [
+            latency
+            for thread_latencies, _, _ in results
+            for latency in thread_latencies
+        ]
+        sold = sum(thread_sold for _, thread_sold, _ in results)
+        errors = sum(thread_errors for _, _, thread_errors in results)
+        available = ProductStock.objects.filter(product__owner_user=user).aggregate(
+            available=Sum("available")
+        )["available"]
+        initial = args.stock * len(product_variants)
+        assert (
+            sold + available == initial
+        ), f"{sold} sold + {available} available != {initial}"
+
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"{name:<20} {len(latencies) / elapsed:8.0f} orders/s "
+            f"p50={percentiles[49] * 1000:7.2f}ms p99={percentiles[98] * 1000:7.2f}ms "
+            f"sold={sold}/{initial} errors={errors}"
+        )
+    finally:
+        cleanup()
+
+
+def run(args):
+    run_strategy("select for update", reserve_with_select_for_update, args)
+    run_strategy("guarded update", reserve_with_guarded_update, args)
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        prog="order reservation benchmark",
+        description="Compares stock reservation strategies with parallel buyers of hot products",
+    )
+    argparser.add_argument("--buyers", type=int, default=32)
+    argparser.add_argument("--orders-per-buyer", type=int, default=200)
+    argparser.add_argument("--hot-products", type=int, default=5)
+    argparser.add_argument("--line-items-per-order", type=int, default=2)
+    argparser.add_argument(
+        "--stock", type=int, default=1_000_000, help="initial stock of each variant"
+    )
+    args = argparser.parse_args()
+    logging.root.setLevel(logging.WARN)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_api.settings")
+    import django
+
+    django.setup()
+
+    run(args)
@@ -0,0 +1,170 @@
+"""
+Compares latency of the product search backends (see store_api.search) on a seeded store.
+
+Usage (from the django-api directory, with the docker-compose DB running):
+    PYTHONPATH=. DB_HOST=localhost python benchmarks/product_search.py --products 1000000
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import time
+
+WORDS = [
+    "red", "blue", "green", "white", "black", "cotton", "linen", "wool", "leather",
+    "vintage", "modern", "classic", "premium", "budget", "organic", "handmade",
+    "shirt", "cap", "shoes", "lipstick", "noodles", "ramen", "coffee", "tea",
+    "mug", "lamp", "chair", "table", "desk", "phone", "case", "charger", "cable",
+    "book", "novel", "poster", "frame", "plant", "pot", "soap", "candle", "towel",
+]  # fmt: skip
+TAG_NAMES = [f"{word}-tag" for word in WORDS]
+BENCHMARK_USERNAME = "product-search-benchmark"
+SEED_BATCH_SIZE = 100_000
+
+
+def seed(products: int):
+    from django.db import connection, transaction
+
+    from store_api.models import Tag, User
+
+    owner, _ = User.objects.get_or_create(
+        username=BENCHMARK_USERNAME, defaults={"email": "benchmark@test.com"}
+    )
+    tags = [Tag.objects.create(name=name, description=name) for name in TAG_NAMES]
+    tag_ids = [str(tag.id) for tag in tags]
+
+    for batch_start in range(0, products, SEED_BATCH_SIZE):
+        batch_size = min(SEED_BATCH_SIZE, products - batch_start)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                """
+                CREATE TEMPORARY TABLE benchmark_batch ON COMMIT DROP AS
+                SELECT gen_random_uuid() AS id, i FROM generate_series(1, %(size)s) i
+                """,
+                {"size": batch_size},
+            )
+            cursor.execute(
+                """
+                INSERT INTO store_api_product
+                    (id, created, updated, title, description, price, state, owner_user_id)
+                SELECT
+                    b.id,
+                    now() - (%(start)s + b.i) * interval '1 second',
+                    now() - (%(start)s + b.i) * interval '1 second',
+                    w[1 + floor(random() * n)::int] || ' ' || w[1 + floor(random() * n)::int],
+                    w[1 + floor(random() * n)::int] || ' ' || w[1 + floor(random() * n)::int]
+                        || ' ' || w[1 + floor(random() * n)::int]
+                        || ' ' || w[1 + floor(random() * n)::int],
+                    1 + floor(random() * 10000)::int,
+                    'AVAILABLE',
+                    %(owner)s
+                FROM benchmark_batch b,
+                    (SELECT %(words)s::text[] AS w, cardinality(%(words)s::text[]) AS n) words
+                """,
+                {"start": batch_start, "words": WORDS, "owner": owner.id},
+            )
+            cursor.execute(
+                """
+                INSERT INTO store_api_product_tags (product_id, tag_id)
+                SELECT b.id, (%(tags)s::uuid[])[1 + (b.i %% cardinality(%(tags)s::uuid[]))]
+                FROM benchmark_batch b
+                """,
+                {"tags": tag_ids},
+            )
+        logging.info("seeded %s products", batch_start + batch_size)
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE store_api_product, store_api_product_tags")
+
+
+def cleanup():
+    from django.db import connection, transaction
+
+    from store_api.models import Tag, User
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            """
+            DELETE FROM store_api_product_tags WHERE product_id IN (
+                SELECT p.id FROM store_api_product p
+                JOIN store_api_user u ON u.id = p.owner_user_id
+                WHERE u.username = %(username)s
+            )
+            """,
+            {"username": BENCHMARK_USERNAME},
+        )
+        cursor.execute(
+            """
+            DELETE FROM store_api_product WHERE owner_user_id IN (
+                SELECT id FROM store_api_user WHERE username = %(username)s
+            )
+            """,
+            {"username": BENCHMARK_USERNAME},
+        )
+        Tag.objects.filter(name__in=TAG_NAMES).delete()
+        User.objects.filter(username=BENCHMARK_USERNAME).delete()
+
+
+def measure(backend, search_terms: list[str], repetitions: int, page_size: int):
+    from store_api.models import Product
+
+    queryset = Product.objects.filter(deleted__isnull=True).order_by("-updated")
+    latencies = []
+    for _ in range(repetitions):
+        for search_term in search_terms:
+            start = time.perf_counter()
+            list(backend.search(queryset, search_term)[:page_size])
+            latencies.append(time.perf_counter() - start)
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return percentiles[49], percentiles[98]
+
+
+def run(args):
+    from store_api.search import (
+        ContainsProductSearchBackend,
+        PostgresFullTextProductSearchBackend,
+    )
+
+    if not args.skip_seed:
+        seed(args.products)
+
+    try:
+        search_terms = ["noodles", "red", "vintage shirt", "lamp-tag", "handmade mug"]
+        for backend in [
+            ContainsProductSearchBackend(),
+            PostgresFullTextProductSearchBackend(),
+        ]:
+            p50, p99 = measure(backend, search_terms, args.repetitions, args.page_size)
+            print(
+                f"{type(backend).__name__:<40} p50={p50 * 1000:9.2f}ms p99={p99 * 1000:9.2f}ms"
+            )
+    finally:
+        if not args.keep_data:
+            cleanup()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        prog="product search benchmark",
+        description="Seeds products and compares latency of product search backends",
+    )
+    argparser.add_argument("--products", type=int, default=1_000_000)
+    argparser.add_argument("--repetitions", type=int, default=20)
+    argparser.add_argument("--page-size", type=int, default=20)
+    argparser.add_argument(
+        "--skip-seed", action="store_true", help="re-use data from a --keep-data run"
+    )
+    argparser.add_argument(
+        "--keep-data", action="store_true", help="do not delete the seeded data"
+    )
+    args = argparser.parse_args()
+    logging.root.setLevel(logging.INFO)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_api.settings")
+    import django
+
+    django.setup()
+
+    run(args)
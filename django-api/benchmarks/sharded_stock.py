@@ -0,0 +1,166 @@
+"""
+Measures order throughput for a single hot product variant as its stock is split across more
+shards (see ProductStock.shards). Every order reserves 1 unit of the variant, so without shards all
+orders serialize on the lock of a single row.
+
+Usage (from the django-api directory, with the docker-compose DB running):
+    PYTHONPATH=. DB_HOST=localhost python benchmarks/sharded_stock.py --buyers 32 --shards 0 2 4 8 16
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import threading
+import time
+
+BENCHMARK_USERNAME = "sharded-stock-benchmark"
+
+
+def seed(shards: int, stock: int):
+    from django.db import transaction
+
+    from store_api.models import Product, ProductStock, User
+
+    with transaction.atomic():
+        user = User.objects.create(
+            username=BENCHMARK_USERNAME, email="benchmark@test.com"
+        )
+        product = Product.objects.create(
+            title="hot product",
+            description="hot",
+            price=100,
+            state=Product.STATE_AVAILABLE,
+            owner_user=user,
+        )
+        ProductStock.objects.create(product=product, available=stock).set_shards(shards)
+
+    return user, product
+
+
+def cleanup():
+    from django.db import connection, transaction
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in [
+            """
+            DELETE FROM store_api_orderlineitem WHERE order_id IN (
+                SELECT o.id FROM store_api_order o
+                JOIN store_api_user u ON u.id = o.customer_id WHERE u.username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_order WHERE customer_id IN (
+                SELECT id FROM store_api_user WHERE username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_productstockshard WHERE stock_id IN (
+                SELECT s.id FROM store_api_productstock s
+                JOIN store_api_product p ON p.id = s.product_id
+                JOIN store_api_user u ON u.id = p.owner_user_id WHERE u.username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_productstock WHERE product_id IN (
+                SELECT p.id FROM store_api_product p
+                JOIN store_api_user u ON u.id = p.owner_user_id WHERE u.username = %(username)s
+            )
+            """,
+            """
+            DELETE FROM store_api_product WHERE owner_user_id IN (
+                SELECT id FROM store_api_user WHERE username = %(username)s
+            )
+            """,
+            "DELETE FROM store_api_user WHERE username = %(username)s",
+        ]:
+            cursor.execute(sql, {"username": BENCHMARK_USERNAME})
+
+
+def buyer(user, product, orders: int, results: list, start_barrier):
+    from django.db import connection, transaction
+
+    from store_api.models import Order, OrderLineItem, ProductStock
+    from store_api.reservations import reserve_stock
+
+    latencies = []
+    start_barrier.wait()
+    try:
+        for _ in range(orders):
+            start = time.perf_counter()
+            # what OrderViewSet.create does
+            with transaction.atomic():
+                order = Order.objects.create(customer=user)
+                reserve_stock({(product.id, ProductStock.VARIANT_DEFAULT): 1})
+                OrderLineItem.objects.create(
+                    order=order,
+                    product=product,
+                    variant=ProductStock.VARIANT_DEFAULT,
+                    quantity=1,
+                )
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connection.close()
+    results.append(latencies)
+
+
+def run_with_shards(shards: int, args):
+    from store_api.models import ProductStock
+
+    user, product = seed(shards, args.stock)
+    try:
+        results = []
+        start_barrier = threading.Barrier(args.buyers + 1)
+        threads = [
+            threading.Thread(
+                target=buyer,
+                args=(user, product, args.orders_per_buyer, results, start_barrier),
+            )
+            for _ in range(args.buyers)
+        ]
+        for thread in threads:
+            thread.start()
+        start_barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = [
+            latency for thread_latencies in results for latency in thread_latencies
+        ]
+        available = (
+            ProductStock.objects.with_total_available()
+            .get(product=product)
+            .total_available
+        )
+        assert available == args.stock - len(latencies), "stock was lost or oversold"
+
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(
+            f"shards={shards:<3} {len(latencies) / elapsed:8.0f} orders/s "
+            f"p50={percentiles[49] * 1000:7.2f}ms p99={percentiles[98] * 1000:7.2f}ms"
+        )
+    finally:
+        cleanup()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        prog="sharded stock benchmark",
+        description="Measures order throughput for a single hot product variant by number of stock shards",
+    )
+    argparser.add_argument("--buyers", type=int, default=32)
+    argparser.add_argument("--orders-per-buyer", type=int, default=100)
+    argparser.add_argument("--shards", type=int, nargs="+", default=[0, 2, 4, 8, 16])
+    argparser.add_argument("--stock", type=int, default=1_000_000)
+    args = argparser.parse_args()
+    logging.root.setLevel(logging.WARN)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_api.settings")
+    import django
+
+    django.setup()
+
+    for shards in args.shards:
+        run_with_shards(shards, args)
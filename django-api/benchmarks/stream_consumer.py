@@ -0,0 +1,93 @@
+"""
+Compares throughput of the redis stream consumer (store_async_jobs.consumer) processing events one
+by one against processing them in batches.
+
+Usage (from the django-api directory):
+    PYTHONPATH=. python benchmarks/stream_consumer.py --redis-host localhost
+Without --redis-host, fakeredis is used as a stand-in (it has to be installed) - which hides the
+network round trips, so it understates the difference.
+"""
+
+import argparse
+import time
+
+import redis
+
+from store_async_jobs.consumer import Consumer, RedisStreamEvent
+
+STREAM_NAME = "benchmark.stream_consumer"
+CONSUMER_GROUP_NAME = "benchmark_consumer_group"
+
+
+class NoopConsumer(Consumer):
+    def process_event(self, event: RedisStreamEvent) -> str:
+        return event.id
+
+
+def redis_client_for(redis_host: str | None) -> redis.Redis:
+    if redis_host:
+        return redis.Redis(redis_host, decode_responses=True, protocol=3)
+
+    import fakeredis
+
+    return fakeredis.FakeRedis(decode_responses=True, protocol=3)
+
+
+def publish(redis_client: redis.Redis, events: int):
+    redis_client.delete(STREAM_NAME)
+    pipeline = redis_client.pipeline(transaction=False)
+    for i in range(events):
+        pipeline.xadd(STREAM_NAME, {"key": f'{{"id": {i}, "state": "PENDING"}}'})
+    pipeline.execute()
+
+
+def measure(redis_client: redis.Redis, events: int, batch_size: int, batch_mode: bool):
+    publish(redis_client, events)
+    consumer = NoopConsumer(
+        redis_client,
+        STREAM_NAME,
+        CONSUMER_GROUP_NAME,
+        "benchmark-consumer",
+        consumer_group_start_id="0",
+        batch_size=batch_size,
+    )
+    consumer.init()
+
+    start = time.perf_counter()
+    while (
+        redis_client.xpending(STREAM_NAME, CONSUMER_GROUP_NAME)["pending"]
+        or redis_client.xinfo_groups(STREAM_NAME)[0]["lag"]
+    ):
+        if batch_mode:
+            consumer.process_events_in_batch()
+        else:
+            consumer.process_events()
+    elapsed = time.perf_counter() - start
+
+    redis_client.delete(STREAM_NAME)
+    return events / elapsed
+
+
+def run(args):
+    redis_client = redis_client_for(args.redis_host)
+    for batch_size in args.batch_sizes:
+        for batch_mode in (False, True):
+            events_per_second = measure(
+                redis_client, args.events, batch_size, batch_mode
+            )
+            mode = "batch" if batch_mode else "one by one"
+            print(
+                f"batch_size={batch_size:<5} {mode:<11} {events_per_second:10.0f} events/s"
+            )
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        prog="stream consumer benchmark",
+        description="Measures throughput of the redis stream consumer",
+    )
+    argparser.add_argument("--redis-host", default=None)
+    argparser.add_argument("--events", type=int, default=50_000)
+    argparser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 100, 500])
+
+    run(argparser.parse_args())
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "store_api",
     "oauth2_provider",
     "rest_framework",
@@ -128,6 +129,14 @@ OAUTH2_PROVIDER = {
 
 AUTH_USER_MODEL = "store_api.User"
 
+# one of the backends in store_api.search
+PRODUCT_SEARCH_BACKEND = "store_api.search.PostgresFullTextProductSearchBackend"
+
+# products read-through cache (see store_api.cache). disabled when there is no redis host
+PRODUCT_CACHE_REDIS_HOST = os.getenv("REDIS_HOST")
+# entries are invalidated by store_async_jobs.product_cache_consumer, the TTL only bounds memory
+PRODUCT_CACHE_TTL_SECONDS = int(os.getenv("PRODUCT_CACHE_TTL_SECONDS", 60 * 60))
+
 LOGIN_URL = "/admin/login/"
 
 
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+from functools import cache
+from typing import Callable, Iterable
+from uuid import UUID
+
+import redis
+from django.conf import settings
+from redis.exceptions import RedisError
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+# sets the value of a key only if the generation key still has the expected value.
+# prevents a read that started before an invalidation from caching what it read
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[2] then
+    return redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+end
+return nil
+"""
+
+
+class ProductCache:
+    """
+    Read-through cache of serialized products (as returned by the products API) and of product
+    list pages, in redis.
+
+    Entries are not expected to expire - they are invalidated by consuming the changes to products,
+    their stock and tags (see store_async_jobs.product_cache_consumer), so stale reads are bounded
+    by the lag of that consumer. The TTL only bounds memory usage.
+
+    Product entries are guarded by a generation counter per product. List pages are keyed by a
+    single generation counter for all lists, as any product change can affect any list page. List
+    pages are cached without the stock of their products (see store_api.views.ProductViewSet.list),
+    so stock changes only invalidate the products
+    """
+
+    KEY_PREFIX = "store:cache:product"
+    LIST_GENERATION_KEY = f"{KEY_PREFIX}:list:generation"
+
+    def __init__(self, redis_client: redis.Redis, ttl_seconds: int):
+        self.redis_client = redis_client
+        self.ttl_seconds = ttl_seconds
+        self.set_if_generation = redis_client.register_script(SET_IF_GENERATION_SCRIPT)
+
+    def get_product(
+        self, product_id: UUID, load: Callable[[], dict | None]
+    ) -> dict | None:
+        key = self._product_key(product_id)
+        generation_key = self._product_generation_key(product_id)
+
+        try:
+            cached, generation = self.redis_client.mget(key, generation_key)
+        except RedisError:
+            logger.warning(
+                "Failed to read product %s from cache", product_id, exc_info=True
+            )
+            return load()
+
+        if cached is not None:
+            return json.loads(cached)
+
+        data = load()
+        if data is not None:
+            try:
+                self.set_if_generation(
+                    keys=[key, generation_key],
+                    args=[self._dumps(data), generation or "0", self.ttl_seconds],
+                )
+            except RedisError:
+                logger.warning("Failed to cache product %s", product_id, exc_info=True)
+
+        return data
+
+    def get_list_page(self, query_params: dict, load: Callable[[], dict]) -> dict:
+        try:
+            generation = self.redis_client.get(self.LIST_GENERATION_KEY) or "0"
+            # a page cached for an old generation is never read again
+            key = self._list_page_key(generation, query_params)
+            cached = self.redis_client.get(key)
+        except RedisError:
+            logger.warning("Failed to read product list from cache", exc_info=True)
+            return load()
+
+        if cached is not None:
+            return json.loads(cached)
+
+        data = load()
+        try:
+            self.redis_client.set(key, self._dumps(data), ex=self.ttl_seconds)
+        except RedisError:
+            logger.warning("Failed to cache product list", exc_info=True)
+
+        return data
+
+    def invalidate_products(
+        self, product_ids: Iterable[UUID | str], lists: bool = True
+    ) -> None:
+        """
+        :param lists: whether the change can affect list pages as well
+        """
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for product_id in product_ids:
+            # the generation is changed before deleting, so reads that are in flight do not cache
+            # what they read
+            pipeline.incr(self._product_generation_key(product_id))
+            pipeline.expire(self._product_generation_key(product_id), self.ttl_seconds)
+            pipeline.delete(self._product_key(product_id))
+        if lists:
+            pipeline.incr(self.LIST_GENERATION_KEY)
+        pipeline.execute()
+
+    def _product_key(self, product_id: UUID | str) -> str:
+        return f"{self.KEY_PREFIX}:{product_id}"
+
+    def _product_generation_key(self, product_id: UUID | str) -> str:
+        return f"{self.KEY_PREFIX}:{product_id}:generation"
+
+    def _list_page_key(self, generation: str, query_params: dict) -> str:
+        params_digest = hashlib.sha1(
+            json.dumps(sorted(query_params.items())).encode("utf-8")
+        ).hexdigest()
+        return f"{self.KEY_PREFIX}:list:{generation}:{params_digest}"
+
+    @staticmethod
+    def _dumps(data) -> str:
+        return json.dumps(data, cls=JSONEncoder)
+
+
+class NoProductCache:
+    """
+    Used when caching is not configured - always loads
+    """
+
+    def get_product(
+        self, product_id: UUID, load: Callable[[], dict | None]
+    ) -> dict | None:
+        return load()
+
+    def get_list_page(self, query_params: dict, load: Callable[[], dict]) -> dict:
+        return load()
+
+    def invalidate_products(
+        self, product_ids: Iterable[UUID | str], lists: bool = True
+    ) -> None:
+        pass
+
+
+@cache
+def get_product_cache() -> ProductCache | NoProductCache:
+    if not settings.PRODUCT_CACHE_REDIS_HOST:
+        return NoProductCache()
+
+    return ProductCache(
+        redis.Redis(
+            settings.PRODUCT_CACHE_REDIS_HOST, decode_responses=True, protocol=3
+        ),
+        ttl_seconds=settings.PRODUCT_CACHE_TTL_SECONDS,
+    )
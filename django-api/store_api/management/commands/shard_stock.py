@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from store_api.models import ProductStock
+
+
+class Command(BaseCommand):
+    help = (
+        "Splits the stock of a (hot) product variant across a number of rows, so concurrent orders"
+        " reserve stock from different rows. 0 shards turns sharding off"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_id")
+        parser.add_argument("variant")
+        parser.add_argument("shards", type=int)
+
+    def handle(self, product_id, variant, shards, **options):
+        if shards < 0:
+            raise CommandError("shards must be 0 or more")
+
+        with transaction.atomic():
+            try:
+                stock = ProductStock.objects.get(product_id=product_id, variant=variant)
+            except ProductStock.DoesNotExist:
+                raise CommandError(
+                    f"product {product_id} does not have a {variant} variant"
+                )
+
+            stock.set_shards(shards)
+
+        self.stdout.write(
+            f"{variant} variant of product {product_id} has {shards} shards"
+        )
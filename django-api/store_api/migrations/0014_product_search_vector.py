@@ -0,0 +1,106 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# the search vector is maintained by the DB so that it is correct regardless of how products,
+# tags or the product <-> tag association are changed (ORM, bulk updates, admin, ...)
+# weights: title (A), description (B), tag names (C)
+CREATE_TRIGGERS_SQL = """
+CREATE FUNCTION store_api_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A')
+        || setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B')
+        || setweight(to_tsvector('simple', coalesce((
+            SELECT string_agg(t.name, ' ')
+            FROM store_api_product_tags pt
+            JOIN store_api_tag t ON t.id = pt.tag_id
+            WHERE pt.product_id = NEW.id
+        ), '')), 'C');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_api_product_search_vector
+    BEFORE INSERT OR UPDATE OF title, description, search_vector ON store_api_product
+    FOR EACH ROW EXECUTE FUNCTION store_api_product_search_vector_update();
+
+CREATE FUNCTION store_api_product_tags_inserted() RETURNS trigger AS $$
+BEGIN
+    UPDATE store_api_product SET search_vector = NULL
+    WHERE id IN (SELECT product_id FROM new_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_api_product_tags_inserted
+    AFTER INSERT ON store_api_product_tags
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION store_api_product_tags_inserted();
+
+CREATE FUNCTION store_api_product_tags_deleted() RETURNS trigger AS $$
+BEGIN
+    UPDATE store_api_product SET search_vector = NULL
+    WHERE id IN (SELECT product_id FROM old_rows);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_api_product_tags_deleted
+    AFTER DELETE ON store_api_product_tags
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION store_api_product_tags_deleted();
+
+CREATE FUNCTION store_api_tag_name_updated() RETURNS trigger AS $$
+BEGIN
+    UPDATE store_api_product SET search_vector = NULL
+    WHERE id IN (
+        SELECT product_id FROM store_api_product_tags WHERE tag_id = NEW.id
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_api_tag_name_updated
+    AFTER UPDATE OF name ON store_api_tag
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION store_api_tag_name_updated();
+
+-- backfill existing products
+UPDATE store_api_product SET search_vector = NULL;
+"""
+
+DROP_TRIGGERS_SQL = """
+DROP TRIGGER store_api_tag_name_updated ON store_api_tag;
+DROP FUNCTION store_api_tag_name_updated();
+DROP TRIGGER store_api_product_tags_deleted ON store_api_product_tags;
+DROP FUNCTION store_api_product_tags_deleted();
+DROP TRIGGER store_api_product_tags_inserted ON store_api_product_tags;
+DROP FUNCTION store_api_product_tags_inserted();
+DROP TRIGGER store_api_product_search_vector ON store_api_product;
+DROP FUNCTION store_api_product_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store_api", "0013_order_change_pk"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="store_api_product_search"
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS_SQL, DROP_TRIGGERS_SQL),
+    ]
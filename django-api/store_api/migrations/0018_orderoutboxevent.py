@@ -0,0 +1,61 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store_api", "0017_productstock_shards"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrderOutboxEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "from_state",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("CONFIRMED", "Confirmed"),
+                            ("PAID", "Paid"),
+                            ("SHIPPED", "Shipped"),
+                            ("CANCELLED", "Cancelled"),
+                            ("REVERTED", "Reverted"),
+                        ]
+                    ),
+                ),
+                (
+                    "to_state",
+                    models.CharField(
+                        choices=[
+                            ("PENDING", "Pending"),
+                            ("CONFIRMED", "Confirmed"),
+                            ("PAID", "Paid"),
+                            ("SHIPPED", "Shipped"),
+                            ("CANCELLED", "Cancelled"),
+                            ("REVERTED", "Reverted"),
+                        ]
+                    ),
+                ),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to="store_api.order",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -1,7 +1,10 @@
 import uuid
 
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django_fsm import FSMField, transition
 
@@ -30,6 +33,11 @@ class User(AbstractUser, BaseEntity):
 
 
 class Tag(BaseEntity):
+    class Meta:
+        indexes = [
+            models.Index(fields=["created", "id"], name="store_api_tag_keyset"),
+        ]
+
     name = models.CharField(max_length=50)
     description = models.CharField(max_length=200, null=False)
 
@@ -48,6 +56,10 @@ class Product(BaseEntity):
                 name="%(app_label)s_%(class)s_price_gt_zero",
             )
         ]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="store_api_product_search"),
+            models.Index(fields=["updated", "id"], name="store_api_product_keyset"),
+        ]
 
     STATE_DRAFT = "DRAFT"
     STATE_AVAILABLE = "AVAILABLE"
@@ -69,6 +81,8 @@ class Product(BaseEntity):
     state = FSMField(null=False, choices=STATES, default=STATE_DRAFT)
     owner_user = models.ForeignKey(User, on_delete=models.DO_NOTHING)
     tags = models.ManyToManyField(Tag)
+    # title, description and tag names - maintained by DB triggers (see migration 0014)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return f"<Product id={self.id} title={self.title} state={self.state}>"
@@ -86,6 +100,25 @@ class Product(BaseEntity):
         # TODO what would happen to a order (in each of its states) that has a product that is suddenly deleted
 
 
+class ProductStockQuerySet(models.QuerySet):
+    def with_total_available(self) -> "ProductStockQuerySet":
+        """
+        Annotates `total_available` - the availability of the variant, including all of its shards
+        """
+        return self.annotate(
+            total_available=models.F("available")
+            + Coalesce(
+                models.Subquery(
+                    ProductStockShard.objects.filter(stock_id=models.OuterRef("id"))
+                    .values("stock_id")
+                    .annotate(available=models.Sum("available"))
+                    .values("available")
+                ),
+                0,
+            )
+        )
+
+
 class ProductStock(models.Model):
     class Meta:
         constraints = [
@@ -107,15 +140,121 @@ class ProductStock(models.Model):
         Product, on_delete=models.DO_NOTHING, related_name="stock"
     )
     available = models.IntegerField(null=False)
+    # when > 0, the availability of the variant is (mostly) split across this number of
+    # ProductStockShard rows, so that concurrent orders reserve stock from different rows.
+    # the total availability is `available` + the availability of all shards
+    shards = models.PositiveSmallIntegerField(null=False, default=0)
+
+    objects = ProductStockQuerySet.as_manager()
 
     def __str__(self):
         return f"<ProductStock id={self.id} variant={self.variant} available={self.available}>"
 
+    def set_shards(self, shards: int):
+        """
+        Splits the total availability of the variant evenly across the given number of shards. 0
+        turns sharding off, moving all availability back to the variant row.
+        Must run in a transaction
+        """
+        stock = ProductStock.objects.select_for_update().get(id=self.id)
+        current_shards = list(stock.shard_set.select_for_update().order_by("shard"))
+        total = stock.available + sum(shard.available for shard in current_shards)
+
+        stock.shard_set.all().delete()
+        stock.shards = shards
+        if shards:
+            stock.available = 0
+            ProductStockShard.objects.bulk_create(
+                [
+                    ProductStockShard(stock=stock, shard=shard, available=available)
+                    for shard, available in enumerate(_split_evenly(total, shards))
+                ]
+            )
+        else:
+            stock.available = total
+        stock.save(update_fields=["available", "shards"])
+
+        self.available = stock.available
+        self.shards = stock.shards
+
+    def rebalance_shards(self) -> bool:
+        """
+        Redistributes the total availability of a sharded variant evenly across its shards, including
+        what was added to the variant row (e.g. by reverted orders).
+        Must run in a transaction
+
+        :return: whether the shards were rebalanced - they are not when already balanced or when the
+            variant is locked (i.e. being rebalanced/reserved from all shards)
+        """
+        stock = (
+            ProductStock.objects.select_for_update(skip_locked=True)
+            .filter(id=self.id, shards__gt=0)
+            .first()
+        )
+        if stock is None:
+            return False
+
+        shards = list(stock.shard_set.select_for_update().order_by("shard"))
+        shard_availability = [shard.available for shard in shards]
+        most, least = max(shard_availability), min(shard_availability)
+        if stock.available == 0 and (most - least <= 1 or least * 2 >= most):
+            return False
+
+        total = stock.available + sum(shard_availability)
+        for shard, available in zip(shards, _split_evenly(total, len(shards))):
+            shard.available = available
+        ProductStockShard.objects.bulk_update(shards, fields=["available"])
+        stock.available = 0
+        stock.save(update_fields=["available"])
+
+        return True
+
+
+class ProductStockShard(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["stock", "shard"],
+                name="%(app_label)s_%(class)s_unique_per_stock_and_shard",
+            ),
+            models.CheckConstraint(
+                condition=models.Q(available__gte=0),
+                name="%(app_label)s_%(class)s_available_gte_zero",
+            ),
+        ]
+
+    stock = models.ForeignKey(
+        ProductStock, on_delete=models.CASCADE, related_name="shard_set"
+    )
+    shard = models.PositiveSmallIntegerField(null=False)
+    available = models.IntegerField(null=False)
+
+    def __str__(self):
+        return f"<ProductStockShard id={self.id} shard={self.shard} available={self.available}>"
+
+
+def _split_evenly(total: int, parts: int) -> list[int]:
+    return [
+        total // parts + (1 if part < total % parts else 0) for part in range(parts)
+    ]
+
 
 class Order(BaseEntity):
 
     class Meta:
-        indexes = [models.Index(fields=["created"], name="store_api_order_created")]
+        indexes = [
+            models.Index(fields=["created"], name="store_api_order_created"),
+            models.Index(
+                fields=["customer", "created", "id"],
+                name="store_api_order_cust_keyset",
+            ),
+            # pending orders to be reverted (see store_async_jobs.jobs)
+            models.Index(
+                fields=["created"],
+                condition=models.Q(state="PENDING"),
+                name="store_api_order_pending",
+            ),
+        ]
 
     class States(models.TextChoices):
         PENDING = "PENDING", ("Pending")
@@ -134,6 +273,20 @@ class Order(BaseEntity):
         through_fields=("order", "product"),
     )
 
+    def save(self, **kwargs):
+        # the events of the transitions since the last save are stored in the same transaction as
+        # the new state (transactional outbox, see store_async_jobs.order_outbox_relay)
+        with transaction.atomic():
+            super().save(**kwargs)
+            OrderOutboxEvent.objects.bulk_create(
+                self.__dict__.pop("_outbox_events", [])
+            )
+
+    def _add_outbox_event(self, target_state: States):
+        self.__dict__.setdefault("_outbox_events", []).append(
+            OrderOutboxEvent(order=self, from_state=self.state, to_state=target_state)
+        )
+
     @transition(field=state, source=States.PENDING, target=States.REVERTED)
     def revert(self):
         """
@@ -144,6 +297,7 @@ class Order(BaseEntity):
                 ProductStock.objects.filter(
                     product=order_line_item.product, variant=order_line_item.variant
                 ).update(available=models.F("available") + order_line_item.quantity)
+        self._add_outbox_event(Order.States.REVERTED)
 
     @transition(field=state, source=States.PENDING, target=States.CONFIRMED)
     def confirm(self):
@@ -151,7 +305,7 @@ class Order(BaseEntity):
         Confirms order
         """
         # this is where additional payment, shipping, etc info would be saved
-        pass
+        self._add_outbox_event(Order.States.CONFIRMED)
 
     @transition(field=state, source=States.CONFIRMED, target=States.PAID)
     def process_payment(self):
@@ -159,7 +313,26 @@ class Order(BaseEntity):
         Confirms order
         """
         # this is where payment would be processed
-        pass
+        self._add_outbox_event(Order.States.PAID)
+
+
+class OrderOutboxEvent(models.Model):
+    """
+    Order state change, waiting to be published to the order events stream by the outbox relay.
+    Rows are deleted once published
+    """
+
+    order = models.ForeignKey(Order, on_delete=models.DO_NOTHING)
+    from_state = models.CharField(null=False, choices=Order.States)
+    to_state = models.CharField(null=False, choices=Order.States)
+    created = models.DateTimeField(null=False, default=timezone.now)
+
+    def to_stream_fields(self) -> dict[str, str]:
+        return {
+            "order_id": str(self.order_id),
+            "from_state": self.from_state,
+            "to_state": self.to_state,
+        }
 
 
 class OrderLineItem(models.Model):
@@ -0,0 +1,147 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from uuid import UUID
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+# annotation of ranked search results (see store_api.search)
+RANK_FIELD = "search_rank"
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Paging based on a composite (timestamp, id) keyset. The position in the results is given by an
+    opaque cursor that encodes the keyset of the last result of the previous page, so the cost of
+    fetching a page does not depend on how deep it is, and results that share the same timestamp
+    are neither skipped nor duplicated.
+    Whether there is a next page is determined by fetching one extra result - rather than counting.
+
+    Subclasses need to set `ordering` to the timestamp field, with a `-` prefix for descending order.
+    Search results annotated with `search_rank` (see store_api.search) are paged by the
+    (-search_rank, id) keyset instead - best match first
+    """
+
+    ordering: str = None
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view=None):
+        self.page_size = self.get_page_size(request)
+        ranked = RANK_FIELD in queryset.query.annotations
+        if ranked:
+            key_field, descending, id_descending = RANK_FIELD, True, False
+        else:
+            key_field = self.ordering.lstrip("-")
+            descending = id_descending = self.ordering.startswith("-")
+
+        queryset = queryset.order_by(
+            f"-{key_field}" if descending else key_field,
+            "-id" if id_descending else "id",
+        )
+
+        cursor = self.decode_cursor(request, ranked)
+        if cursor:
+            key, id = cursor
+            # the non strict comparison narrows the scan to the index range of the keyset
+            # and the disjunction resolves ties on the key
+            comparison = "lt" if descending else "gt"
+            id_comparison = "lt" if id_descending else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{key_field}__{comparison}e": key})
+                & (
+                    Q(**{f"{key_field}__{comparison}": key})
+                    | Q(**{f"id__{id_comparison}": id})
+                )
+            )
+
+        results = list(queryset[: self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        # the last page has no next page to point to
+        self.next_cursor = (
+            self.encode_cursor(getattr(results[-1], key_field), results[-1].id)
+            if self.has_next
+            else None
+        )
+
+        return results
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(
+            {
+                "metadata": {
+                    "page_size": self.page_size,
+                    "next_cursor": self.next_cursor,
+                    "has_next": self.has_next,
+                },
+                "data": data,
+            }
+        )
+
+    def get_page_size(self, request: Request) -> int:
+        page_size = request.query_params.get(self.page_size_query_param, None)
+        if page_size is None:
+            return self.page_size
+
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            return self.page_size
+
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(
+        self, request: Request, ranked: bool = False
+    ) -> tuple[datetime | float, UUID] | None:
+        encoded = request.query_params.get(self.cursor_query_param, None)
+        if not encoded:
+            return None
+
+        try:
+            key, id = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            # UUID only takes strings - other JSON values raise AttributeError
+            if not isinstance(id, str):
+                raise ValueError(f"invalid id {id}")
+            if ranked:
+                # a timestamp cursor (e.g. from before searching) is not a valid rank
+                if not isinstance(key, (int, float)) or isinstance(key, bool):
+                    raise ValueError(f"invalid rank {key}")
+                return float(key), UUID(id)
+            return datetime.fromisoformat(key), UUID(id)
+        except (binascii.Error, UnicodeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def encode_cursor(key: datetime | float, id: UUID) -> str:
+        # ranks are kept as JSON numbers, which round trip exactly
+        raw = json.dumps(
+            [key.isoformat() if isinstance(key, datetime) else key, str(id)],
+            separators=(",", ":"),
+        )
+        return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii")
+
+
+class ProductPagination(KeysetCursorPagination):
+    # newest first
+    ordering = "-updated"
+    page_size = 20
+
+
+class TagPagination(KeysetCursorPagination):
+    ordering = "created"
+    page_size = 50
+
+
+class OrderPagination(KeysetCursorPagination):
+    ordering = "created"
+    page_size = 20
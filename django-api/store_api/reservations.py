@@ -0,0 +1,190 @@
+from collections import defaultdict
+from uuid import UUID
+
+from django.db import connection, transaction
+
+from store_api.models import ProductStock, ProductStockShard
+
+# decrements the stock of all requested product variants in one statement, only where there is
+# enough available.
+# sharded variants (see ProductStock.shards) are reserved from a random shard, so concurrent orders
+# for the same variant are likely to update different rows.
+# to avoid deadlocks, rows are always locked in the same order - here, when reserving from all
+# shards and when rebalancing shards: stock rows first (by product and variant), then shards (by
+# stock and shard). locked_shards depends on locked, so that the shards are locked after the stock
+# rows.
+# returns all requested variants that exist, and whether they were reserved
+RESERVE_STOCK_SQL = """
+WITH requested AS (
+    SELECT * FROM unnest(%(product_ids)s::uuid[], %(variants)s::text[], %(quantities)s::int[])
+        AS r(product_id, variant, quantity)
+), stock AS MATERIALIZED (
+    SELECT s.id, s.product_id, s.variant, s.shards, requested.quantity,
+        floor(random() * s.shards)::int AS shard
+    FROM store_api_productstock s
+    JOIN requested ON requested.product_id = s.product_id AND requested.variant = s.variant
+    JOIN store_api_product p ON p.id = s.product_id AND p.deleted IS NULL
+), locked AS (
+    SELECT s.id, stock.quantity
+    FROM store_api_productstock s
+    JOIN stock ON stock.id = s.id
+    WHERE stock.shards = 0
+    ORDER BY s.product_id, s.variant
+    FOR UPDATE OF s
+), locked_shards AS (
+    SELECT sh.id, stock.quantity
+    FROM store_api_productstockshard sh
+    JOIN stock ON stock.id = sh.stock_id AND stock.shard = sh.shard
+    WHERE (SELECT count(*) FROM locked) >= 0
+    ORDER BY sh.stock_id, sh.shard
+    FOR UPDATE OF sh
+), reserved AS (
+    UPDATE store_api_productstock s
+    SET available = s.available - locked.quantity
+    FROM locked
+    WHERE s.id = locked.id AND s.available >= locked.quantity
+    RETURNING s.id
+), reserved_shards AS (
+    UPDATE store_api_productstockshard sh
+    SET available = sh.available - locked_shards.quantity
+    FROM locked_shards
+    WHERE sh.id = locked_shards.id AND sh.available >= locked_shards.quantity
+    RETURNING sh.stock_id AS id
+)
+SELECT stock.product_id, stock.variant, stock.id, stock.shards,
+    stock.id IN (SELECT id FROM reserved UNION ALL SELECT id FROM reserved_shards)
+FROM stock
+"""
+
+ProductVariant = tuple[UUID, str]
+
+
+class StockReservationError(Exception):
+    pass
+
+
+class ProductVariantsNotFound(StockReservationError):
+    def __init__(self, product_variants: list[ProductVariant]):
+        super().__init__(f"product variants {product_variants} do not exist")
+        self.product_variants = product_variants
+
+
+class InsufficientStock(StockReservationError):
+    def __init__(self, product_variant: ProductVariant):
+        super().__init__(f"insufficient stock of product variant {product_variant}")
+        self.product_variant = product_variant
+
+
+def reserve_stock(quantity_by_product_variant: dict[ProductVariant, int]) -> None:
+    """
+    Reserves (i.e. subtracts from the available stock) the requested quantities of each product
+    variant, atomically - either all are reserved or an error is raised.
+    Must run in a transaction, which needs to be rolled back when an error is raised: rows that had
+    enough stock were already updated.
+
+    Stock rows are only locked from the update until the end of the transaction, so the
+    transaction should end as soon as possible after reserving.
+
+    When the picked shard of a sharded variant does not have enough stock, the reservation is rolled
+    back (to a savepoint, releasing its locks) and done again from all shards.
+
+    :raises ProductVariantsNotFound: some product variants do not exist (or the product is deleted)
+    :raises InsufficientStock: there is not enough stock of some product variant
+    """
+    product_variants = list(quantity_by_product_variant.keys())
+    savepoint = transaction.savepoint()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            RESERVE_STOCK_SQL,
+            {
+                "product_ids": [product_id for product_id, _ in product_variants],
+                "variants": [variant for _, variant in product_variants],
+                "quantities": list(quantity_by_product_variant.values()),
+            },
+        )
+        stock_by_product_variant = {
+            (product_id, variant): (stock_id, shards, reserved)
+            for product_id, variant, stock_id, shards, reserved in cursor.fetchall()
+        }
+
+    missing = [pv for pv in product_variants if pv not in stock_by_product_variant]
+    if missing:
+        raise ProductVariantsNotFound(missing)
+
+    needs_all_shards = False
+    for product_variant in product_variants:
+        _, shards, reserved = stock_by_product_variant[product_variant]
+        if reserved:
+            continue
+        if not shards:
+            raise InsufficientStock(product_variant)
+        # the shard that was picked did not have enough, but all shards together may
+        needs_all_shards = True
+
+    if not needs_all_shards:
+        transaction.savepoint_commit(savepoint)
+        return
+
+    # the picked shards stay locked until the end of the transaction otherwise - while the stock
+    # rows would be locked after them
+    transaction.savepoint_rollback(savepoint)
+    product_variant_by_stock_id = {
+        stock_id: product_variant
+        for product_variant, (stock_id, _, _) in stock_by_product_variant.items()
+    }
+    missing_stock_id, insufficient_stock_id = _reserve_from_all_shards(
+        {
+            stock_id: quantity_by_product_variant[product_variant]
+            for stock_id, product_variant in product_variant_by_stock_id.items()
+        }
+    )
+    if missing_stock_id is not None:
+        raise ProductVariantsNotFound([product_variant_by_stock_id[missing_stock_id]])
+    if insufficient_stock_id is not None:
+        raise InsufficientStock(product_variant_by_stock_id[insufficient_stock_id])
+
+
+def _reserve_from_all_shards(
+    quantity_by_stock_id: dict[int, int],
+) -> tuple[int | None, int | None]:
+    """
+    Reserves the requested quantities from the stock rows and all of their shards, locked in the
+    same order as in RESERVE_STOCK_SQL
+
+    :return: the id of a stock row that was deleted meanwhile, and of one without enough stock
+        (None when all were reserved)
+    """
+    stocks = list(
+        ProductStock.objects.select_for_update()
+        .filter(id__in=quantity_by_stock_id)
+        .order_by("product_id", "variant")
+    )
+    missing = quantity_by_stock_id.keys() - {stock.id for stock in stocks}
+    if missing:
+        return next(iter(missing)), None
+
+    shards_by_stock_id = defaultdict(list)
+    for shard in (
+        ProductStockShard.objects.select_for_update()
+        .filter(stock_id__in=[stock.id for stock in stocks if stock.shards])
+        .order_by("stock_id", "shard")
+    ):
+        shards_by_stock_id[shard.stock_id].append(shard)
+
+    for stock in stocks:
+        shards = shards_by_stock_id[stock.id]
+        remaining = quantity_by_stock_id[stock.id]
+        if stock.available + sum(shard.available for shard in shards) < remaining:
+            return None, stock.id
+
+        for row in [stock, *shards]:
+            taken = min(row.available, remaining)
+            row.available -= taken
+            remaining -= taken
+
+    ProductStock.objects.bulk_update(stocks, fields=["available"])
+    ProductStockShard.objects.bulk_update(
+        [shard for shards in shards_by_stock_id.values() for shard in shards],
+        fields=["available"],
+    )
+    return None, None
@@ -0,0 +1,78 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, Q, QuerySet
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+
+# must match the text search configuration used by the triggers that maintain
+# store_api_product.search_vector (see migration 0014)
+SEARCH_CONFIG = "simple"
+
+_search_term_lexemes_pattern = re.compile(r"\w+")
+
+
+class ProductSearchBackend:
+    """
+    Filters a product queryset by a free text search term (title, description and tag names).
+    Backends that annotate the results with `search_rank` (higher is more relevant) have them paged
+    best match first (see store_api.pagination.KeysetCursorPagination), newest first otherwise
+    """
+
+    def search(self, queryset: QuerySet, search_term: str) -> QuerySet:
+        raise NotImplementedError
+
+
+class ContainsProductSearchBackend(ProductSearchBackend):
+    """
+    Substring matching with LIKE. Requires a sequential scan over products and tags, so it is
+    only adequate for small stores
+    """
+
+    def search(self, queryset: QuerySet, search_term: str) -> QuerySet:
+        # note: without the distinct, the query will result in duplicated records
+        # https://stackoverflow.com/questions/18071572/django-duplicates-when-filtering-on-many-to-many-field
+        return queryset.filter(
+            Q(title__contains=search_term)
+            | Q(description__contains=search_term)
+            | Q(tags__name__contains=search_term)
+        ).distinct()
+
+
+class PostgresFullTextProductSearchBackend(ProductSearchBackend):
+    """
+    Full text search over the product search vector - maintained by DB triggers and indexed with GIN.
+    Every word of the search term is matched as a prefix and results are annotated with `search_rank`
+    """
+
+    def search(self, queryset: QuerySet, search_term: str) -> QuerySet:
+        search_query = self.build_query(search_term)
+        if search_query is None:
+            return queryset.none()
+
+        # ts_rank is a real - as a double precision, the rank of the last result of a page encoded
+        # in the cursor compares equal to the rank of the same row on the next page
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=Cast(
+                SearchRank(F("search_vector"), search_query), output_field=FloatField()
+            )
+        )
+
+    @staticmethod
+    def build_query(search_term: str) -> SearchQuery | None:
+        # only word characters are kept, which also ensures that no tsquery operators
+        # from the user input end up in the raw query
+        lexemes = _search_term_lexemes_pattern.findall(search_term)
+        if not lexemes:
+            return None
+
+        return SearchQuery(
+            " & ".join(f"{lexeme}:*" for lexeme in lexemes),
+            config=SEARCH_CONFIG,
+            search_type="raw",
+        )
+
+
+def get_product_search_backend() -> ProductSearchBackend:
+    return import_string(settings.PRODUCT_SEARCH_BACKEND)()
@@ -40,7 +40,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
 class ProductStockSerializer(serializers.RelatedField):
     def to_representation(self, value):
         # value is of type RelatedManager[ProductStock] and is defined at runtime
-        return {s.variant: s.available for s in value.all()}
+        # the stock needs to be fetched with ProductStock.objects.with_total_available()
+        return {s.variant: s.total_available for s in value.all()}
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -66,20 +67,13 @@ class ProductSerializer(serializers.ModelSerializer):
     stock = ProductStockSerializer(read_only=True)
 
 
-class PagingMetadataSerializer(serializers.Serializer):
-    page_size = serializers.IntegerField()
-    offset_date = serializers.DateTimeField()
-    has_next = serializers.BooleanField()
+class ProductListItemSerializer(ProductSerializer):
+    """
+    Products of cached list pages - without their stock, which changes with every order
+    """
 
-
-class ProductListSerializer(serializers.Serializer):
-    metadata = PagingMetadataSerializer(read_only=True)
-    data = ProductSerializer(many=True)
-
-
-class TagListSerializer(serializers.Serializer):
-    metadata = PagingMetadataSerializer(read_only=True)
-    data = TagSerializer(many=True)
+    class Meta(ProductSerializer.Meta):
+        fields = [field for field in ProductSerializer.Meta.fields if field != "stock"]
 
 
 class CreateProductRequestSerializer(serializers.Serializer):
@@ -105,6 +99,15 @@ class ProductInOrderSerializer(serializers.Serializer):
 class CreateOrderRequestSerializer(serializers.Serializer):
     products = ProductInOrderSerializer(many=True)
 
+    def validate_products(self, products: list[dict]) -> list[dict]:
+        # an order has a line per product variant - repeated ones would be ambiguous
+        product_variants = [(p["id"], p["variant"]) for p in products]
+        if len(set(product_variants)) != len(product_variants):
+            raise serializers.ValidationError(
+                "a product variant can only be ordered once per order"
+            )
+        return products
+
 
 class CreateOrderResponseSerializer(serializers.Serializer):
     id = serializers.UUIDField()
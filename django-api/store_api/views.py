@@ -1,12 +1,10 @@
-from datetime import datetime
-from functools import reduce
-from typing import Any, Callable
+from typing import Any, Callable, Sequence
 from uuid import UUID
 
 import django_fsm
 from django.contrib.auth.hashers import check_password
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Prefetch, prefetch_related_objects
 from oauth2_provider.contrib.rest_framework import permissions as token_permissions
 from rest_framework import permissions, status
 from rest_framework.decorators import action
@@ -15,16 +13,23 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
+from store_api.cache import get_product_cache
 from store_api.models import Order, OrderLineItem, Product, ProductStock, Tag, User
+from store_api.pagination import OrderPagination, ProductPagination, TagPagination
+from store_api.reservations import (
+    InsufficientStock,
+    ProductVariantsNotFound,
+    reserve_stock,
+)
+from store_api.search import get_product_search_backend
 from store_api.serializers import (
     CreateOrderRequestSerializer,
     CreateOrderResponseSerializer,
     CreateProductRequestSerializer,
     CreateUserRequestSerializer,
     OrderSerializer,
-    ProductListSerializer,
+    ProductListItemSerializer,
     ProductSerializer,
-    TagListSerializer,
     TagSerializer,
     UpdateProductRequestSerializer,
     UpdateUserPasswordRequestSerializer,
@@ -111,6 +116,13 @@ class ProductViewSet(GenericViewSet):
     }
 
     serializer_class = ProductSerializer
+    # relations used by the serializer. prefetching them serializes any number of products
+    # in a fixed number of queries (instead of 2 additional queries per product)
+    serializer_prefetch = [
+        Prefetch("stock", queryset=ProductStock.objects.with_total_available()),
+        "tags",
+    ]
+    pagination_class = ProductPagination
 
     def get_permissions(self):
         match self.action:
@@ -133,57 +145,86 @@ class ProductViewSet(GenericViewSet):
 
                 # TODO check serializer.stock.get_value() function
                 stock_spec: dict = serializer.validated_data["stock"]
-                # TODO this can probably be achieved with bulk create for a single DB call
-                for variant, stock in stock_spec.items():
-                    product.stock.create(
-                        variant=variant,
-                        available=stock,
-                    )
+                ProductStock.objects.bulk_create(
+                    [
+                        ProductStock(product=product, variant=variant, available=stock)
+                        for variant, stock in stock_spec.items()
+                    ]
+                )
 
                 product.tags.set(
                     Tag.objects.filter(id__in=serializer.validated_data["tags"])
                 )
 
+            prefetch_related_objects([product], *self.serializer_prefetch)
             response_serializer = self.serializer_class(product)
 
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         else:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    def retrieve(self, request: Request, id: UUID = None):
+        data = get_product_cache().get_product(id, lambda: self._serialize_product(id))
+        if data is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return Response(data)
+
+    def _serialize_product(self, id: UUID) -> dict | None:
+        try:
+            product = self.queryset.prefetch_related(*self.serializer_prefetch).get(
+                id=id
+            )
+        except Product.DoesNotExist:
+            return None
+
+        return self.serializer_class(product).data
+
     def update(self, request: Request, id: UUID = None):
         serializer = UpdateProductRequestSerializer(data=request.data)
 
         if not serializer.is_valid():
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            product = self.queryset.select_for_update().get(id=id)
-        except Product.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
+        with transaction.atomic():
+            try:
+                product = self.queryset.select_for_update().get(id=id)
+            except Product.DoesNotExist:
+                return Response(status=status.HTTP_404_NOT_FOUND)
 
-        if product.owner_user != request.user:
-            return Response(status=status.HTTP_403_FORBIDDEN)
+            if product.owner_user_id != request.user.id:
+                return Response(status=status.HTTP_403_FORBIDDEN)
 
-        product.title = serializer.validated_data["title"]
-        product.description = serializer.validated_data["description"]
-        product.price = serializer.validated_data["price"]
+            product.title = serializer.validated_data["title"]
+            product.description = serializer.validated_data["description"]
+            product.price = serializer.validated_data["price"]
+            product.save()
 
-        with transaction.atomic():
             # RelatedManager .set() function relies on remove() and clear() functions, which are only available
             # on relationships with ForeignKeys where null=True
             # https://docs.djangoproject.com/en/5.1/ref/models/relations/#django.db.models.fields.related.RelatedManager.clear
+            shards_by_variant = dict(
+                ProductStock.objects.filter(
+                    product_id=product.id, shards__gt=0
+                ).values_list("variant", "shards")
+            )
             ProductStock.objects.filter(product_id=product.id).delete()
-            ProductStock.objects.bulk_create(
+            stock = ProductStock.objects.bulk_create(
                 [
                     ProductStock(product=product, variant=variant, available=stock)
                     for variant, stock in serializer.validated_data["stock"].items()
                 ]
             )
+            # variants that remain keep being sharded
+            for product_stock in stock:
+                if product_stock.variant in shards_by_variant:
+                    product_stock.set_shards(shards_by_variant[product_stock.variant])
 
             product.tags.set(
                 Tag.objects.filter(id__in=serializer.validated_data["tags"])
             )
 
+        prefetch_related_objects([product], *self.serializer_prefetch)
         response_serializer = self.serializer_class(product)
         return Response(response_serializer.data)
 
@@ -196,7 +237,7 @@ class ProductViewSet(GenericViewSet):
         except Product.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
-        if product.owner_user != request.user:
+        if product.owner_user_id != request.user.id:
             return Response(status=status.HTTP_403_FORBIDDEN)
 
         with transaction.atomic():
@@ -206,43 +247,45 @@ class ProductViewSet(GenericViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def list(self, request: Request):
-        page_size, offset = self._paging_params_from_request(request)
-        results_queryset = self.queryset.order_by("-updated").all()
+        # pages are cached without the stock of their products, so that orders do not invalidate
+        # every cached page - the stock is read when the page is served
+        page = get_product_cache().get_list_page(
+            request.query_params.dict(), lambda: self._list_page(request)
+        )
+        self._add_stock(page["data"])
+        return Response(page)
+
+    def _list_page(self, request: Request) -> dict:
+        queryset = self.queryset
         search_term = request.query_params.get("search_term", None)
 
         if search_term:
-            # note: without the distinct, the query will result in duplicated records
-            # https://stackoverflow.com/questions/18071572/django-duplicates-when-filtering-on-many-to-many-field
-            results_queryset = results_queryset.filter(
-                Q(title__contains=search_term)
-                | Q(description__contains=search_term)
-                | Q(tags__name__contains=search_term)
-            ).distinct()
-
-        if offset:
-            results_queryset = results_queryset.filter(updated__lt=offset)
-
-        serializer = ProductListSerializer(
-            _list_and_paging_metadata(page_size, results_queryset, lambda p: p.updated)
-        )
-        return Response(serializer.data)
+            # paged by rank when the backend ranks the results
+            queryset = get_product_search_backend().search(queryset, search_term)
+
+        queryset = queryset.prefetch_related("tags")
 
-    def _paging_params_from_request(self, request: Request) -> tuple[int, datetime]:
-        # TODO set these as "constants" somewhere
-        default_page_size = 20
+        page = self.paginate_queryset(queryset)
+        serializer = ProductListItemSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data).data
 
-        page_size = int(request.query_params.get("page_size", default_page_size))
-        # TODO is there any way to leverage Django or DRF to handle these query param transformations
-        offset = request.query_params.get("offset", None)
-        if offset:
-            offset = datetime.fromisoformat(offset.replace("Z", "+00:00"))
+    @staticmethod
+    def _add_stock(products: Sequence[dict]) -> None:
+        stock = {product["id"]: {} for product in products}
+        variants = ProductStock.objects.with_total_available().filter(
+            product_id__in=stock
+        )
+        for variant in variants:
+            stock[str(variant.product_id)][variant.variant] = variant.total_available
 
-        return page_size, offset
+        for product in products:
+            product["stock"] = stock[product["id"]]
 
 
 class TagViewSet(ModelViewSet):
     queryset = Tag.objects.filter(deleted__isnull=True)
     serializer_class = TagSerializer
+    pagination_class = TagPagination
     permission_classes = [IsAdminUser]
 
     def get_permissions(self):
@@ -255,26 +298,15 @@ class TagViewSet(ModelViewSet):
         return [permission() for permission in permission_classes]
 
     def list(self, request: Request):
-        # TODO set these as "constants" somewhere
-        default_page_size = 50
-
-        queryset = self.queryset.order_by("created")
-
-        page_size = int(request.query_params.get("page_size", default_page_size))
-        offset = request.query_params.get("offset", None)
+        queryset = self.queryset
         search_term = request.query_params.get("search_term", None)
 
         if search_term:
             queryset = queryset.filter(name__contains=search_term)
 
-        if offset:
-            offset = datetime.fromisoformat(offset.replace("Z", "+00:00"))
-            queryset = queryset.filter(created__gt=offset)
-
-        serializer = TagListSerializer(
-            _list_and_paging_metadata(page_size, queryset, lambda t: t.created)
-        )
-        return Response(serializer.data)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class IsOwner(BasePermission):
@@ -299,6 +331,7 @@ class OrderViewSet(ModelViewSet):
     )
 
     serializer_class = OrderSerializer
+    pagination_class = OrderPagination
 
     required_alternate_scopes = {
         "GET": [["read"]],
@@ -318,81 +351,56 @@ class OrderViewSet(ModelViewSet):
         return permissions
         # return [permission() for permission in permission_classes]
 
+    def list(self, request: Request):
+        queryset = self.queryset.filter(customer=request.user)
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     def create(self, request: Request):
         serializer = CreateOrderRequestSerializer(data=request.data)
         if serializer.is_valid():
-            requested_quantity_by_product_id_and_variant = {
+            requested_quantities = {
                 (p["id"], p["variant"]): p["quantity"]
                 for p in serializer.validated_data["products"]
             }
 
-            stock_queryset = (
-                ProductStock.objects.filter(product__deleted__isnull=True)
-                .select_for_update()
-                .prefetch_related("product")
-            )
-            lookups = [
-                Q(product_id=requested_product["id"])
-                & Q(variant=requested_product["variant"])
-                for requested_product in serializer.validated_data["products"]
-            ]
-            combined_lookup = reduce(lambda lu, acc: acc | lu, lookups)
-
-            with transaction.atomic():
-                processed_order_line_items = []
-                order = Order.objects.create(customer=request.user)
-                requested_products_stock = stock_queryset.filter(combined_lookup)
-
-                if len(requested_products_stock) != len(
-                    serializer.validated_data["products"]
-                ):
-                    missing_product_ids = set(
-                        requested_quantity_by_product_id_and_variant.keys()
-                    ).difference(
-                        set(
-                            [
-                                (ps.product.id, ps.variant)
-                                for ps in requested_products_stock
-                            ]
-                        )
-                    )
-                    return Response(
-                        {
-                            "error": "requested products and/or stock variants that do not exist",
-                            "detail": missing_product_ids,
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-
-                for product_stock in requested_products_stock:
-                    requested_quantity = requested_quantity_by_product_id_and_variant[
-                        (product_stock.product.id, product_stock.variant)
-                    ]
-
-                    product_stock.available -= requested_quantity
-
-                    # we could let this go to the DB for constraint validation, but we can save that roundtrip
-                    if product_stock.available < 0:
-                        return Response(
-                            {
-                                "error": f"available stock for product {product_stock.product.id} is less than desired amount"
-                            },
-                            status=status.HTTP_400_BAD_REQUEST,
-                        )
-
-                    processed_order_line_items.append(
-                        OrderLineItem(
-                            order=order,
-                            product=product_stock.product,
-                            variant=product_stock.variant,
-                            quantity=requested_quantity,
-                        )
+            try:
+                with transaction.atomic():
+                    # the order is created first, so stock rows are locked for as little as possible
+                    order = Order.objects.create(customer=request.user)
+                    reserve_stock(requested_quantities)
+                    OrderLineItem.objects.bulk_create(
+                        [
+                            OrderLineItem(
+                                order=order,
+                                product_id=product_id,
+                                variant=variant,
+                                quantity=quantity,
+                            )
+                            for (
+                                product_id,
+                                variant,
+                            ), quantity in requested_quantities.items()
+                        ]
                     )
-
-                ProductStock.objects.bulk_update(
-                    requested_products_stock, fields=["available"]
+            except ProductVariantsNotFound as e:
+                return Response(
+                    {
+                        "error": "requested products and/or stock variants that do not exist",
+                        "detail": e.product_variants,
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            except InsufficientStock as e:
+                product_id, _ = e.product_variant
+                return Response(
+                    {
+                        "error": f"available stock for product {product_id} is less than desired amount"
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-                OrderLineItem.objects.bulk_create(processed_order_line_items)
 
             response_serializer = CreateOrderResponseSerializer({"id": order.id})
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -420,22 +428,3 @@ class OrderViewSet(ModelViewSet):
 
         except Order.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
-
-
-# TODO probably can be integrated into a mixin or something to allow this paging to be re-used in all views and with less code
-# perhaps based on this https://www.django-rest-framework.org/api-guide/pagination/#pagination
-def _list_and_paging_metadata(page_size: int, queryset, offset_attribute_selector):
-    total_results = queryset.all().count()
-    paged = queryset[:page_size]
-    results = list(paged)
-    num_results = len(results)
-    has_next = total_results > num_results
-
-    return {
-        "metadata": {
-            "page_size": page_size,
-            "offset_date": offset_attribute_selector(results[num_results - 1]),
-            "has_next": has_next,
-        },
-        "data": results,
-    }
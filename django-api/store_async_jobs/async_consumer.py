@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import signal
+import time
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from store_async_jobs.consumer import (
+    FAILURE_TTL_SECONDS,
+    ConsumerBase,
+    DebeziumEventDecoder,
+    DebeziumRedisEvent,
+    RedisStreamEvent,
+)
+
+
+class AsyncConsumer(ConsumerBase):
+    """
+    asyncio version of store_async_jobs.consumer.Consumer, based on redis.asyncio clients with
+    protocol 3 and decoded responses.
+
+    Reading, claiming idle pending events, moving poison events to the dead-letter stream and
+    confirming events is shared with Consumer (see ConsumerBase). Events of a batch are processed
+    concurrently, grouped by partition key (see ConsumerBase.partition_key): events with the same
+    key are processed in order, one at a time, and at most `max_concurrency` events are processed
+    at the same time. A batch is processed entirely - and its processed events confirmed with a
+    single XACK - before the next one is read.
+
+    This suits consumers whose processing waits on I/O (e.g. HTTP calls to payment or shipping
+    services). Django ORM calls need to be wrapped with asgiref.sync.sync_to_async
+    """
+
+    # the metrics are scraped from another thread, which can not use the asyncio client - the
+    # state of the consumer group (pending events and lag) is not exposed
+    metrics_read_group_state = False
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        stream_name: str,
+        consumer_group_name: str,
+        consumer_name: str,
+        batch_size: int = 100,
+        max_concurrency: int = 10,
+        **kwargs,
+    ):
+        """
+        :param batch_size: max number of events read from the stream at a time - also bounds the
+        events processed concurrently, so it should be a few times larger than max_concurrency
+        :param max_concurrency: max number of events processed at the same time
+        :param kwargs: see ConsumerBase
+        """
+        super().__init__(
+            redis_client,
+            stream_name,
+            consumer_group_name,
+            consumer_name,
+            batch_size=batch_size,
+            **kwargs,
+        )
+        self.max_concurrency = max_concurrency
+        self.stopping = False
+
+    async def init(self):
+        try:
+            reply = await self.redis_client.xgroup_create(
+                self.stream_name,
+                self.consumer_group_name,
+                self.consumer_group_start_id,
+                mkstream=True,
+            )
+            self.consumer_group_created(reply)
+        except ResponseError as e:
+            self.consumer_group_not_created(e)
+
+    async def read_from_consumer_group(
+        self, event_id_cursor: str, event_count: int, block_ms: int | None = None
+    ):
+        return await self.redis_client.xreadgroup(
+            **self.xreadgroup_kwargs(event_id_cursor, event_count, block_ms)
+        )
+
+    async def read_events(
+        self, event_count: int | None = None
+    ) -> list[RedisStreamEvent]:
+        event_count = event_count or self.batch_size
+
+        # same order as Consumer.read_events
+        if self.claim_is_due():
+            claimed_events = self.claimed_events(
+                await self.redis_client.xautoclaim(
+                    self.stream_name,
+                    self.consumer_group_name,
+                    self.consumer_name,
+                    self.claim_min_idle_ms,
+                    count=event_count,
+                ),
+                event_count,
+            )
+            if claimed_events:
+                return await self.quarantine_poison_events(
+                    await self.events_in_key_range(claimed_events)
+                )
+
+        reading_pending_events = self.check_pending_messages
+        event_id_cursor, block_ms = self.next_read()
+        events = await self.events_in_key_range(
+            self.events_read(
+                await self.read_from_consumer_group(
+                    event_id_cursor, event_count, block_ms
+                )
+            )
+        )
+        if reading_pending_events:
+            events = await self.quarantine_poison_events(events)
+        return events
+
+    async def events_in_key_range(
+        self, events: list[RedisStreamEvent]
+    ) -> list[RedisStreamEvent]:
+        """
+        See Consumer.events_in_key_range
+        """
+        events, other_events = self.split_key_range(events)
+        if other_events:
+            await self.redis_client.xack(
+                self.stream_name,
+                self.consumer_group_name,
+                *(event.id for event in other_events),
+            )
+        return events
+
+    async def quarantine_poison_events(
+        self, events: list[RedisStreamEvent]
+    ) -> list[RedisStreamEvent]:
+        """
+        See Consumer.quarantine_poison_events
+        """
+        if self.max_deliveries is None or not events:
+            return events
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        self.queue_delivery_checks(pipeline, events)
+        poison_events, healthy_events = self.split_poison_events(
+            events, await pipeline.execute()
+        )
+
+        if poison_events:
+            await self.move_to_dead_letter_stream(poison_events)
+
+        return healthy_events
+
+    async def move_to_dead_letter_stream(
+        self, poison_events: list[tuple[RedisStreamEvent, int, str]]
+    ) -> None:
+        pipeline = self.redis_client.pipeline(transaction=True)
+        self.queue_dead_letter(pipeline, poison_events)
+        await pipeline.execute()
+        self.poison_events_dead_lettered(poison_events)
+
+    async def record_failure(self, event: RedisStreamEvent, error: Exception) -> None:
+        if self.max_deliveries is None:
+            return
+
+        try:
+            await self.redis_client.set(
+                self.failure_key(event.id),
+                self.failure_description(error),
+                ex=FAILURE_TTL_SECONDS,
+            )
+        except RedisError:
+            logging.warning(
+                "failed to record the failure of event %s", event.id, exc_info=True
+            )
+
+    async def confirm_events_processed(self, event_ids: list[str]) -> None:
+        # a single XACK for all the events
+        await self.redis_client.xack(
+            self.stream_name, self.consumer_group_name, *event_ids
+        )
+        self.metrics.events_confirmed(len(event_ids))
+        logging.info("Sucessfully processed %s events", len(event_ids))
+
+    async def process_events(self):
+        events = await self.read_events()
+        if not events:
+            return
+
+        logging.debug("processing batch of %s events", len(events))
+        started = time.perf_counter()
+        event_ids = await self.process_batch(events)
+        self.metrics.observe_processing(time.perf_counter() - started, len(events))
+        if event_ids:
+            await self.confirm_events_processed(event_ids)
+
+    async def process_batch(self, events: list[RedisStreamEvent]) -> list[str]:
+        """
+        Processes the events of a batch concurrently, in order per partition key, and returns the
+        IDs of the ones to confirm
+        """
+        events_by_key: dict[str, list[RedisStreamEvent]] = {}
+        for event in events:
+            events_by_key.setdefault(self.partition_key(event), []).append(event)
+
+        # the semaphore is shared by the partitions of the batch only - it is not held between
+        # batches, so there is no need to keep it around
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        processed_event_ids = await asyncio.gather(
+            *(
+                self.process_partition(partition_events, semaphore)
+                for partition_events in events_by_key.values()
+            )
+        )
+
+        return [event_id for event_ids in processed_event_ids for event_id in event_ids]
+
+    async def process_partition(
+        self, events: list[RedisStreamEvent], semaphore: asyncio.Semaphore
+    ) -> list[str]:
+        """
+        Processes events that share a partition key, in order, and returns the IDs of the ones to
+        confirm. Same as Consumer.process_partition: after a failure, the following events with the
+        same partition key are skipped, in this batch and the next ones, as they may depend on the
+        failed one - they are left pending as well, to be claimed after being idle
+        """
+        processed_event_ids = []
+        for event in events:
+            if self.held_back(event):
+                continue
+
+            try:
+                async with semaphore:
+                    processed_event_ids.append(await self.process_event(event))
+            except Exception as e:
+                await self.record_failure(event, e)
+                logging.exception("failed to process event %s", event.id)
+                self.hold_back_key(event)
+                continue
+            self.release_held_events([event])
+
+        return processed_event_ids
+
+    async def process_event(self, event: RedisStreamEvent) -> str:
+        raise NotImplementedError
+
+    def stop(self, *args):
+        logging.info("stopping consumer %s...", self.consumer_name)
+        self.stopping = True
+
+    async def run(self):
+        """
+        Processes events until SIGTERM/SIGINT - the batch in flight is processed and confirmed
+        before returning
+        """
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self.stop)
+        loop.add_signal_handler(signal.SIGINT, self.stop)
+
+        await self.init()
+        while not self.stopping:
+            await self.process_events()
+
+        logging.info("stopped consumer %s", self.consumer_name)
+
+
+class AsyncRedisDebeziumStreamConsumer(AsyncConsumer):
+
+    # the fields of the changed rows that the consumer uses - only these are decoded. all if None
+    event_fields: tuple[str, ...] | None = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.decoder = DebeziumEventDecoder(self.event_fields)
+
+    def partition_key(self, event: RedisStreamEvent) -> str:
+        # debezium events are stored with the key of the changed row (its primary key) as field name
+        return next(iter(event.payload))
+
+    async def process_event(self, event: RedisStreamEvent) -> str:
+        debezium_event = self.decoder.decode(self.stream_name, event)
+        return await self.process_change_event(debezium_event)
+
+    async def process_change_event(self, event: DebeziumRedisEvent) -> str:
+        raise NotImplementedError
@@ -1,10 +1,41 @@
-import json
 import logging
+import threading
+import time
+import zlib
 from dataclasses import dataclass
-from typing import Generator
+from typing import Any, Callable, Generator, Iterable
 
 from redis import Redis
-from redis.exceptions import ResponseError
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import RedisError, ResponseError
+
+from store_async_jobs.metrics import ConsumerMetrics
+
+# fields added to the events moved to a dead-letter stream, along with the original fields
+DEAD_LETTER_FIELD_PREFIX = "dead_letter:"
+# failures are recorded (in redis, as events can be claimed by other consumers) until the event is
+# either processed or moved to the dead-letter stream - or for this long
+FAILURE_TTL_SECONDS = 7 * 24 * 60 * 60
+FAILURE_MAX_LENGTH = 1000
+
+try:
+    # optional - several times faster than the standard library
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+def stream_id(event_id: str) -> tuple[int, int]:
+    """
+    :return: the (milliseconds, sequence number) of a stream entry ID - in the order of the stream
+    """
+    milliseconds, sequence = event_id.split("-")
+    return int(milliseconds), int(sequence)
+
+
+def partition_key_hash(partition_key: str) -> int:
+    # crc32 rather than hash() - which is not stable across processes
+    return zlib.crc32(partition_key.encode("utf-8"))
 
 
 @dataclass
@@ -22,7 +53,7 @@ class DebeziumRedisEvent:
     @staticmethod
     def from_redis_stream_event(event: RedisStreamEvent):
         raw_json = list(event.payload.values())[0]
-        json_data = json.loads(raw_json)
+        json_data = json_loads(raw_json)
 
         return DebeziumRedisEvent(
             id=event.id,
@@ -31,39 +62,192 @@ class DebeziumRedisEvent:
         )
 
 
-class Consumer:
+class DebeziumEventDecoder:
     """
-    Redis consumer for streams, based on redis clients with protocol 3 and decoded responses
+    Decodes the debezium change events stored in redis streams.
+
+    The changed rows are the `before` and `after` of the `payload` of the envelope, which comes after
+    a (much larger) `schema` block and is followed by `source` metadata - neither of which consumers
+    need. When the envelope allows it, only the rows are parsed. How each stream is decoded (the
+    plan) is figured out from its first event and cached - streams are written by the same
+    connector, so their events have the same layout.
+
+    If `fields` are given, the `before` and `after` rows only have those fields
     """
 
+    PAYLOAD_KEY = '"payload":'
+    SOURCE_KEY = ',"source":'
+
     def __init__(
         self,
-        redis_client: Redis,
+        fields: Iterable[str] | None = None,
+        loads: Callable[[str], Any] = json_loads,
+    ):
+        self.fields = tuple(fields) if fields is not None else None
+        self.loads = loads
+        self.plan_by_stream: dict[str, Callable[[str], dict]] = {}
+
+    def decode(self, stream_name: str, event: RedisStreamEvent) -> DebeziumRedisEvent:
+        raw_json = next(iter(event.payload.values()))
+
+        payload = None
+        plan = self.plan_by_stream.get(stream_name)
+        if plan is not None:
+            try:
+                payload = plan(raw_json)
+            except (ValueError, KeyError, TypeError):
+                logging.debug(
+                    "decoding plan of %s does not fit, replanning", stream_name
+                )
+
+        if payload is None:
+            plan, payload = self.plan(raw_json)
+            self.plan_by_stream[stream_name] = plan
+
+        return DebeziumRedisEvent(
+            id=event.id,
+            before=self.project(payload["before"]),
+            after=self.project(payload["after"]),
+        )
+
+    def plan(self, raw_json: str) -> tuple[Callable[[str], dict], dict]:
+        """
+        :return: the plan to decode events like the given one, and the payload of the given event
+        """
+        data = self.loads(raw_json)
+        if "before" in data and "after" in data:
+            # envelope without schema (schemas disabled in the connector)
+            return self.decode_envelope_without_schema, data
+
+        payload = data["payload"]
+        for plan in (self.decode_rows_only, self.decode_payload_only):
+            try:
+                decoded = plan(raw_json)
+            except (ValueError, KeyError, TypeError):
+                continue
+            if (decoded["before"], decoded["after"]) == (
+                payload["before"],
+                payload["after"],
+            ):
+                return plan, payload
+
+        return self.decode_envelope, payload
+
+    def decode_rows_only(self, raw_json: str) -> dict:
+        # the rows are the first fields of the payload, followed by the source metadata:
+        # {"schema":{...},"payload":{"before":{...},"after":{...},"source":{...},...}}
+        start = raw_json.index(self.PAYLOAD_KEY) + len(self.PAYLOAD_KEY)
+        end = raw_json.index(self.SOURCE_KEY, start)
+        return self.check_payload(self.loads(raw_json[start:end] + "}"))
+
+    def decode_payload_only(self, raw_json: str) -> dict:
+        # the payload is the last field of the envelope:
+        # {"schema":{...},"payload":{...}}
+        start = raw_json.index(self.PAYLOAD_KEY) + len(self.PAYLOAD_KEY)
+        end = raw_json.rindex("}")
+        return self.check_payload(self.loads(raw_json[start:end]))
+
+    @staticmethod
+    def check_payload(payload) -> dict:
+        # a slice of the envelope that happens to be valid JSON, but not the payload, is not decoded
+        # silently - e.g. when the keys searched for are field names of the changed rows
+        if (
+            not isinstance(payload, dict)
+            or "before" not in payload
+            or "after" not in payload
+        ):
+            raise ValueError("not the payload of a debezium envelope")
+        return payload
+
+    def decode_envelope(self, raw_json: str) -> dict:
+        return self.loads(raw_json)["payload"]
+
+    def decode_envelope_without_schema(self, raw_json: str) -> dict:
+        return self.loads(raw_json)
+
+    def project(self, row: dict | None) -> dict | None:
+        if row is None or self.fields is None:
+            return row
+        return {field: row[field] for field in self.fields if field in row}
+
+
+class ConsumerBase:
+    """
+    Configuration and state of a redis stream consumer, and the logic of reading, claiming and
+    dead-lettering events that does not depend on how redis is called. Consumer (redis clients) and
+    store_async_jobs.async_consumer.AsyncConsumer (redis.asyncio clients) send the commands, with
+    protocol 3 and decoded responses
+    """
+
+    # the metrics read the state of the consumer group with the redis client of the consumer when
+    # scraped - from the thread of the metrics server
+    metrics_read_group_state = True
+
+    def __init__(
+        self,
+        redis_client: Redis | AsyncRedis,
         stream_name: str,
         consumer_group_name: str,
         consumer_name: str,
         consumer_group_start_id: str = "$",
+        batch_size: int = 10,
+        block_ms: int | None = None,
+        claim_interval_seconds: float = 0,
+        claim_min_idle_ms: int = 60 * 1000,
+        max_deliveries: int | None = None,
+        dead_letter_stream_name: str | None = None,
+        key_range: tuple[int, int] | None = None,
     ):
+        """
+        :param batch_size: max number of events read from the stream at a time
+        :param block_ms: if set, reading new events blocks for up to this time when there are none
+        :param claim_interval_seconds: min time between checks for idle pending events to claim.
+        0 checks before every read
+        :param claim_min_idle_ms: time after which pending events of other consumers can be claimed
+        :param max_deliveries: if set, events that failed and were delivered more than this number
+        of times are moved to the dead-letter stream instead of being processed again
+        :param dead_letter_stream_name: defaults to the stream name with a `:dead-letter` suffix
+        :param key_range: (index, count) - if set, only the events whose partition key is in the
+        index-th of count key ranges are processed, the others are confirmed straight away. Each key
+        range needs its own consumer group, see store_async_jobs.supervisor.key_range_group_name
+        """
         self.redis_client = redis_client
         self.stream_name = stream_name
         self.consumer_group_name = consumer_group_name
         self.consumer_name = consumer_name
         self.consumer_group_start_id = consumer_group_start_id
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_interval_seconds = claim_interval_seconds
+        self.claim_min_idle_ms = claim_min_idle_ms
+        self.max_deliveries = max_deliveries
+        self.dead_letter_stream_name = (
+            dead_letter_stream_name or f"{stream_name}:dead-letter"
+        )
+        self.key_range = key_range
+        self.next_claim_time = 0
         self.check_pending_messages = True
+        # own pending events are read once, from the start of the stream - the cursor moves past
+        # the events read, so failed events are left to be claimed once idle (see claimed_events)
+        self.pending_events_cursor = "0-0"
+        # pending events held back behind a failed event with the same partition key (the failed
+        # event included), by key - see events_not_held_back
+        self.held_event_ids: dict[str, set[str]] = {}
+        self.held_event_ids_lock = threading.Lock()
+        self.metrics = ConsumerMetrics(
+            redis_client if self.metrics_read_group_state else None,
+            stream_name,
+            consumer_group_name,
+            consumer_name,
+        )
 
-    def init(self):
-        try:
-            reply = self.redis_client.xgroup_create(
-                self.stream_name,
-                self.consumer_group_name,
-                self.consumer_group_start_id,
-                mkstream=True,
-            )
-            logging.info(f"reply when creating consumer group - {reply}")
-        except ResponseError as e:
-            if e.args[0] != "BUSYGROUP Consumer Group name already exists":
-                logging.error("Failed to start consumer")
-                raise e
+    def consumer_group_created(self, reply) -> None:
+        logging.info(f"reply when creating consumer group - {reply}")
+
+    def consumer_group_not_created(self, error: ResponseError) -> None:
+        if error.args[0] != "BUSYGROUP Consumer Group name already exists":
+            logging.error("Failed to start consumer")
+            raise error
 
     @staticmethod
     def get_event_from_redis_decoded_format(decoded_redis_stream_entry):
@@ -71,73 +255,476 @@ class Consumer:
             decoded_redis_stream_entry[0], decoded_redis_stream_entry[1]
         )
 
-    def read_from_consumer_group(self, event_id_cursor: str, event_count: int):
-        return self.redis_client.xreadgroup(
+    def xreadgroup_kwargs(
+        self, event_id_cursor: str, event_count: int, block_ms: int | None = None
+    ) -> dict:
+        # block is only sent when set, as redis clients handle None and 0 (block forever) differently
+        block_kwargs = {"block": block_ms} if block_ms is not None else {}
+        return dict(
             groupname=self.consumer_group_name,
             consumername=self.consumer_name,
             count=event_count,
             streams={self.stream_name: event_id_cursor},
+            **block_kwargs,
         )
 
-    def read_events(
-        self, event_count: int = 10
-    ) -> Generator[RedisStreamEvent, None, None]:
-        # https://redis.io/docs/latest/develop/data-types/streams/ to understand how to deal with pending messages, claim and autoclaim
+    # https://redis.io/docs/latest/develop/data-types/streams/ to understand how to deal with
+    # pending messages, claim and autoclaim. events are read in this order:
+    # - idle pending events (of any consumer), claimed on their own schedule - as other consumers'
+    #   events only become idle after a while
+    # - own pending events (e.g. left by a previous run of the consumer), once each. The ones
+    #   that fail again are only delivered again once idle, when claimed
+    # - new events
+
+    def claim_is_due(self) -> bool:
+        return time.monotonic() >= self.next_claim_time
+
+    def claimed_events(self, claim_result, event_count: int) -> list[RedisStreamEvent]:
+        """
+        :return: the events of an XAUTOCLAIM reply
+        """
+        claimed_events = claim_result[1]
+        # there may be more idle events to claim when a full batch was claimed
+        self.next_claim_time = (
+            0
+            if len(claimed_events) >= event_count
+            else time.monotonic() + self.claim_interval_seconds
+        )
+
+        if len(claimed_events) > 0:
+            logging.debug("claimed idle events")
+            self.metrics.idle_events_claimed(len(claimed_events))
+        return [
+            ConsumerBase.get_event_from_redis_decoded_format(raw_event)
+            for raw_event in claimed_events
+        ]
+
+    def next_read(self) -> tuple[str, int | None]:
+        """
+        :return: the event id cursor and the time to block for the next XREADGROUP
+        """
+        if self.check_pending_messages:
+            # pending events are returned straight away, there is no need to block
+            return self.pending_events_cursor, None
+        return ">", self.block_ms
+
+    def events_read(self, response) -> list[RedisStreamEvent]:
+        """
+        :return: the events of an XREADGROUP reply - once there are no pending events left, new
+        events are read
+        """
+        if (
+            not response
+            or self.stream_name not in response
+            or len(response[self.stream_name][0]) == 0
+        ):
+            self.check_pending_messages = False
+            return []
+
+        logging.debug(
+            f'got {"pending" if self.check_pending_messages else "new"} events'
+        )
+        events = [
+            ConsumerBase.get_event_from_redis_decoded_format(raw_event)
+            for raw_event in response[self.stream_name][0]
+        ]
+        if self.check_pending_messages:
+            # not re-read from the start - an event that keeps failing would be read again straight
+            # away, over and over, instead of new events (and dead-lettered within milliseconds)
+            self.pending_events_cursor = events[-1].id
+        return events
 
-        # check if there are idle messages that need to be claimed
-        # this could potentially be done in a separate process
-        claim_result = self.redis_client.xautoclaim(
+    def queue_delivery_checks(self, pipeline, events: list[RedisStreamEvent]) -> None:
+        for event in events:
+            pipeline.xpending_range(
+                self.stream_name, self.consumer_group_name, event.id, event.id, 1
+            )
+        for event in events:
+            pipeline.get(self.failure_key(event.id))
+
+    def split_poison_events(
+        self, events: list[RedisStreamEvent], replies: list
+    ) -> tuple[list[tuple[RedisStreamEvent, int, str]], list[RedisStreamEvent]]:
+        """
+        :return: the events that failed and were delivered more than max_deliveries times (with
+        their deliveries and failure), and the other events - from the replies to the commands of
+        queue_delivery_checks
+        """
+        event_count = len(events)
+        pending_replies, failures = replies[:event_count], replies[event_count:]
+
+        poison_events = []
+        healthy_events = []
+        for event, pending, failure in zip(events, pending_replies, failures):
+            deliveries = pending[0]["times_delivered"] if pending else 0
+            if failure is not None and deliveries > self.max_deliveries:
+                poison_events.append((event, deliveries, failure))
+            else:
+                healthy_events.append(event)
+
+        return poison_events, healthy_events
+
+    def queue_dead_letter(
+        self, pipeline, poison_events: list[tuple[RedisStreamEvent, int, str]]
+    ) -> None:
+        for event, deliveries, failure in poison_events:
+            pipeline.xadd(
+                self.dead_letter_stream_name,
+                {
+                    **event.payload,
+                    f"{DEAD_LETTER_FIELD_PREFIX}stream": self.stream_name,
+                    f"{DEAD_LETTER_FIELD_PREFIX}group": self.consumer_group_name,
+                    f"{DEAD_LETTER_FIELD_PREFIX}consumer": self.consumer_name,
+                    f"{DEAD_LETTER_FIELD_PREFIX}event_id": event.id,
+                    f"{DEAD_LETTER_FIELD_PREFIX}deliveries": deliveries,
+                    f"{DEAD_LETTER_FIELD_PREFIX}failure": failure,
+                },
+            )
+            pipeline.delete(self.failure_key(event.id))
+        pipeline.xack(
             self.stream_name,
             self.consumer_group_name,
-            self.consumer_name,
-            60 * 1000,
-            count=event_count,
+            *(event.id for event, _, _ in poison_events),
         )
 
-        if len(claim_result[1]) > 0:
-            logging.debug("claimed idle events")
-            for raw_event in claim_result[1]:
-                yield Consumer.get_event_from_redis_decoded_format(raw_event)
-            # focus on idle pending messages first - do not process any other messages
-            return
+    def poison_events_dead_lettered(
+        self, poison_events: list[tuple[RedisStreamEvent, int, str]]
+    ) -> None:
+        self.metrics.poison_events_dead_lettered(len(poison_events))
+        self.release_held_events(event for event, _, _ in poison_events)
+        for event, deliveries, failure in poison_events:
+            logging.error(
+                "moved event %s to %s after %s deliveries - %s",
+                event.id,
+                self.dead_letter_stream_name,
+                deliveries,
+                failure,
+            )
 
-        stream_cursor_id = "0-0" if self.check_pending_messages else ">"
+    def failure_key(self, event_id: str) -> str:
+        return f"{self.stream_name}:{self.consumer_group_name}:failure:{event_id}"
 
-        response = self.read_from_consumer_group(stream_cursor_id, event_count)
-        if self.stream_name in response:
-            if len(response[self.stream_name][0]) == 0:
-                self.check_pending_messages = False
-                return
+    @staticmethod
+    def failure_description(error: Exception) -> str:
+        return f"{type(error).__name__}: {error}"[:FAILURE_MAX_LENGTH]
+
+    def partition_key(self, event: RedisStreamEvent) -> str:
+        """
+        Events with the same partition key need to be processed in order. No constraint by default
+        """
+        return event.id
+
+    def split_key_range(
+        self, events: list[RedisStreamEvent]
+    ) -> tuple[list[RedisStreamEvent], list[RedisStreamEvent]]:
+        """
+        :return: the events in the key range of the consumer, and the events of other key ranges
+        """
+        if self.key_range is None:
+            return events, []
+
+        index, count = self.key_range
+        own_events = []
+        other_events = []
+        for event in events:
+            if partition_key_hash(self.partition_key(event)) % count == index:
+                own_events.append(event)
             else:
-                logging.debug(
-                    f'got {"pending" if self.check_pending_messages else "new"} events'
+                other_events.append(event)
+        return own_events, other_events
+
+    def events_not_held_back(
+        self, events: list[RedisStreamEvent]
+    ) -> list[RedisStreamEvent]:
+        """
+        A failed event is left pending, to be claimed once idle. The following events with its
+        partition key may depend on it, so they are held back - left pending as well, whichever
+        batch they are read in - until it is processed or dead-lettered (see hold_back_key and
+        release_held_events). Held back events are claimed along with the failed event, and
+        processed after it.
+
+        :return: the events that are not held back - an event is not held back by the events before
+        it in the given events, which are processed first
+        """
+        if not self.held_event_ids:
+            return events
+
+        ready_events = []
+        ready_event_ids = set()
+        with self.held_event_ids_lock:
+            for event in events:
+                held_event_ids = self.held_event_ids.get(self.partition_key(event))
+                if held_event_ids and any(
+                    held_event_id not in ready_event_ids
+                    and stream_id(held_event_id) < stream_id(event.id)
+                    for held_event_id in held_event_ids
+                ):
+                    held_event_ids.add(event.id)
+                    logging.warning(
+                        "skipping event %s, an event with the same key failed before it",
+                        event.id,
+                    )
+                    continue
+
+                ready_events.append(event)
+                ready_event_ids.add(event.id)
+
+        return ready_events
+
+    def held_back(self, event: RedisStreamEvent) -> bool:
+        return not self.events_not_held_back([event])
+
+    def hold_back_key(self, event: RedisStreamEvent) -> None:
+        """
+        Holds back the following events with the partition key of the failed event
+        """
+        with self.held_event_ids_lock:
+            self.held_event_ids.setdefault(self.partition_key(event), set()).add(
+                event.id
+            )
+
+    def release_held_events(self, events: Iterable[RedisStreamEvent]) -> None:
+        """
+        Stops holding back the events that were processed or dead-lettered
+        """
+        if not self.held_event_ids:
+            return
+
+        with self.held_event_ids_lock:
+            for event in events:
+                partition_key = self.partition_key(event)
+                held_event_ids = self.held_event_ids.get(partition_key)
+                if held_event_ids is None:
+                    continue
+                held_event_ids.discard(event.id)
+                if not held_event_ids:
+                    del self.held_event_ids[partition_key]
+
+
+class Consumer(ConsumerBase):
+    """
+    Redis consumer for streams, based on redis clients with protocol 3 and decoded responses
+    """
+
+    def init(self):
+        try:
+            reply = self.redis_client.xgroup_create(
+                self.stream_name,
+                self.consumer_group_name,
+                self.consumer_group_start_id,
+                mkstream=True,
+            )
+            self.consumer_group_created(reply)
+        except ResponseError as e:
+            self.consumer_group_not_created(e)
+
+    def read_from_consumer_group(
+        self, event_id_cursor: str, event_count: int, block_ms: int | None = None
+    ):
+        return self.redis_client.xreadgroup(
+            **self.xreadgroup_kwargs(event_id_cursor, event_count, block_ms)
+        )
+
+    def read_events(
+        self, event_count: int | None = None
+    ) -> Generator[RedisStreamEvent, None, None]:
+        event_count = event_count or self.batch_size
+
+        if self.claim_is_due():
+            claimed_events = self.claimed_events(
+                self.redis_client.xautoclaim(
+                    self.stream_name,
+                    self.consumer_group_name,
+                    self.consumer_name,
+                    self.claim_min_idle_ms,
+                    count=event_count,
+                ),
+                event_count,
+            )
+            if claimed_events:
+                yield from self.quarantine_poison_events(
+                    self.events_in_key_range(claimed_events)
                 )
-                for raw_event in response[self.stream_name][0]:
-                    yield Consumer.get_event_from_redis_decoded_format(raw_event)
+                # focus on idle pending messages first - do not process any other messages
+                return
 
-        else:
-            self.check_pending_messages = False
+        reading_pending_events = self.check_pending_messages
+        event_id_cursor, block_ms = self.next_read()
+        events = self.events_in_key_range(
+            self.events_read(
+                self.read_from_consumer_group(event_id_cursor, event_count, block_ms)
+            )
+        )
+        if reading_pending_events:
+            # new events are delivered for the first time - only pending ones can be poison
+            events = self.quarantine_poison_events(events)
+        yield from events
+
+    def events_in_key_range(
+        self, events: list[RedisStreamEvent]
+    ) -> list[RedisStreamEvent]:
+        """
+        Confirms the events of other key ranges (see key_range), which are processed by the
+        consumer groups of those ranges, and returns the others
+        """
+        events, other_events = self.split_key_range(events)
+        if other_events:
+            self.redis_client.xack(
+                self.stream_name,
+                self.consumer_group_name,
+                *(event.id for event in other_events),
+            )
+        return events
+
+    def quarantine_poison_events(
+        self, events: list[RedisStreamEvent]
+    ) -> list[RedisStreamEvent]:
+        """
+        Moves the events that failed and were delivered more than max_deliveries times to the
+        dead-letter stream, with the failure, and returns the other events. Events that were only
+        delivered again without failing (e.g. left pending after a failure of a previous event with
+        the same partition key) are not moved
+        """
+        if self.max_deliveries is None or not events:
+            return events
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        self.queue_delivery_checks(pipeline, events)
+        poison_events, healthy_events = self.split_poison_events(
+            events, pipeline.execute()
+        )
+
+        if poison_events:
+            self.move_to_dead_letter_stream(poison_events)
+
+        return healthy_events
+
+    def move_to_dead_letter_stream(
+        self, poison_events: list[tuple[RedisStreamEvent, int, str]]
+    ) -> None:
+        # added and confirmed atomically, so an event is never lost nor left in both streams
+        pipeline = self.redis_client.pipeline(transaction=True)
+        self.queue_dead_letter(pipeline, poison_events)
+        pipeline.execute()
+        self.poison_events_dead_lettered(poison_events)
+
+    def record_failure(self, event: RedisStreamEvent, error: Exception) -> None:
+        if self.max_deliveries is None:
             return
 
+        try:
+            self.redis_client.set(
+                self.failure_key(event.id),
+                self.failure_description(error),
+                ex=FAILURE_TTL_SECONDS,
+            )
+        except RedisError:
+            logging.warning(
+                "failed to record the failure of event %s", event.id, exc_info=True
+            )
+
     def confirm_event_processed(self, event_id: str) -> None:
         self.redis_client.xack(self.stream_name, self.consumer_group_name, event_id)
+        self.metrics.events_confirmed(1)
         logging.info("Sucessfully processed order event with redis ID %s", event_id)
 
+    def confirm_events_processed(self, event_ids: list[str]) -> None:
+        # a single XACK for all the events
+        self.redis_client.xack(self.stream_name, self.consumer_group_name, *event_ids)
+        self.metrics.events_confirmed(len(event_ids))
+        logging.info("Sucessfully processed %s events", len(event_ids))
+
     def process_events(self):
-        events = self.read_events()
-        for event in events:
+        """
+        Processes and confirms the events read one by one. As in process_partition, a failure only
+        holds back the following events with the same partition key (see events_not_held_back) -
+        the other events are not left pending behind it until it is dead-lettered
+        """
+        for event in self.read_events():
+            if self.held_back(event):
+                continue
+
             logging.debug("processing event %s", event.id)
-            event_id = self.process_event(event)
+            started = time.perf_counter()
+            try:
+                event_id = self.process_event(event)
+            except Exception as e:
+                self.record_failure(event, e)
+                logging.exception("failed to process event %s", event.id)
+                self.hold_back_key(event)
+                continue
+            self.metrics.observe_processing(time.perf_counter() - started)
+            self.release_held_events([event])
             self.confirm_event_processed(event_id)
 
+    def process_events_in_batch(self):
+        """
+        Batch mode of process_events - the events read are processed together by process_batch
+        and confirmed with a single round trip. If process_batch raises, none of the events are
+        confirmed (they remain pending and will be processed again)
+        """
+        events = list(self.read_events())
+        if not events:
+            return
+
+        logging.debug("processing batch of %s events", len(events))
+        started = time.perf_counter()
+        event_ids = self.process_batch(events)
+        self.metrics.observe_processing(time.perf_counter() - started, len(events))
+        if event_ids:
+            self.confirm_events_processed(event_ids)
+
+    def process_batch(self, events: list[RedisStreamEvent]) -> list[str]:
+        """
+        Processes a batch of events and returns the IDs of the ones to confirm. Processes events one
+        by one by default (see process_partition), subclasses can override this to process them
+        together
+        """
+        return self.process_partition(events)
+
+    def process_partition(self, events: list[RedisStreamEvent]) -> list[str]:
+        """
+        Processes events that share partition keys (see ConsumerSupervisor), in order, and returns
+        the IDs of the ones to confirm. After a failure, the following events with the same
+        partition key are skipped, in this batch and the next ones, as they may depend on the failed
+        one - they are left pending as well, to be claimed after being idle (see
+        events_not_held_back). Events with other keys are still processed
+        """
+        processed_event_ids = []
+        for event in events:
+            if self.held_back(event):
+                continue
+
+            try:
+                processed_event_ids.append(self.process_event(event))
+            except Exception as e:
+                self.record_failure(event, e)
+                logging.exception("failed to process event %s", event.id)
+                self.hold_back_key(event)
+                continue
+            self.release_held_events([event])
+
+        return processed_event_ids
+
     def process_event(self, event: RedisStreamEvent) -> str:
         raise NotImplementedError
 
 
 class RedisDebeziumStreamConsumer(Consumer):
 
+    # the fields of the changed rows that the consumer uses - only these are decoded. all if None
+    event_fields: tuple[str, ...] | None = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.decoder = DebeziumEventDecoder(self.event_fields)
+
+    def partition_key(self, event: RedisStreamEvent) -> str:
+        # debezium events are stored with the key of the changed row (its primary key) as field name
+        return next(iter(event.payload))
+
     def process_event(self, event: RedisStreamEvent) -> str:
-        debezium_event = DebeziumRedisEvent.from_redis_stream_event(event)
+        debezium_event = self.decoder.decode(self.stream_name, event)
         return self.process_change_event(debezium_event)
 
     def process_change_event(self, event: DebeziumRedisEvent) -> str:
@@ -0,0 +1,111 @@
+import argparse
+import logging
+import os
+
+import redis
+
+from store_async_jobs.consumer import DEAD_LETTER_FIELD_PREFIX
+
+
+def replay_dead_letter_events(
+    redis_client: redis.Redis,
+    dead_letter_stream_name: str,
+    event_ids: list[str] | None = None,
+    count: int | None = None,
+) -> list[str]:
+    """
+    Adds the events of a dead-letter stream (see Consumer.quarantine_poison_events) back to the
+    streams they were moved from, without the dead-letter fields, and deletes them from the
+    dead-letter stream. Replayed events get new IDs, so they are delivered as new events to all the
+    consumer groups of the stream.
+
+    :param event_ids: IDs (in the dead-letter stream) of the events to replay. All if not given
+    :param count: max number of events to replay, oldest first
+    :return: IDs (in the dead-letter stream) of the replayed events
+    """
+    if event_ids:
+        entries = [
+            entry
+            for event_id in event_ids
+            for entry in redis_client.xrange(
+                dead_letter_stream_name, event_id, event_id
+            )
+        ][:count]
+    else:
+        entries = redis_client.xrange(dead_letter_stream_name, count=count)
+
+    if not entries:
+        return []
+
+    # added back and deleted atomically, so an event is never replayed twice nor lost
+    pipeline = redis_client.pipeline(transaction=True)
+    for _, fields in entries:
+        original_fields = {
+            name: value
+            for name, value in fields.items()
+            if not name.startswith(DEAD_LETTER_FIELD_PREFIX)
+        }
+        pipeline.xadd(fields[f"{DEAD_LETTER_FIELD_PREFIX}stream"], original_fields)
+    pipeline.xdel(dead_letter_stream_name, *(entry_id for entry_id, _ in entries))
+    pipeline.execute()
+
+    for entry_id, fields in entries:
+        logging.info(
+            "replayed event %s (%s of %s) to %s",
+            entry_id,
+            fields[f"{DEAD_LETTER_FIELD_PREFIX}event_id"],
+            fields[f"{DEAD_LETTER_FIELD_PREFIX}group"],
+            fields[f"{DEAD_LETTER_FIELD_PREFIX}stream"],
+        )
+
+    return [entry_id for entry_id, _ in entries]
+
+
+def start():
+    argparser = argparse.ArgumentParser(
+        prog="dead-letter replay",
+        description="Adds events moved to a dead-letter stream back to their original stream",
+    )
+    argparser.add_argument(
+        "-l",
+        "--log-level",
+        choices=[
+            logging.getLevelName(logging.ERROR),
+            logging.getLevelName(logging.WARN),
+            logging.getLevelName(logging.INFO),
+            logging.getLevelName(logging.DEBUG),
+        ],
+        default=logging.INFO,
+    )
+    argparser.add_argument(
+        "dead_letter_stream",
+        help="e.g. store.public.store_api_order:dead-letter",
+    )
+    argparser.add_argument(
+        "--ids",
+        nargs="+",
+        help="IDs of the events (in the dead-letter stream) to replay. all if not given",
+    )
+    argparser.add_argument(
+        "-c",
+        "--count",
+        type=int,
+        help="max number of events to replay, oldest first",
+    )
+
+    args = argparser.parse_args()
+    logging.basicConfig(level=args.log_level)
+
+    redis_host = os.environ["REDIS_HOST"]
+    redis_client = redis.Redis(redis_host, decode_responses=True, protocol=3)
+
+    replayed_ids = replay_dead_letter_events(
+        redis_client, args.dead_letter_stream, event_ids=args.ids, count=args.count
+    )
+    logging.info(
+        "replayed %s events from %s", len(replayed_ids), args.dead_letter_stream
+    )
+
+
+if __name__ == "__main__":
+    start()
@@ -2,45 +2,129 @@ import argparse
 import logging
 import os
 from datetime import datetime, timedelta, timezone
+from uuid import UUID
 
 from apscheduler.schedulers.background import BlockingScheduler
-from django.db import transaction
+from django.db import connection, transaction
 
+# restores the stock of the line items of the given orders in a single statement, with the quantities
+# aggregated per product variant. stock rows are locked in a consistent order to avoid deadlocks
+# between concurrent reverts
+RESTORE_ORDERS_STOCK_SQL = """
+WITH reverted AS (
+    SELECT product_id, variant, SUM(quantity) AS quantity
+    FROM store_api_orderlineitem
+    WHERE order_id = ANY(%(order_ids)s::uuid[])
+    GROUP BY product_id, variant
+), locked AS (
+    SELECT s.id, reverted.quantity
+    FROM store_api_productstock s
+    JOIN reverted ON reverted.product_id = s.product_id AND reverted.variant = s.variant
+    ORDER BY s.product_id, s.variant
+    FOR UPDATE OF s
+)
+UPDATE store_api_productstock s
+SET available = s.available + locked.quantity
+FROM locked
+WHERE s.id = locked.id
+"""
 
-def cancel_elapsed_unconfirmed_orders(confirmation_max_duration_seconds: int):
-    # this allows django to be configured first, before loading the models module which requires such config
-    from store_api.models import Order
 
+def cancel_elapsed_unconfirmed_orders(
+    confirmation_max_duration_seconds: int, chunk_size: int = 1000
+):
     logging.debug("Querying for orders to be cancelled...")
     now_utc = datetime.now(timezone.utc)
     to_confirm_threshold_time = now_utc - timedelta(
-        seconds=confirmation_max_duration_seconds + 1
+        seconds=confirmation_max_duration_seconds
+    )
+
+    # each chunk is reverted in its own (short) transaction, so locks are not held for the whole backlog
+    while True:
+        with transaction.atomic():
+            order_ids = revert_pending_orders(to_confirm_threshold_time, chunk_size)
+
+        if order_ids:
+            logging.info(f"cancelled {len(order_ids)} orders")
+        if len(order_ids) < chunk_size:
+            break
+
+
+def revert_pending_orders(created_before: datetime, limit: int) -> list[UUID]:
+    """
+    Reverts up to `limit` pending orders created before the given time, restoring their stock.
+    Set-based alternative to Order.revert - must run in a transaction.
+
+    Orders locked by others (e.g. being confirmed) are skipped - they will either not be pending
+    anymore or be picked by a later run
+    """
+    # this allows django to be configured first, before loading the models module which requires such config
+    from store_api.models import Order, OrderOutboxEvent
+
+    order_ids = list(
+        Order.objects.filter(state=Order.States.PENDING, created__lte=created_before)
+        .order_by("created")
+        .select_for_update(skip_locked=True)
+        .values_list("id", flat=True)[:limit]
+    )
+    if not order_ids:
+        return order_ids
+
+    with connection.cursor() as cursor:
+        cursor.execute(RESTORE_ORDERS_STOCK_SQL, {"order_ids": order_ids})
+
+    # the orders are locked and known to be pending, which is what the state transition would check
+    Order.objects.filter(id__in=order_ids).update(
+        state=Order.States.REVERTED, updated=datetime.now(timezone.utc)
     )
-    orders_to_cancel = (
-        Order.objects.prefetch_related("orderlineitem_set")
-        .filter(state=Order.States.PENDING)
-        .filter(created__lte=to_confirm_threshold_time)
-        .select_for_update()
+    OrderOutboxEvent.objects.bulk_create(
+        [
+            OrderOutboxEvent(
+                order_id=order_id,
+                from_state=Order.States.PENDING,
+                to_state=Order.States.REVERTED,
+            )
+            for order_id in order_ids
+        ]
     )
 
-    with transaction.atomic():
-        for order in orders_to_cancel:
-            order.revert()
-            order.save()
-            logging.info(f"cancelled order {order.id}")
+    return order_ids
 
 
-def start(confirmation_max_duration_seconds: int, interval_seconds: int):
+def rebalance_sharded_stock():
+    # this allows django to be configured first, before loading the models module which requires such config
+    from store_api.models import ProductStock
+
+    for stock in ProductStock.objects.filter(shards__gt=0).only("id"):
+        # each variant is rebalanced in its own transaction, to lock its shards briefly
+        with transaction.atomic():
+            if stock.rebalance_shards():
+                logging.debug(f"rebalanced shards of stock {stock.id}")
+
+
+def start(
+    confirmation_max_duration_seconds: int,
+    interval_seconds: int,
+    chunk_size: int,
+    rebalance_interval_seconds: int,
+):
     scheduler = BlockingScheduler()
     scheduler.add_job(
         cancel_elapsed_unconfirmed_orders,
-        args=[confirmation_max_duration_seconds],
+        args=[confirmation_max_duration_seconds, chunk_size],
         trigger="interval",
         seconds=interval_seconds,
         coalesce=True,
         max_instances=1,
         next_run_time=datetime.now(timezone.utc),
     )
+    scheduler.add_job(
+        rebalance_sharded_stock,
+        trigger="interval",
+        seconds=rebalance_interval_seconds,
+        coalesce=True,
+        max_instances=1,
+    )
 
     logging.debug("starting scheduler...")
     print("starting!!!")
@@ -67,14 +151,25 @@ if __name__ == "__main__":
     args = argparser.parse_args()
     logging.root.setLevel(args.log_level)
 
-    confirmation_max_duration_seconds = os.getenv(
-        "JOB_ORDER_CANCEL_PENDING_ORDERS_TIME_SECONDS", 30
+    confirmation_max_duration_seconds = int(
+        os.getenv("JOB_ORDER_CANCEL_PENDING_ORDERS_TIME_SECONDS", 30)
+    )
+    interval_seconds = int(
+        os.getenv("JOB_ORDER_CANCEL_PENDING_ORDERS_INTERVAL_SECONDS", 5)
+    )
+    chunk_size = int(os.getenv("JOB_ORDER_CANCEL_PENDING_ORDERS_CHUNK_SIZE", 1000))
+    rebalance_interval_seconds = int(
+        os.getenv("JOB_REBALANCE_STOCK_SHARDS_INTERVAL_SECONDS", 10)
     )
-    interval_seconds = os.getenv("JOB_ORDER_CANCEL_PENDING_ORDERS_INTERVAL_SECONDS", 5)
 
     os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_api.settings")
     import django
 
     django.setup()
 
-    start(confirmation_max_duration_seconds, interval_seconds)
+    start(
+        confirmation_max_duration_seconds,
+        interval_seconds,
+        chunk_size,
+        rebalance_interval_seconds,
+    )
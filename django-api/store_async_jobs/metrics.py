@@ -0,0 +1,241 @@
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable
+
+from redis import Redis
+from redis.exceptions import RedisError
+
+# seconds per event - from events that only touch redis to events that run slow DB transactions
+PROCESSING_SECONDS_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# name: (type, help)
+METRICS = {
+    "store_consumer_events_processed_total": (
+        "counter",
+        "Events processed and confirmed by the consumer",
+    ),
+    "store_consumer_events_claimed_total": (
+        "counter",
+        "Idle pending events of other consumers claimed by the consumer",
+    ),
+    "store_consumer_events_dead_lettered_total": (
+        "counter",
+        "Events that kept failing, moved to the dead-letter stream by the consumer",
+    ),
+    "store_consumer_event_processing_seconds": (
+        "histogram",
+        "Time to process an event. Events processed together share the time of their batch",
+    ),
+    "store_consumer_group_pending_events": (
+        "gauge",
+        "Events delivered to the consumer group that are not confirmed yet (pending entries list)",
+    ),
+    "store_consumer_group_lag": (
+        "gauge",
+        "Events in the stream not delivered to the consumer group yet",
+    ),
+}
+
+
+class ConsumerMetrics:
+    """
+    Metrics of a stream consumer, exposed in the prometheus text format (see start_metrics_server).
+
+    Counters and the processing time histogram are kept in memory and updated by the consumer - an
+    update is a lock and a few additions, once per event or batch. The state of the consumer group
+    (pending events and lag) is read from redis with XINFO GROUPS when the metrics are scraped, so
+    it costs nothing to the consumer.
+    Events per second are the rate of store_consumer_events_processed_total
+    """
+
+    def __init__(
+        self,
+        redis_client: Redis | None,
+        stream_name: str,
+        consumer_group_name: str,
+        consumer_name: str,
+        buckets: tuple[float, ...] = PROCESSING_SECONDS_BUCKETS,
+    ):
+        self.redis_client = redis_client
+        self.stream_name = stream_name
+        self.consumer_group_name = consumer_group_name
+        self.consumer_name = consumer_name
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.events_processed = 0
+        self.events_claimed = 0
+        self.events_dead_lettered = 0
+        # the last count is for events slower than the largest bucket (+Inf)
+        self.processing_bucket_counts = [0] * (len(buckets) + 1)
+        self.processing_seconds_sum = 0.0
+
+    def events_confirmed(self, event_count: int) -> None:
+        with self.lock:
+            self.events_processed += event_count
+
+    def idle_events_claimed(self, event_count: int) -> None:
+        with self.lock:
+            self.events_claimed += event_count
+
+    def poison_events_dead_lettered(self, event_count: int) -> None:
+        with self.lock:
+            self.events_dead_lettered += event_count
+
+    def observe_processing(self, seconds: float, event_count: int = 1) -> None:
+        """
+        Records the time taken to process `event_count` events together - each one is observed
+        with an even share of it
+        """
+        if event_count <= 0:
+            return
+
+        bucket = bisect.bisect_left(self.buckets, seconds / event_count)
+        with self.lock:
+            self.processing_bucket_counts[bucket] += event_count
+            self.processing_seconds_sum += seconds
+
+    def samples(self) -> Iterable[tuple[str, dict[str, str], float]]:
+        """
+        :return: (metric name, labels, value) of each sample
+        """
+        labels = {
+            "stream": self.stream_name,
+            "group": self.consumer_group_name,
+            "consumer": self.consumer_name,
+        }
+        with self.lock:
+            events_processed = self.events_processed
+            events_claimed = self.events_claimed
+            events_dead_lettered = self.events_dead_lettered
+            bucket_counts = list(self.processing_bucket_counts)
+            seconds_sum = self.processing_seconds_sum
+
+        yield "store_consumer_events_processed_total", labels, events_processed
+        yield "store_consumer_events_claimed_total", labels, events_claimed
+        yield "store_consumer_events_dead_lettered_total", labels, events_dead_lettered
+
+        cumulative_count = 0
+        for bound, count in zip(self.buckets + (float("inf"),), bucket_counts):
+            cumulative_count += count
+            yield "store_consumer_event_processing_seconds_bucket", {
+                **labels,
+                "le": format_value(bound),
+            }, cumulative_count
+        yield "store_consumer_event_processing_seconds_sum", labels, seconds_sum
+        yield "store_consumer_event_processing_seconds_count", labels, cumulative_count
+
+        group = self.group_info()
+        if group is not None:
+            group_labels = {
+                "stream": self.stream_name,
+                "group": self.consumer_group_name,
+            }
+            yield "store_consumer_group_pending_events", group_labels, group["pending"]
+            # redis can not always tell the lag (e.g. after entries were deleted from the stream)
+            if group.get("lag") is not None:
+                yield "store_consumer_group_lag", group_labels, group["lag"]
+
+    def group_info(self) -> dict | None:
+        # without a (sync) redis client, e.g. for asyncio consumers, only the counters are exposed
+        if self.redis_client is None:
+            return None
+
+        try:
+            groups = self.redis_client.xinfo_groups(self.stream_name)
+        except RedisError:
+            logging.warning(
+                "failed to read consumer groups of %s", self.stream_name, exc_info=True
+            )
+            return None
+
+        return next(
+            (group for group in groups if group["name"] == self.consumer_group_name),
+            None,
+        )
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in labels.items()
+    )
+    return ",".join(f'{name}="{value}"' for name, value in escaped)
+
+
+def render_metrics(consumers_metrics: Iterable[ConsumerMetrics]) -> str:
+    """
+    Renders the metrics of the given consumers in the prometheus text format - the samples of each
+    metric are grouped after its HELP and TYPE
+    """
+    samples_by_metric = {name: [] for name in METRICS}
+    for metrics in consumers_metrics:
+        for sample_name, labels, value in metrics.samples():
+            metric_name = next(name for name in METRICS if sample_name.startswith(name))
+            samples_by_metric[metric_name].append(
+                f"{sample_name}{{{format_labels(labels)}}} {format_value(value)}"
+            )
+
+    lines = []
+    for name, samples in samples_by_metric.items():
+        type, help = METRICS[name]
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {type}")
+        lines.extend(samples)
+
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(
+    port: int, consumers_metrics: list[ConsumerMetrics], host: str = ""
+) -> ThreadingHTTPServer:
+    """
+    Serves the metrics of the given consumers on http://<host>:<port>/metrics, from a daemon thread
+    """
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = render_metrics(consumers_metrics).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug("metrics request - " + format, *args)
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    logging.info("serving consumer metrics on port %s", server.server_address[1])
+
+    return server
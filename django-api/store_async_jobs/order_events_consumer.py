@@ -4,12 +4,36 @@ import os
 import uuid
 
 import redis
-
-from store_async_jobs.consumer import DebeziumRedisEvent, RedisDebeziumStreamConsumer
+from django.db import connection, transaction
+
+from store_async_jobs.consumer import (
+    Consumer,
+    DebeziumRedisEvent,
+    RedisDebeziumStreamConsumer,
+    RedisStreamEvent,
+)
+from store_async_jobs.metrics import start_metrics_server
+from store_async_jobs.order_outbox_relay import ORDER_EVENTS_STREAM
+from store_async_jobs.supervisor import (
+    ConsumerSupervisor,
+    derive_consumer_name,
+    key_range_group_name,
+    parse_key_range,
+)
+
+# the payment of confirmed orders. applied straight to the orders in the events, instead of fetching
+# them and going through Order.process_payment - the state guard is what the transition checks
+PAY_CONFIRMED_ORDERS_SQL = """
+UPDATE store_api_order SET state = 'PAID', updated = now()
+WHERE id = ANY(%(order_ids)s::uuid[]) AND state = 'CONFIRMED'
+RETURNING id
+"""
 
 
 class OrderEventConsumer(RedisDebeziumStreamConsumer):
 
+    event_fields = ("id", "state")
+
     def process_change_event(self, event: DebeziumRedisEvent) -> str:
         from store_api.models import Order
 
@@ -20,9 +44,10 @@ class OrderEventConsumer(RedisDebeziumStreamConsumer):
             case (Order.States.PENDING, Order.States.CONFIRMED):
                 order_id = uuid.UUID(event.after["id"])
                 try:
-                    order = Order.objects.select_for_update().get(id=order_id)
-                    order.process_payment()
-                    order.save()
+                    with transaction.atomic():
+                        order = Order.objects.select_for_update().get(id=order_id)
+                        order.process_payment()
+                        order.save()
                 except Order.DoesNotExist:
                     logging.warning(
                         "Order %s from event %s was not found. Ignoring...",
@@ -41,6 +66,81 @@ class OrderEventConsumer(RedisDebeziumStreamConsumer):
         return event.id
 
 
+class OrderOutboxEventConsumer(Consumer):
+    """
+    Processes the order events published by the outbox relay (see
+    store_async_jobs.order_outbox_relay). Events are flat stream entries with the order state
+    change, so there is no JSON to parse and no need to fetch the orders - a batch of events is
+    processed with one statement per kind of change
+    """
+
+    def partition_key(self, event: RedisStreamEvent) -> str:
+        return event.payload["order_id"]
+
+    def process_event(self, event: RedisStreamEvent) -> str:
+        self.process_events_together([event])
+        return event.id
+
+    def process_batch(self, events: list[RedisStreamEvent]) -> list[str]:
+        return self.process_partition(events)
+
+    def process_partition(self, events: list[RedisStreamEvent]) -> list[str]:
+        # events of orders with a failed event pending are left pending as well
+        events = self.events_not_held_back(events)
+        if not events:
+            return []
+
+        try:
+            self.process_events_together(events)
+        except Exception:
+            # nothing was applied - process them one by one to isolate the failing events: only
+            # the events of their orders are left pending
+            if len(events) > 1:
+                logging.exception(
+                    "failed to process %s events together, processing them one by one",
+                    len(events),
+                )
+            return super().process_partition(events)
+
+        self.release_held_events(events)
+        return [event.id for event in events]
+
+    def process_events_together(self, events: list[RedisStreamEvent]) -> None:
+        from store_api.models import Order
+
+        confirmed_order_ids = [
+            event.payload["order_id"]
+            for event in events
+            if event.payload["to_state"] == Order.States.CONFIRMED
+        ]
+
+        with transaction.atomic():
+            self.pay_orders(confirmed_order_ids)
+
+    def pay_orders(self, order_ids: list[str]):
+        from store_api.models import Order, OrderOutboxEvent
+
+        if not order_ids:
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(PAY_CONFIRMED_ORDERS_SQL, {"order_ids": order_ids})
+            paid_order_ids = [order_id for (order_id,) in cursor.fetchall()]
+
+        # orders that were not confirmed anymore (e.g. events processed again) are ignored
+        OrderOutboxEvent.objects.bulk_create(
+            [
+                OrderOutboxEvent(
+                    order_id=order_id,
+                    from_state=Order.States.CONFIRMED,
+                    to_state=Order.States.PAID,
+                )
+                for order_id in paid_order_ids
+            ]
+        )
+        logging.debug("processed payment of orders %s", paid_order_ids)
+
+
 def start():
     argparser = argparse.ArgumentParser(
         prog="store background jobs",
@@ -58,6 +158,38 @@ def start():
         default=logging.INFO,
     )
 
+    argparser.add_argument(
+        "-s",
+        "--source",
+        choices=["outbox", "cdc"],
+        default=os.getenv("ORDER_CONSUMER_SOURCE", "outbox"),
+        help="consume the order events published from the outbox, or the debezium change events of the orders table",
+    )
+
+    argparser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=int(os.getenv("ORDER_CONSUMER_WORKERS", 1)),
+        help="number of threads processing events. events of the same order are processed in order",
+    )
+
+    argparser.add_argument(
+        "-k",
+        "--key-range",
+        type=parse_key_range,
+        default=os.getenv("ORDER_CONSUMER_KEY_RANGE"),
+        help="<index>/<count> - the range of order keys of the replica, when running several replicas. each range is consumed by its own consumer group",
+    )
+
+    argparser.add_argument(
+        "-m",
+        "--metrics-port",
+        type=int,
+        default=int(os.getenv("CONSUMER_METRICS_PORT", 0)),
+        help="port to serve prometheus metrics on (/metrics). not served if 0",
+    )
+
     args = argparser.parse_args()
     logging.root.setLevel(args.log_level)
 
@@ -70,19 +202,42 @@ def start():
     redis_host = os.environ["REDIS_HOST"]
     redis_client = redis.Redis(redis_host, decode_responses=True, protocol=3)
 
-    consumer = OrderEventConsumer(
+    if args.source == "outbox":
+        consumer_class = OrderOutboxEventConsumer
+        stream_name = ORDER_EVENTS_STREAM
+        consumer_group_name = "store_consumer_order_outbox"
+    else:
+        consumer_class = OrderEventConsumer
+        stream_name = "store.public.store_api_order"
+        consumer_group_name = "store_consumer_order"
+
+    if args.key_range:
+        # the events of an order are all read by the replica of its key range
+        consumer_group_name = key_range_group_name(consumer_group_name, args.key_range)
+
+    consumer = consumer_class(
         redis_client=redis_client,
-        stream_name="store.public.store_api_order",
-        consumer_group_name="store_consumer_order",
-        # this would be based on HOST or POD NAME or something else to be unique
-        consumer_name="order-consumer",
+        stream_name=stream_name,
+        consumer_group_name=consumer_group_name,
+        consumer_name=derive_consumer_name("order-consumer"),
         # process all messages from the stream, not just new ones
         consumer_group_start_id="0",
+        batch_size=int(os.getenv("ORDER_CONSUMER_BATCH_SIZE", 10)),
+        # waits for new events in redis instead of polling for them
+        block_ms=int(os.getenv("ORDER_CONSUMER_BLOCK_MS", 5000)),
+        claim_interval_seconds=float(
+            os.getenv("ORDER_CONSUMER_CLAIM_INTERVAL_SECONDS", 30)
+        ),
+        # events that keep failing are moved to the <stream>:dead-letter stream
+        max_deliveries=int(os.getenv("ORDER_CONSUMER_MAX_DELIVERIES", 5)),
+        key_range=args.key_range,
     )
     consumer.init()
 
-    while True:
-        consumer.process_events()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port, [consumer.metrics])
+
+    ConsumerSupervisor(consumer, workers=args.workers).run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+import argparse
+import logging
+import os
+import time
+
+import redis
+from django.db import transaction
+
+ORDER_EVENTS_STREAM = "store.order_events"
+
+
+class OrderOutboxRelay:
+    """
+    Publishes the order events stored in the outbox (store_api.models.OrderOutboxEvent) to a redis
+    stream, in batches - each batch is read, published with a single round trip (pipeline) and
+    deleted from the outbox in one transaction.
+
+    Delivery is at least once: if the transaction fails after publishing, the batch is published
+    again. Events of the same order are published in the order they were stored as long as a single
+    relay is running
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        stream_name: str = ORDER_EVENTS_STREAM,
+        batch_size: int = 500,
+    ):
+        self.redis_client = redis_client
+        self.stream_name = stream_name
+        self.batch_size = batch_size
+
+    def relay_events(self) -> int:
+        """
+        :return: number of events published
+        """
+        from store_api.models import OrderOutboxEvent
+
+        with transaction.atomic():
+            events = list(
+                OrderOutboxEvent.objects.select_for_update(skip_locked=True).order_by(
+                    "id"
+                )[: self.batch_size]
+            )
+            if not events:
+                return 0
+
+            pipeline = self.redis_client.pipeline(transaction=False)
+            for event in events:
+                pipeline.xadd(self.stream_name, event.to_stream_fields())
+            pipeline.execute()
+
+            OrderOutboxEvent.objects.filter(
+                id__in=[event.id for event in events]
+            ).delete()
+
+        logging.debug("published %s order events", len(events))
+        return len(events)
+
+
+def start():
+    argparser = argparse.ArgumentParser(
+        prog="order outbox relay",
+        description="Application that publishes order events from the outbox table to redis",
+    )
+    argparser.add_argument(
+        "-l",
+        "--log-level",
+        choices=[
+            logging.getLevelName(logging.ERROR),
+            logging.getLevelName(logging.WARN),
+            logging.getLevelName(logging.INFO),
+            logging.getLevelName(logging.DEBUG),
+        ],
+        default=logging.INFO,
+    )
+
+    args = argparser.parse_args()
+    logging.root.setLevel(args.log_level)
+
+    # start process
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_api.settings")
+    import django
+
+    django.setup()
+
+    redis_host = os.environ["REDIS_HOST"]
+    redis_client = redis.Redis(redis_host, decode_responses=True, protocol=3)
+
+    relay = OrderOutboxRelay(
+        redis_client,
+        batch_size=int(os.getenv("ORDER_OUTBOX_RELAY_BATCH_SIZE", 500)),
+    )
+    poll_interval_seconds = float(
+        os.getenv("ORDER_OUTBOX_RELAY_POLL_INTERVAL_SECONDS", 0.1)
+    )
+
+    while True:
+        # only waits when the outbox was drained
+        if relay.relay_events() < relay.batch_size:
+            time.sleep(poll_interval_seconds)
+
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,199 @@
+import argparse
+import logging
+import os
+import signal
+import threading
+
+import redis
+
+from store_async_jobs.consumer import DebeziumRedisEvent, RedisDebeziumStreamConsumer
+from store_async_jobs.metrics import start_metrics_server
+from store_async_jobs.supervisor import derive_consumer_name
+
+PRODUCT_STREAM = "store.public.store_api_product"
+PRODUCT_STOCK_STREAM = "store.public.store_api_productstock"
+PRODUCT_STOCK_SHARD_STREAM = "store.public.store_api_productstockshard"
+PRODUCT_TAGS_STREAM = "store.public.store_api_product_tags"
+TAG_STREAM = "store.public.store_api_tag"
+
+# cached list pages do not have the stock of their products (see store_api.cache)
+STOCK_STREAMS = (PRODUCT_STOCK_STREAM, PRODUCT_STOCK_SHARD_STREAM)
+
+
+class ProductCacheInvalidationConsumer(RedisDebeziumStreamConsumer):
+    """
+    Invalidates the cached products (see store_api.cache) affected by changes to products, their
+    stock (and stock shards), their tags and tags themselves. Each instance consumes one of those
+    streams
+    """
+
+    event_fields = ("id", "product_id", "stock_id")
+
+    def __init__(self, product_cache, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.product_cache = product_cache
+
+    def process_change_event(self, event: DebeziumRedisEvent) -> str:
+        product_ids = self.affected_product_ids(event)
+        if product_ids:
+            self.product_cache.invalidate_products(
+                product_ids, lists=self.stream_name not in STOCK_STREAMS
+            )
+            logging.debug(
+                "invalidated cache of products %s from event %s", product_ids, event.id
+            )
+
+        return event.id
+
+    def affected_product_ids(self, event: DebeziumRedisEvent) -> set[str]:
+        # note: without REPLICA IDENTITY FULL, the "before" of updates and deletes only has the primary key.
+        # deleting product stock or tag associations always comes with a product update, though
+        rows = [row for row in (event.before, event.after) if row]
+
+        if self.stream_name == PRODUCT_STREAM:
+            return {row["id"] for row in rows}
+        elif self.stream_name in (PRODUCT_STOCK_STREAM, PRODUCT_TAGS_STREAM):
+            return {row["product_id"] for row in rows if row.get("product_id")}
+        elif self.stream_name == PRODUCT_STOCK_SHARD_STREAM:
+            from store_api.models import ProductStock
+
+            stock_ids = {row["stock_id"] for row in rows if row.get("stock_id")}
+            return {
+                str(product_id)
+                for product_id in ProductStock.objects.filter(
+                    id__in=stock_ids
+                ).values_list("product_id", flat=True)
+            }
+        elif self.stream_name == TAG_STREAM:
+            from store_api.models import Product
+
+            tag_ids = {row["id"] for row in rows}
+            return {
+                str(product_id)
+                for product_id in Product.tags.through.objects.filter(
+                    tag_id__in=tag_ids
+                ).values_list("product_id", flat=True)
+            }
+        else:
+            raise ValueError(f"unexpected stream {self.stream_name}")
+
+
+def start():
+    argparser = argparse.ArgumentParser(
+        prog="product cache invalidation",
+        description="Application that invalidates cached products from DB change events",
+    )
+    argparser.add_argument(
+        "-l",
+        "--log-level",
+        choices=[
+            logging.getLevelName(logging.ERROR),
+            logging.getLevelName(logging.WARN),
+            logging.getLevelName(logging.INFO),
+            logging.getLevelName(logging.DEBUG),
+        ],
+        default=logging.INFO,
+    )
+
+    argparser.add_argument(
+        "-m",
+        "--metrics-port",
+        type=int,
+        default=int(os.getenv("CONSUMER_METRICS_PORT", 0)),
+        help="port to serve prometheus metrics on (/metrics). not served if 0",
+    )
+
+    args = argparser.parse_args()
+    logging.root.setLevel(args.log_level)
+
+    # start process
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_api.settings")
+    import django
+
+    django.setup()
+
+    from store_api.cache import get_product_cache
+
+    redis_host = os.environ["REDIS_HOST"]
+    redis_client = redis.Redis(redis_host, decode_responses=True, protocol=3)
+
+    consumers = [
+        ProductCacheInvalidationConsumer(
+            product_cache=get_product_cache(),
+            redis_client=redis_client,
+            stream_name=stream_name,
+            consumer_group_name="store_consumer_product_cache",
+            # unique per replica, so replicas can share the consumer groups
+            consumer_name=derive_consumer_name("product-cache-consumer"),
+            # cached entries can only be older than the consumer, so only new changes matter
+            consumer_group_start_id="$",
+            # waits for new events in redis instead of polling for them
+            block_ms=int(os.getenv("PRODUCT_CACHE_CONSUMER_BLOCK_MS", 5000)),
+            claim_interval_seconds=float(
+                os.getenv("PRODUCT_CACHE_CONSUMER_CLAIM_INTERVAL_SECONDS", 30)
+            ),
+            # events that keep failing are moved to the <stream>:dead-letter stream
+            max_deliveries=5,
+        )
+        for stream_name in [
+            PRODUCT_STREAM,
+            PRODUCT_STOCK_STREAM,
+            PRODUCT_STOCK_SHARD_STREAM,
+            PRODUCT_TAGS_STREAM,
+            TAG_STREAM,
+        ]
+    ]
+    for consumer in consumers:
+        consumer.init()
+
+    if args.metrics_port:
+        start_metrics_server(
+            args.metrics_port, [consumer.metrics for consumer in consumers]
+        )
+
+    run_consumers(consumers)
+
+
+def run_consumers(consumers: list[ProductCacheInvalidationConsumer]):
+    """
+    Runs each consumer in its own thread, so that each one can block on its stream until there are
+    new events - with a single thread, blocking on one stream would delay the events of the others.
+    Returns on SIGTERM/SIGINT once the events in flight are processed. When a consumer fails, the
+    others are stopped and its error is raised
+    """
+    stopping = threading.Event()
+    failures = []
+
+    def stop(*args):
+        logging.info("stopping product cache consumers...")
+        stopping.set()
+
+    def consume(consumer: ProductCacheInvalidationConsumer):
+        try:
+            while not stopping.is_set():
+                consumer.process_events()
+        except Exception as e:
+            logging.exception("consumer of %s failed", consumer.stream_name)
+            failures.append(e)
+            stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    threads = [
+        threading.Thread(target=consume, args=(consumer,), name=consumer.stream_name)
+        for consumer in consumers
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if failures:
+        # the process exits with an error, to be restarted
+        raise failures[0]
+    logging.info("stopped product cache consumers")
+
+
+if __name__ == "__main__":
+    start()
@@ -0,0 +1,115 @@
+import logging
+import os
+import signal
+import socket
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from store_async_jobs.consumer import Consumer, RedisStreamEvent, partition_key_hash
+
+
+def derive_consumer_name(base_name: str) -> str:
+    """
+    Consumer name that is unique per replica - the host name is unique per container/pod.
+    Can be overridden with the CONSUMER_NAME env var
+    """
+    return os.getenv("CONSUMER_NAME", f"{base_name}-{socket.gethostname()}")
+
+
+def parse_key_range(value: str) -> tuple[int, int]:
+    """
+    :param value: `<index>/<count>` - e.g. `0/3` for the first of 3 key ranges
+    :return: (index, count)
+    """
+    index, count = (int(part) for part in value.split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"invalid key range {value}")
+    return index, count
+
+
+def key_range_group_name(consumer_group_name: str, key_range: tuple[int, int]) -> str:
+    """
+    The consumer group of a key range. Each range is consumed by its own group, with a single
+    consumer, so all the events of a key are read by the same consumer
+    """
+    index, count = key_range
+    return f"{consumer_group_name}:range-{index}-of-{count}"
+
+
+class ConsumerSupervisor:
+    """
+    Runs a consumer and processes each batch of events it reads with a pool of worker threads.
+
+    Events are routed to workers by the consumer partition key (e.g. the id of the changed order),
+    so events with the same key are processed in the order they were read, while events for different
+    keys are processed concurrently. A batch is processed entirely (and confirmed) before the next one
+    is read. A failed event holds back the following events with its key, in the batches after it as
+    well, until it is processed or dead-lettered (see ConsumerBase.events_not_held_back).
+
+    Ordering only holds within a consumer. Replicas that share a consumer group split the events of
+    a key between them - each replica needs its own key range (see ConsumerBase.key_range and
+    key_range_group_name) instead.
+
+    On SIGTERM/SIGINT, the supervisor stops reading and exits after the batch in flight is processed
+    and confirmed
+    """
+
+    def __init__(self, consumer: Consumer, workers: int):
+        self.consumer = consumer
+        self.workers = workers
+        self.stopping = False
+
+    def stop(self, *args):
+        logging.info("stopping consumer %s...", self.consumer.consumer_name)
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix=self.consumer.consumer_name
+        ) as executor:
+            while not self.stopping:
+                self.process_events(executor)
+
+        logging.info("stopped consumer %s", self.consumer.consumer_name)
+
+    def process_events(self, executor: ThreadPoolExecutor):
+        events = list(self.consumer.read_events())
+        if not events:
+            return
+
+        event_ids = self.process_batch(executor, events)
+        if event_ids:
+            self.consumer.confirm_events_processed(event_ids)
+
+    def process_batch(
+        self, executor: ThreadPoolExecutor, events: list[RedisStreamEvent]
+    ) -> list[str]:
+        events_by_worker = defaultdict(list)
+        for event in events:
+            events_by_worker[self.worker_for(event)].append(event)
+
+        futures = [
+            executor.submit(self.process_partition, worker_events)
+            for worker_events in events_by_worker.values()
+        ]
+
+        return [event_id for future in futures for event_id in future.result()]
+
+    def process_partition(self, events: list[RedisStreamEvent]) -> list[str]:
+        started = time.perf_counter()
+        event_ids = self.consumer.process_partition(events)
+        self.consumer.metrics.observe_processing(
+            time.perf_counter() - started, len(events)
+        )
+        return event_ids
+
+    def worker_for(self, event: RedisStreamEvent) -> int:
+        key_hash = partition_key_hash(self.consumer.partition_key(event))
+        # the keys of a key range have the same remainder by the number of ranges - the worker is
+        # picked from the rest of the hash, otherwise some workers would never get events
+        key_ranges = self.consumer.key_range[1] if self.consumer.key_range else 1
+        return key_hash // key_ranges % self.workers
@@ -1,11 +1,21 @@
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+from django.db import connection, transaction
 from django.test import Client
 from django.utils import timezone
 from oauth2_provider.models import AccessToken
 
-from store_api.models import Order, OrderLineItem, Product, User
+from store_api.models import (
+    Order,
+    OrderLineItem,
+    OrderOutboxEvent,
+    Product,
+    ProductStock,
+    User,
+)
 from tests.conftest import OrderFactory, ProductFactory, UserFactory
 
 
@@ -175,12 +185,7 @@ class TestOrder:
         }
 
         # verify no order was made
-        assert (
-            Order.objects.filter(customer=buyer)
-            .filter(products__in=[product1.id, product2.id])
-            .count()
-            == 0
-        )
+        assert not Order.objects.filter(customer=buyer).exists()
 
         # verify stocks have not been modified
         product1.refresh_from_db()
@@ -410,6 +415,100 @@ class TestOrder:
             {"product_id": product.id, "variant": "ss", "available": 0},
         ]
 
+    def test_orders_with_the_same_product_variant_twice_are_a_bad_request(
+        self,
+        api_client: Client,
+        default_user: User,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+    ):
+        seller_user = user_factory.create("user1@user1.com", "user1", "easyPass")
+        product = product_factory.create(
+            owner=seller_user,
+            title="t-shirt",
+            description="cheap and amazing t-shirts",
+            price=1003,
+            available_stock={"x": 2, "m": 5},
+        )
+
+        response = api_client.post(
+            "http://testserver/api/orders/",
+            content_type="application/json",
+            data={
+                "products": [
+                    {"id": str(product.id), "variant": "m", "quantity": 1},
+                    {"id": str(product.id), "variant": "x", "quantity": 1},
+                    {"id": str(product.id), "variant": "m", "quantity": 2},
+                ]
+            },
+            headers={
+                "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+            },
+        )
+        assert response.status_code == 400
+
+        # verify no order was made and no stock was reserved
+        assert not Order.objects.filter(customer=default_user).exists()
+        assert list(
+            product.stock.order_by("variant").values("variant", "available")
+        ) == [{"variant": "m", "available": 5}, {"variant": "x", "available": 2}]
+
+    @pytest.mark.parametrize(
+        "quantities,expected_status,expected_available",
+        [
+            # fits any shard
+            ([1, 2], 201, 3),
+            # needs stock from more than one shard
+            ([4], 201, 2),
+            ([3, 3], 201, 0),
+            ([7], 400, 6),
+        ],
+    )
+    def test_orders_reserve_stock_of_sharded_variants(
+        self,
+        api_client: Client,
+        default_user: User,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+        quantities: list[int],
+        expected_status: int,
+        expected_available: int,
+    ):
+        seller_user = user_factory.create("user1@user1.com", "user1", "easyPass")
+        product = product_factory.create(
+            owner=seller_user,
+            title="t-shirt",
+            description="cheap and amazing t-shirts",
+            price=1003,
+            available_stock={"default": 6},
+        )
+        product.stock.get().set_shards(3)
+
+        for quantity in quantities:
+            response = api_client.post(
+                "http://testserver/api/orders/",
+                content_type="application/json",
+                data={
+                    "products": [
+                        {
+                            "id": str(product.id),
+                            "variant": "default",
+                            "quantity": quantity,
+                        }
+                    ]
+                },
+                headers={
+                    "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+                },
+            )
+            assert response.status_code == expected_status
+
+        stock = ProductStock.objects.with_total_available().get(product=product)
+        assert stock.total_available == expected_available
+        assert stock.shards == 3
+
     def test_users_can_fetch_own_orders(
         self,
         api_client: Client,
@@ -456,7 +555,12 @@ class TestOrder:
         )
         assert response.status_code == 200
 
-        assert response.json() == [
+        assert response.json()["metadata"] == {
+            "page_size": 20,
+            "next_cursor": None,
+            "has_next": False,
+        }
+        assert response.json()["data"] == [
             {
                 "id": str(pending_order.id),
                 "state": "PENDING",
@@ -503,6 +607,52 @@ class TestOrder:
             },
         ]
 
+    def test_users_only_list_own_orders_in_pages(
+        self,
+        api_client: Client,
+        default_user: User,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+        order_factory: OrderFactory,
+    ):
+        seller_user = user_factory.create("user1@user1.com", "user1", "easyPass")
+        other_buyer_user = user_factory.create("user2@user2.com", "user2", "easyPass")
+
+        product = product_factory.create(
+            owner=seller_user,
+            title="t-shirt",
+            description="cheap and amazing t-shirts",
+            price=1003,
+            available_stock={"x": 500},
+        )
+
+        orders = [
+            order_factory.create(default_user, [(product, "x", 1)]) for _ in range(3)
+        ]
+        order_factory.create(other_buyer_user, [(product, "x", 1)])
+
+        def list_orders(query_params: dict) -> dict:
+            response = api_client.get(
+                "http://testserver/api/orders/",
+                query_params=query_params,
+                headers={
+                    "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+                },
+            )
+            assert response.status_code == 200
+            return response.json()
+
+        first_page = list_orders({"page_size": 2})
+        assert [o["id"] for o in first_page["data"]] == [str(o.id) for o in orders[:2]]
+        assert first_page["metadata"]["has_next"] is True
+
+        second_page = list_orders(
+            {"page_size": 2, "cursor": first_page["metadata"]["next_cursor"]}
+        )
+        assert [o["id"] for o in second_page["data"]] == [str(orders[2].id)]
+        assert second_page["metadata"]["has_next"] is False
+
     def test_orders_need_to_be_confirmed_from_pending(
         self,
         api_client: Client,
@@ -547,6 +697,13 @@ class TestOrder:
             ],
         }
 
+        # the confirmation is published through the outbox
+        assert list(
+            OrderOutboxEvent.objects.filter(order=pending_order).values(
+                "from_state", "to_state"
+            )
+        ) == [{"from_state": "PENDING", "to_state": "CONFIRMED"}]
+
     def test_confirming_orders_that_do_not_exist_results_in_not_found_error(
         self,
         api_client: Client,
@@ -653,3 +810,72 @@ class TestOrder:
         assert response.status_code == 400
         order.refresh_from_db()
         assert order.updated == original_update_time
+
+
+def test_concurrent_orders_reserving_from_all_shards_do_not_deadlock(
+    django_db_setup,
+    django_db_blocker,
+    default_user: User,
+    default_user_long_lived_access_token: AccessToken,
+    user_factory: UserFactory,
+    product_factory: ProductFactory,
+):
+    # the orders run in their own threads and transactions, so the test data is committed (and
+    # deleted afterwards) instead of rolled back at the end of the test
+    with django_db_blocker.unblock():
+        seller_user = user_factory.create("user1@user1.com", "user1", "easyPass")
+        product = product_factory.create(
+            owner=seller_user,
+            title="t-shirt",
+            description="cheap and amazing t-shirts",
+            price=1003,
+            available_stock={"default": 80},
+        )
+        with transaction.atomic():
+            product.stock.get().set_shards(8)
+
+        # no shard has 11 available, so every order reserves from all shards
+        ready = threading.Barrier(8)
+
+        def create_order() -> int:
+            ready.wait()
+            try:
+                return (
+                    Client()
+                    .post(
+                        "http://testserver/api/orders/",
+                        content_type="application/json",
+                        data={
+                            "products": [
+                                {
+                                    "id": str(product.id),
+                                    "variant": "default",
+                                    "quantity": 11,
+                                }
+                            ]
+                        },
+                        headers={
+                            "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+                        },
+                    )
+                    .status_code
+                )
+            finally:
+                connection.close()
+
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                futures = [executor.submit(create_order) for _ in range(8)]
+                statuses = sorted(future.result() for future in futures)
+
+            assert statuses == [201] * 7 + [400]
+            stock = ProductStock.objects.with_total_available().get(product=product)
+            assert stock.total_available == 3
+        finally:
+            orders = Order.objects.filter(customer=default_user)
+            OrderLineItem.objects.filter(order__in=orders).delete()
+            orders.delete()
+            product.stock.all().delete()
+            # Product.delete only marks the product as deleted
+            Product.objects.filter(id=product.id).delete()
+            seller_user.delete()
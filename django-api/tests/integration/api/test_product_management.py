@@ -6,7 +6,7 @@ import pytest
 from django.test import Client
 from oauth2_provider.models import AccessToken, Application
 
-from store_api.models import Product, User
+from store_api.models import Product, ProductStock, User
 from tests.conftest import AuthActions, ProductFactory, TagFactory, UserFactory
 
 
@@ -151,6 +151,89 @@ class TestProductManagementAPI:
         assert response.status_code == 401
         assert Product.objects.count() == 0
 
+    def test_get_product(
+        self,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+        tag_factory: TagFactory,
+    ):
+        seller = user_factory.create("user1@user1.com", "user1", "easyPass")
+        tag = tag_factory.create("tag1", "tag1 description")
+        product = product_factory.create(
+            owner=seller,
+            title="t-shirt",
+            description="cheap and amazing t-shirts",
+            price=1003,
+            available_stock={"default": 3, "xl": 1},
+        )
+        product.tags.set([tag])
+
+        response = api_client.get(
+            f"http://testserver/api/products/{str(product.id)}/",
+            headers={
+                "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+            },
+        )
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "id": str(product.id),
+            "owner_user_id": str(seller.id),
+            "title": product.title,
+            "description": product.description,
+            "price": product.price,
+            "stock": {"default": 3, "xl": 1},
+            "tags": [
+                {"id": str(tag.id), "name": tag.name, "description": tag.description}
+            ],
+        }
+
+    def test_get_product_with_sharded_stock(
+        self,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+    ):
+        seller = user_factory.create("user1@user1.com", "user1", "easyPass")
+        product = product_factory.create(
+            owner=seller,
+            title="t-shirt",
+            description="cheap and amazing t-shirts",
+            price=1003,
+            available_stock={"default": 3, "xl": 10},
+        )
+        xl_stock = product.stock.get(variant="xl")
+        xl_stock.set_shards(4)
+        # e.g. stock restored by a reverted order, not yet rebalanced into the shards
+        ProductStock.objects.filter(id=xl_stock.id).update(available=2)
+
+        response = api_client.get(
+            f"http://testserver/api/products/{str(product.id)}/",
+            headers={
+                "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+            },
+        )
+
+        assert response.status_code == 200
+        assert response.json()["stock"] == {"default": 3, "xl": 12}
+
+    def test_get_non_existing_product(
+        self,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+    ):
+        response = api_client.get(
+            f"http://testserver/api/products/{str(uuid.uuid4())}/",
+            headers={
+                "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+            },
+        )
+
+        assert response.status_code == 404
+
     def test_update_product(
         self,
         api_client: Client,
@@ -216,6 +299,11 @@ class TestProductManagementAPI:
             price=new_product_price,
             owner_user=default_user,
         )
+        assert (
+            product_in_db.title,
+            product_in_db.description,
+            product_in_db.price,
+        ) == (new_product_title, new_product_description, new_product_price)
         assert list(product_in_db.stock.all().values("variant", "available")) == [
             {
                 "variant": "default",
@@ -254,6 +342,44 @@ class TestProductManagementAPI:
             },
         ]
 
+    def test_update_product_keeps_variants_sharded(
+        self,
+        api_client: Client,
+        default_user: User,
+        default_user_long_lived_access_token: AccessToken,
+        product_factory: ProductFactory,
+    ):
+        product = product_factory.create(
+            owner=default_user,
+            title="t-shirt",
+            description="cheap and amazing t-shirts",
+            price=1003,
+            available_stock={"default": 3, "xl": 10},
+        )
+        product.stock.get(variant="xl").set_shards(4)
+
+        response = api_client.put(
+            f"http://testserver/api/products/{str(product.id)}/",
+            content_type="application/json",
+            data={
+                "title": product.title,
+                "description": product.description,
+                "price": product.price,
+                "stock": {"default": 3, "xl": 6},
+            },
+            headers={
+                "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+            },
+        )
+
+        assert response.status_code == 200
+        assert response.json()["stock"] == {"default": 3, "xl": 6}
+        xl_stock = product.stock.get(variant="xl")
+        assert xl_stock.shards == 4
+        assert list(
+            xl_stock.shard_set.order_by("shard").values_list("available", flat=True)
+        ) == [2, 2, 1, 1]
+
     def test_users_cannot_update_other_users_products(
         self,
         api_client: Client,
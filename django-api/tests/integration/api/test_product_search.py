@@ -1,12 +1,31 @@
+import base64
+import json
+import uuid
+from unittest.mock import patch
+
 import pytest
+from django.db import connection
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from oauth2_provider.models import AccessToken
+from rest_framework.utils.encoders import JSONEncoder
 
 from store_api.models import Product
+from store_api.pagination import ProductPagination
+from store_api.search import PostgresFullTextProductSearchBackend
 from tests.conftest import ProductFactory, TagFactory, UserFactory
 
 
+def search_rank(product: Product, search_term: str) -> float:
+    return (
+        PostgresFullTextProductSearchBackend()
+        .search(Product.objects.filter(id=product.id), search_term)
+        .get()
+        .search_rank
+    )
+
+
 @pytest.mark.django_db()
 class TestProductSearchAPI:
 
@@ -54,7 +73,7 @@ class TestProductSearchAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": 20,
-                "offset_date": product_1.updated.isoformat().replace("+00:00", "Z"),
+                "next_cursor": None,
                 "has_next": False,
             },
             "data": [
@@ -130,7 +149,7 @@ class TestProductSearchAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": 20,
-                "offset_date": product_1.updated.isoformat().replace("+00:00", "Z"),
+                "next_cursor": None,
                 "has_next": False,
             },
             "data": [
@@ -194,7 +213,9 @@ class TestProductSearchAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": request_page_size,
-                "offset_date": product_2.updated.isoformat().replace("+00:00", "Z"),
+                "next_cursor": ProductPagination.encode_cursor(
+                    product_2.updated, product_2.id
+                ),
                 "has_next": True,
             },
             "data": [
@@ -228,7 +249,9 @@ class TestProductSearchAPI:
             "http://testserver/api/products/",
             query_params={
                 "page_size": request_page_size,
-                "offset": product_2.updated.isoformat().replace("+00:00", "Z"),
+                "cursor": ProductPagination.encode_cursor(
+                    product_2.updated, product_2.id
+                ),
             },
             content_type="application/json",
             headers={
@@ -239,7 +262,7 @@ class TestProductSearchAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": request_page_size,
-                "offset_date": product_1.updated.isoformat().replace("+00:00", "Z"),
+                "next_cursor": None,
                 "has_next": False,
             },
             "data": [
@@ -313,7 +336,7 @@ class TestProductSearchAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": request_page_size,
-                "offset_date": ramen_noodles.updated.isoformat().replace("+00:00", "Z"),
+                "next_cursor": None,
                 "has_next": False,
             },
             "data": [
@@ -355,32 +378,11 @@ class TestProductSearchAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": request_page_size,
-                "offset_date": red_lipstick.updated.isoformat().replace("+00:00", "Z"),
+                # the lipstick matches on title, description and tag, the cap only on a tag
+                "next_cursor": None,
                 "has_next": False,
             },
             "data": [
-                {
-                    "id": str(red_unique_cap.id),
-                    "owner_user_id": str(red_unique_cap.owner_user.id),
-                    "title": red_unique_cap.title,
-                    "description": red_unique_cap.description,
-                    "price": red_unique_cap.price,
-                    "stock": {
-                        "default": 1,
-                    },
-                    "tags": [
-                        {
-                            "id": str(red_tag.id),
-                            "name": red_tag.name,
-                            "description": red_tag.description,
-                        },
-                        {
-                            "id": str(unique_tag.id),
-                            "name": unique_tag.name,
-                            "description": unique_tag.description,
-                        },
-                    ],
-                },
                 {
                     "id": str(red_lipstick.id),
                     "owner_user_id": str(red_lipstick.owner_user.id),
@@ -403,7 +405,315 @@ class TestProductSearchAPI:
                         },
                     ],
                 },
+                {
+                    "id": str(red_unique_cap.id),
+                    "owner_user_id": str(red_unique_cap.owner_user.id),
+                    "title": red_unique_cap.title,
+                    "description": red_unique_cap.description,
+                    "price": red_unique_cap.price,
+                    "stock": {
+                        "default": 1,
+                    },
+                    "tags": [
+                        {
+                            "id": str(red_tag.id),
+                            "name": red_tag.name,
+                            "description": red_tag.description,
+                        },
+                        {
+                            "id": str(unique_tag.id),
+                            "name": unique_tag.name,
+                            "description": unique_tag.description,
+                        },
+                    ],
+                },
             ],
         }
 
+    def test_get_products_paging_does_not_skip_products_updated_at_the_same_time(
+        self,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+    ):
+        user1 = user_factory.create("user1@user1.com", "user1", "easyPass")
+        products = [
+            product_factory.create(
+                owner=user1, title=f"product {i}", description="same", price=100
+            )
+            for i in range(5)
+        ]
+        Product.objects.filter(id__in=[p.id for p in products]).update(
+            updated=timezone.now()
+        )
+
+        seen_product_ids = []
+        query_params = {"page_size": 2}
+        has_next = True
+        while has_next:
+            response = api_client.get(
+                "http://testserver/api/products/",
+                query_params=query_params,
+                headers={
+                    "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+                },
+            )
+            assert response.status_code == 200
+
+            seen_product_ids += [p["id"] for p in response.json()["data"]]
+            has_next = response.json()["metadata"]["has_next"]
+            query_params["cursor"] = response.json()["metadata"]["next_cursor"]
+
+        assert sorted(seen_product_ids) == sorted(str(p.id) for p in products)
+
+    def test_get_products_by_search_term_pages_best_match_first_without_skipping_equal_ranks(
+        self,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+    ):
+        user1 = user_factory.create("user1@user1.com", "user1", "easyPass")
+        best_match = product_factory.create(
+            owner=user1,
+            title="lamp",
+            description="desk lamp with a lamp shade",
+            price=100,
+        )
+        # same rank, so paging depends on the id to break ties
+        products = [
+            product_factory.create(
+                owner=user1, title=f"table {i}", description="lamp", price=100
+            )
+            for i in range(5)
+        ]
+
+        seen_product_ids = []
+        query_params = {"search_term": "lamp", "page_size": 2}
+        has_next = True
+        while has_next:
+            response = api_client.get(
+                "http://testserver/api/products/",
+                query_params=query_params,
+                headers={
+                    "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+                },
+            )
+            assert response.status_code == 200
+
+            seen_product_ids += [p["id"] for p in response.json()["data"]]
+            has_next = response.json()["metadata"]["has_next"]
+            query_params["cursor"] = response.json()["metadata"]["next_cursor"]
+
+        assert seen_product_ids == [str(best_match.id)] + sorted(
+            str(p.id) for p in products
+        )
+
+    def test_get_products_by_search_term_with_a_timestamp_cursor_is_not_found(
+        self,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+    ):
+        response = api_client.get(
+            "http://testserver/api/products/",
+            query_params={
+                "search_term": "lamp",
+                "cursor": ProductPagination.encode_cursor(timezone.now(), uuid.uuid4()),
+            },
+            headers={
+                "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+            },
+        )
+        assert response.status_code == 404
+
+    @pytest.mark.parametrize(
+        "cursor",
+        [
+            "not-a-cursor",
+            # an id that is not a string
+            base64.urlsafe_b64encode(b'["2020-01-01T00:00:00",123]').decode("ascii"),
+            base64.urlsafe_b64encode(b'["2020-01-01T00:00:00",["a"]]').decode("ascii"),
+            # a timestamp that is not a string
+            base64.urlsafe_b64encode(f'[123,"{uuid.uuid4()}"]'.encode("ascii")).decode(
+                "ascii"
+            ),
+        ],
+    )
+    def test_get_products_with_invalid_cursor_is_not_found(
+        self,
+        cursor: str,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+    ):
+        response = api_client.get(
+            "http://testserver/api/products/",
+            query_params={"cursor": cursor},
+            headers={
+                "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+            },
+        )
+        assert response.status_code == 404
+
+    def test_get_products_from_a_cached_page_has_the_current_stock(
+        self,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+    ):
+        user1 = user_factory.create("user1@user1.com", "user1", "easyPass")
+        product = product_factory.create(
+            owner=user1,
+            title="product",
+            description="product",
+            price=100,
+            available_stock={"default": 3, "xl": 2},
+        )
+
+        cached_pages = {}
+
+        def get_list_page(query_params: dict, load) -> dict:
+            key = json.dumps(sorted(query_params.items()))
+            if key not in cached_pages:
+                cached_pages[key] = json.dumps(load(), cls=JSONEncoder)
+            return json.loads(cached_pages[key])
+
+        def get_products() -> list[dict]:
+            response = api_client.get(
+                "http://testserver/api/products/",
+                headers={
+                    "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+                },
+            )
+            assert response.status_code == 200
+            return response.json()["data"]
+
+        with patch("store_api.views.get_product_cache") as get_product_cache:
+            get_product_cache.return_value.get_list_page = get_list_page
+
+            assert [p["stock"] for p in get_products()] == [{"default": 3, "xl": 2}]
+            product.stock.filter(variant="default").update(available=1)
+            assert [p["stock"] for p in get_products()] == [{"default": 1, "xl": 2}]
+
+        # the page was cached once, without the stock
+        [cached_page] = cached_pages.values()
+        assert [p["id"] for p in json.loads(cached_page)["data"]] == [str(product.id)]
+        assert "stock" not in json.loads(cached_page)["data"][0]
+
+    @pytest.mark.parametrize("page_size", [1, 5, 20])
+    def test_get_products_uses_a_fixed_number_of_queries_regardless_of_page_size(
+        self,
+        page_size: int,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+        tag_factory: TagFactory,
+    ):
+        user1 = user_factory.create("user1@user1.com", "user1", "easyPass")
+        tags = [tag_factory.create(f"tag{i}", "tag") for i in range(3)]
+        for i in range(page_size):
+            product = product_factory.create(
+                owner=user1,
+                title=f"product {i}",
+                description="product",
+                price=100,
+                available_stock={"default": 1, "xl": 2},
+            )
+            product.tags.set(tags)
+
+        with CaptureQueriesContext(connection) as captured_queries:
+            response = api_client.get(
+                "http://testserver/api/products/",
+                query_params={"page_size": page_size, "search_term": "product"},
+                headers={
+                    "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+                },
+            )
+
+        assert response.status_code == 200
+        assert len(response.json()["data"]) == page_size
+        # access token + products + stock + tags
+        assert len(captured_queries) == 4
+
     # TODO (optional) test paging going back. likely needs a "forward" offset and a "backwards" offset
+
+    def test_get_products_by_search_term_matches_word_prefixes_of_all_search_words(
+        self,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+        tag_factory: TagFactory,
+    ):
+        user1 = user_factory.create("user1@user1.com", "user1", "easyPass")
+        food_tag = tag_factory.create("food", "Food products")
+
+        ramen_noodles = product_factory.create(
+            owner=user1,
+            title="Ramen noodles",
+            description="These noodles will be amazing in any ramen broth",
+            price=50000,
+        )
+        ramen_noodles.tags.set([food_tag])
+
+        product_factory.create(
+            owner=user1,
+            title="rice noodles",
+            description="Thin noodles",
+            price=300,
+        )
+
+        response = api_client.get(
+            "http://testserver/api/products/",
+            query_params={"search_term": "RAM nood foo"},
+            headers={
+                "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+            },
+        )
+
+        assert response.status_code == 200
+        assert [p["id"] for p in response.json()["data"]] == [str(ramen_noodles.id)]
+
+    def test_get_products_by_search_term_reflects_tag_changes(
+        self,
+        api_client: Client,
+        default_user_long_lived_access_token: AccessToken,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+        tag_factory: TagFactory,
+    ):
+        user1 = user_factory.create("user1@user1.com", "user1", "easyPass")
+        tag = tag_factory.create("vintage", "Old but gold")
+        other_tag = tag_factory.create("retro", "Old style")
+
+        cap = product_factory.create(
+            owner=user1,
+            title="cap for yo head",
+            description="makes your coolness level over 9000!",
+            price=709,
+        )
+        cap.tags.set([tag])
+
+        def search(term: str) -> list[str]:
+            response = api_client.get(
+                "http://testserver/api/products/",
+                query_params={"search_term": term},
+                headers={
+                    "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
+                },
+            )
+            assert response.status_code == 200
+            return [p["id"] for p in response.json()["data"]]
+
+        assert search("vintage") == [str(cap.id)]
+
+        tag.name = "classic"
+        tag.save()
+        assert search("vintage") == []
+        assert search("classic") == [str(cap.id)]
+
+        cap.tags.set([other_tag])
+        assert search("classic") == []
+        assert search("retro") == [str(cap.id)]
@@ -6,6 +6,7 @@ from django.test import Client
 from oauth2_provider.models import AccessToken, Application
 
 from store_api.models import Tag, User
+from store_api.pagination import TagPagination
 from tests.conftest import AuthActions, TagFactory
 
 CREATE_TAG_PAYLOAD = {
@@ -87,7 +88,7 @@ class TestTagAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": 50,
-                "offset_date": tag2.created.isoformat().replace("+00:00", "Z"),
+                "next_cursor": None,
                 "has_next": False,
             },
             "data": [
@@ -127,7 +128,7 @@ class TestTagAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": 1,
-                "offset_date": tag1.created.isoformat().replace("+00:00", "Z"),
+                "next_cursor": TagPagination.encode_cursor(tag1.created, tag1.id),
                 "has_next": True,
             },
             "data": [
@@ -143,7 +144,7 @@ class TestTagAPI:
             "http://testserver/api/tags/",
             query_params={
                 "page_size": 20,
-                "offset": tag1.created.isoformat().replace("+00:00", "Z"),
+                "cursor": TagPagination.encode_cursor(tag1.created, tag1.id),
             },
             headers={
                 "Authorization": f"Bearer {default_user_long_lived_access_token.token}"
@@ -154,7 +155,7 @@ class TestTagAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": 20,
-                "offset_date": tag2.created.isoformat().replace("+00:00", "Z"),
+                "next_cursor": None,
                 "has_next": False,
             },
             "data": [
@@ -322,7 +323,7 @@ class TestTagAPI:
         assert response.json() == {
             "metadata": {
                 "page_size": 50,
-                "offset_date": tag4.created.isoformat().replace("+00:00", "Z"),
+                "next_cursor": None,
                 "has_next": False,
             },
             "data": [
@@ -2,7 +2,7 @@ from datetime import datetime, timedelta, timezone
 
 import pytest
 
-from store_api.models import Order, OrderLineItem, User
+from store_api.models import Order, OrderLineItem, OrderOutboxEvent, User
 from store_async_jobs.jobs import cancel_elapsed_unconfirmed_orders
 from tests.conftest import ProductFactory, UserFactory
 
@@ -96,3 +96,65 @@ class TestCancelNonConfirmedOrders:
             {"variant": "default", "available": 10},
             {"variant": "red", "available": 15},
         ]
+
+    def test_elapsed_pending_orders_are_cancelled_in_chunks(
+        self,
+        default_user: User,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+    ):
+        elapsed = datetime.now(timezone.utc) - timedelta(
+            seconds=TIME_TO_CANCEL_PENDING_ORDERS_SECONDS
+        )
+        seller = user_factory.create("test@test.com", "test_seller", "Passwd")
+        product = product_factory.create(
+            seller,
+            "some product",
+            "description",
+            100,
+            available_stock={"default": 0, "red": 1},
+        )
+        other_product = product_factory.create(
+            seller, "other product", "description", 100, available_stock={"default": 2}
+        )
+
+        pending_orders = []
+        for i in range(5):
+            order = Order.objects.create(
+                state=Order.States.PENDING,
+                customer=default_user,
+                created=elapsed - timedelta(seconds=i),
+            )
+            OrderLineItem.objects.create(
+                order=order, product=product, variant="default", quantity=i + 1
+            )
+            OrderLineItem.objects.create(
+                order=order, product=other_product, variant="default", quantity=1
+            )
+            pending_orders.append(order)
+
+        cancel_elapsed_unconfirmed_orders(
+            TIME_TO_CANCEL_PENDING_ORDERS_SECONDS, chunk_size=2
+        )
+
+        assert Order.objects.filter(
+            id__in=[order.id for order in pending_orders],
+            state=Order.States.REVERTED,
+        ).count() == len(pending_orders)
+        assert OrderOutboxEvent.objects.filter(
+            order__in=pending_orders,
+            from_state=Order.States.PENDING,
+            to_state=Order.States.REVERTED,
+        ).count() == len(pending_orders)
+
+        product.refresh_from_db()
+        assert list(
+            product.stock.all().order_by("variant").values("variant", "available")
+        ) == [
+            {"variant": "default", "available": 15},
+            {"variant": "red", "available": 1},
+        ]
+        other_product.refresh_from_db()
+        assert list(other_product.stock.all().values("variant", "available")) == [
+            {"variant": "default", "available": 7},
+        ]
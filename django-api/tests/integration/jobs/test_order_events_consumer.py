@@ -2,9 +2,12 @@ import uuid
 
 import pytest
 
-from store_api.models import Order, User
-from store_async_jobs.consumer import DebeziumRedisEvent
-from store_async_jobs.order_events_consumer import OrderEventConsumer
+from store_api.models import Order, OrderOutboxEvent, User
+from store_async_jobs.consumer import DebeziumRedisEvent, RedisStreamEvent
+from store_async_jobs.order_events_consumer import (
+    OrderEventConsumer,
+    OrderOutboxEventConsumer,
+)
 from tests.conftest import OrderFactory, ProductFactory, UserFactory
 
 
@@ -144,3 +147,169 @@ class TestCancelNonConfirmedOrders:
         assert event_id == redis_event_id
 
         assert Order.objects.filter(id=non_existing_order_id).count() == 0
+
+
+@pytest.mark.django_db()
+class TestOrderOutboxEventConsumer:
+
+    @pytest.fixture()
+    def product(self, user_factory: UserFactory, product_factory: ProductFactory):
+        seller_user = user_factory.create("user1@user1.com", "user1", "easyPass")
+        return product_factory.create(
+            owner=seller_user,
+            title="t-shirt",
+            description="cheap and amazing t-shirts",
+            price=1003,
+            available_stock={"s": 500},
+        )
+
+    def outbox_event(self, event_id: str, order_id, from_state, to_state):
+        return RedisStreamEvent(
+            event_id,
+            {"order_id": str(order_id), "from_state": from_state, "to_state": to_state},
+        )
+
+    def test_confirmed_orders_are_paid_without_fetching_them(
+        self,
+        default_user: User,
+        product,
+        order_factory: OrderFactory,
+        django_assert_num_queries,
+    ):
+        confirmed_orders = [
+            order_factory.create(
+                default_user, [(product, "s", 1)], state=Order.States.CONFIRMED
+            )
+            for _ in range(3)
+        ]
+        reverted_order = order_factory.create(
+            default_user, [(product, "s", 1)], state=Order.States.REVERTED
+        )
+        events = [
+            self.outbox_event(
+                f"{i}-0",
+                order.id,
+                Order.States.PENDING,
+                Order.States.CONFIRMED,
+            )
+            for i, order in enumerate(confirmed_orders)
+        ] + [
+            self.outbox_event(
+                "3-0", reverted_order.id, Order.States.PENDING, Order.States.REVERTED
+            )
+        ]
+
+        consumer = OrderOutboxEventConsumer(None, None, None, None)
+
+        # savepoint, update, outbox insert, release savepoint
+        with django_assert_num_queries(4):
+            event_ids = consumer.process_batch(events)
+
+        assert event_ids == ["0-0", "1-0", "2-0", "3-0"]
+        for order in confirmed_orders:
+            order.refresh_from_db()
+            assert order.state == Order.States.PAID
+        reverted_order.refresh_from_db()
+        assert reverted_order.state == Order.States.REVERTED
+
+        assert OrderOutboxEvent.objects.filter(
+            order__in=confirmed_orders,
+            from_state=Order.States.CONFIRMED,
+            to_state=Order.States.PAID,
+        ).count() == len(confirmed_orders)
+
+    def test_events_of_orders_that_are_not_confirmed_anymore_are_NOOP(
+        self, default_user: User, product, order_factory: OrderFactory
+    ):
+        paid_order = order_factory.create(
+            default_user, [(product, "s", 1)], state=Order.States.PAID
+        )
+
+        consumer = OrderOutboxEventConsumer(None, None, None, None)
+
+        event_ids = consumer.process_batch(
+            [
+                self.outbox_event(
+                    "1-0", paid_order.id, Order.States.PENDING, Order.States.CONFIRMED
+                ),
+                self.outbox_event(
+                    "2-0", uuid.uuid4(), Order.States.PENDING, Order.States.CONFIRMED
+                ),
+            ]
+        )
+
+        assert event_ids == ["1-0", "2-0"]
+        paid_order.refresh_from_db()
+        assert paid_order.state == Order.States.PAID
+        assert not OrderOutboxEvent.objects.exists()
+
+    def test_failing_event_is_isolated_from_the_rest_of_the_batch(
+        self, default_user: User, product, order_factory: OrderFactory
+    ):
+        confirmed_order = order_factory.create(
+            default_user, [(product, "s", 1)], state=Order.States.CONFIRMED
+        )
+
+        consumer = OrderOutboxEventConsumer(None, None, None, None)
+
+        event_ids = consumer.process_partition(
+            [
+                self.outbox_event(
+                    "1-0", "not-a-uuid", Order.States.PENDING, Order.States.CONFIRMED
+                ),
+                self.outbox_event(
+                    "2-0",
+                    confirmed_order.id,
+                    Order.States.PENDING,
+                    Order.States.CONFIRMED,
+                ),
+                self.outbox_event(
+                    "3-0", "not-a-uuid", Order.States.CONFIRMED, Order.States.REVERTED
+                ),
+            ]
+        )
+
+        # the events of the failed order are left pending - the next one may depend on it
+        assert event_ids == ["2-0"]
+        confirmed_order.refresh_from_db()
+        assert confirmed_order.state == Order.States.PAID
+
+    def test_events_of_an_order_with_a_failed_event_are_held_back_in_the_next_batches(
+        self, default_user: User, product, order_factory: OrderFactory
+    ):
+        confirmed_order = order_factory.create(
+            default_user, [(product, "s", 1)], state=Order.States.CONFIRMED
+        )
+        consumer = OrderOutboxEventConsumer(None, None, None, None)
+
+        assert (
+            consumer.process_partition(
+                [
+                    self.outbox_event(
+                        "1-0",
+                        "not-a-uuid",
+                        Order.States.PENDING,
+                        Order.States.CONFIRMED,
+                    ),
+                ]
+            )
+            == []
+        )
+
+        event_ids = consumer.process_partition(
+            [
+                self.outbox_event(
+                    "2-0", "not-a-uuid", Order.States.CONFIRMED, Order.States.REVERTED
+                ),
+                self.outbox_event(
+                    "3-0",
+                    confirmed_order.id,
+                    Order.States.PENDING,
+                    Order.States.CONFIRMED,
+                ),
+            ]
+        )
+
+        # 2-0 waits for 1-0, which is still pending
+        assert event_ids == ["3-0"]
+        assert consumer.held_event_ids == {"not-a-uuid": {"1-0", "2-0"}}
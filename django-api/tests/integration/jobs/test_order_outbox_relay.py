@@ -0,0 +1,80 @@
+from unittest.mock import Mock, call
+
+import pytest
+
+from store_api.models import Order, OrderOutboxEvent, User
+from store_async_jobs.order_outbox_relay import ORDER_EVENTS_STREAM, OrderOutboxRelay
+from tests.conftest import OrderFactory, ProductFactory, UserFactory
+
+
+@pytest.mark.django_db()
+class TestOrderOutboxRelay:
+
+    def test_outbox_events_are_published_in_batches_and_deleted(
+        self,
+        default_user: User,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+        order_factory: OrderFactory,
+    ):
+        seller_user = user_factory.create("user1@user1.com", "user1", "easyPass")
+        product = product_factory.create(
+            seller_user, "t-shirt", "cheap", 1003, available_stock={"s": 10}
+        )
+        orders = [
+            order_factory.create(
+                default_user, [(product, "s", 1)], state=Order.States.PENDING
+            )
+            for _ in range(3)
+        ]
+        for order in orders:
+            order.confirm()
+            order.save()
+
+        redis_client = Mock()
+        pipeline = redis_client.pipeline.return_value
+        relay = OrderOutboxRelay(redis_client, batch_size=2)
+
+        assert relay.relay_events() == 2
+        assert relay.relay_events() == 1
+        assert relay.relay_events() == 0
+
+        assert pipeline.xadd.call_args_list == [
+            call(
+                ORDER_EVENTS_STREAM,
+                {
+                    "order_id": str(order.id),
+                    "from_state": "PENDING",
+                    "to_state": "CONFIRMED",
+                },
+            )
+            for order in orders
+        ]
+        assert pipeline.execute.call_count == 2
+        assert not OrderOutboxEvent.objects.exists()
+
+    def test_events_are_kept_when_publishing_fails(
+        self,
+        default_user: User,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+        order_factory: OrderFactory,
+    ):
+        seller_user = user_factory.create("user1@user1.com", "user1", "easyPass")
+        product = product_factory.create(
+            seller_user, "t-shirt", "cheap", 1003, available_stock={"s": 10}
+        )
+        order = order_factory.create(
+            default_user, [(product, "s", 1)], state=Order.States.PENDING
+        )
+        order.confirm()
+        order.save()
+
+        redis_client = Mock()
+        redis_client.pipeline.return_value.execute.side_effect = ConnectionError()
+        relay = OrderOutboxRelay(redis_client)
+
+        with pytest.raises(ConnectionError):
+            relay.relay_events()
+
+        assert OrderOutboxEvent.objects.filter(order=order).count() == 1
@@ -0,0 +1,160 @@
+import threading
+import time
+import uuid
+from unittest.mock import Mock, patch
+
+import pytest
+
+from store_async_jobs.consumer import DebeziumRedisEvent
+from store_async_jobs.product_cache_consumer import (
+    PRODUCT_STOCK_SHARD_STREAM,
+    PRODUCT_STOCK_STREAM,
+    PRODUCT_STREAM,
+    TAG_STREAM,
+    ProductCacheInvalidationConsumer,
+    run_consumers,
+)
+from tests.conftest import ProductFactory, TagFactory, UserFactory
+
+REDIS_EVENT_ID = "1740218269024-0"
+
+
+@pytest.mark.django_db()
+class TestProductCacheInvalidationConsumer:
+
+    def test_product_changes_invalidate_the_product(self):
+        product_id = str(uuid.uuid4())
+        product_cache = Mock()
+        consumer = ProductCacheInvalidationConsumer(
+            product_cache, None, PRODUCT_STREAM, None, None
+        )
+
+        event_id = consumer.process_change_event(
+            DebeziumRedisEvent(
+                id=REDIS_EVENT_ID,
+                before=None,
+                after={"id": product_id, "title": "t-shirt"},
+            )
+        )
+
+        assert event_id == REDIS_EVENT_ID
+        product_cache.invalidate_products.assert_called_once_with(
+            {product_id}, lists=True
+        )
+
+    def test_stock_changes_invalidate_the_product_but_not_the_lists(self):
+        product_id = str(uuid.uuid4())
+        product_cache = Mock()
+        consumer = ProductCacheInvalidationConsumer(
+            product_cache, None, PRODUCT_STOCK_STREAM, None, None
+        )
+
+        consumer.process_change_event(
+            DebeziumRedisEvent(
+                id=REDIS_EVENT_ID,
+                before={"id": 1},
+                after={
+                    "id": 1,
+                    "variant": "default",
+                    "available": 2,
+                    "product_id": product_id,
+                },
+            )
+        )
+
+        product_cache.invalidate_products.assert_called_once_with(
+            {product_id}, lists=False
+        )
+
+    def test_tag_changes_invalidate_tagged_products(
+        self,
+        user_factory: UserFactory,
+        product_factory: ProductFactory,
+        tag_factory: TagFactory,
+    ):
+        seller = user_factory.create("user1@user1.com", "user1", "easyPass")
+        tag = tag_factory.create("red", "red things")
+        tagged_product = product_factory.create(seller, "cap", "red cap", 100)
+        tagged_product.tags.set([tag])
+        product_factory.create(seller, "shirt", "blue shirt", 100)
+
+        product_cache = Mock()
+        consumer = ProductCacheInvalidationConsumer(
+            product_cache, None, TAG_STREAM, None, None
+        )
+
+        consumer.process_change_event(
+            DebeziumRedisEvent(
+                id=REDIS_EVENT_ID,
+                before=None,
+                after={"id": str(tag.id), "name": "crimson"},
+            )
+        )
+
+        product_cache.invalidate_products.assert_called_once_with(
+            {str(tagged_product.id)}, lists=True
+        )
+
+    def test_events_without_affected_products_are_NOOP(self):
+        product_cache = Mock()
+        consumer = ProductCacheInvalidationConsumer(
+            product_cache, None, TAG_STREAM, None, None
+        )
+
+        event_id = consumer.process_change_event(
+            DebeziumRedisEvent(
+                id=REDIS_EVENT_ID,
+                before=None,
+                after={"id": str(uuid.uuid4()), "name": "unused"},
+            )
+        )
+
+        assert event_id == REDIS_EVENT_ID
+        product_cache.invalidate_products.assert_not_called()
+
+    def test_stock_shard_changes_invalidate_the_product_but_not_the_lists(
+        self, user_factory: UserFactory, product_factory: ProductFactory
+    ):
+        seller = user_factory.create("user1@user1.com", "user1", "easyPass")
+        product = product_factory.create(
+            seller, "cap", "red cap", 100, available_stock={"default": 4}
+        )
+        stock = product.stock.get()
+        stock.set_shards(2)
+
+        product_cache = Mock()
+        consumer = ProductCacheInvalidationConsumer(
+            product_cache, None, PRODUCT_STOCK_SHARD_STREAM, None, None
+        )
+
+        consumer.process_change_event(
+            DebeziumRedisEvent(
+                id=REDIS_EVENT_ID,
+                before={"id": 1},
+                after={"id": 1, "stock_id": stock.id, "shard": 0, "available": 1},
+            )
+        )
+
+        product_cache.invalidate_products.assert_called_once_with(
+            {str(product.id)}, lists=False
+        )
+
+
+@patch("store_async_jobs.product_cache_consumer.signal.signal")
+def test_consumers_run_in_their_own_thread_until_one_fails(_):
+    threads_by_stream = {}
+
+    def consumer(stream_name, process_events):
+        def process_events_in_thread():
+            threads_by_stream.setdefault(stream_name, threading.current_thread())
+            process_events()
+
+        return Mock(stream_name=stream_name, process_events=process_events_in_thread)
+
+    blocking_consumer = consumer(PRODUCT_STREAM, lambda: time.sleep(0.01))
+    failing_consumer = consumer(TAG_STREAM, Mock(side_effect=[None, RuntimeError()]))
+
+    with pytest.raises(RuntimeError):
+        run_consumers([blocking_consumer, failing_consumer])
+
+    assert threads_by_stream[PRODUCT_STREAM] is not threads_by_stream[TAG_STREAM]
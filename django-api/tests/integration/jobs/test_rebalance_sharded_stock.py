@@ -0,0 +1,34 @@
+import pytest
+
+from store_api.models import ProductStock
+from store_async_jobs.jobs import rebalance_sharded_stock
+from tests.conftest import ProductFactory, UserFactory
+
+
+@pytest.mark.django_db()
+class TestRebalanceShardedStock:
+
+    def test_sharded_variants_are_rebalanced(
+        self, user_factory: UserFactory, product_factory: ProductFactory
+    ):
+        seller = user_factory.create("test@test.com", "test_seller", "Passwd")
+        product = product_factory.create(
+            seller,
+            "some product",
+            "description",
+            100,
+            available_stock={"default": 7, "red": 6},
+        )
+        red_stock = product.stock.get(variant="red")
+        red_stock.set_shards(2)
+        red_stock.shard_set.filter(shard=0).update(available=0)
+
+        rebalance_sharded_stock()
+
+        assert list(
+            red_stock.shard_set.order_by("shard").values_list("available", flat=True)
+        ) == [2, 1]
+        # not sharded variants are left alone
+        assert (
+            ProductStock.objects.get(product=product, variant="default").available == 7
+        )
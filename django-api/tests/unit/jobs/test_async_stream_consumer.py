@@ -0,0 +1,325 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, call, patch
+
+import pytest
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+from store_async_jobs.async_consumer import (
+    AsyncConsumer,
+    AsyncRedisDebeziumStreamConsumer,
+)
+from store_async_jobs.consumer import (
+    FAILURE_TTL_SECONDS,
+    DebeziumRedisEvent,
+    RedisStreamEvent,
+)
+
+
+@pytest.fixture()
+def redis_client():
+    return Redis(host="localhost", decode_responses=True, protocol=3)
+
+
+def debezium_event(event_id: str, order_id: str, state: str) -> RedisStreamEvent:
+    return RedisStreamEvent(
+        event_id,
+        {
+            f'{{"payload":{{"id":"{order_id}"}}}}': f'{{"payload":{{"before":null,"after":{{"id":"{order_id}","state":"{state}"}}}}}}'
+        },
+    )
+
+
+class TestAsyncRedisStreamConsumer:
+
+    DUMMY_REDIS_STREAM_NAME = "stream_key"
+    DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME = "le_consumer_group"
+    DUMMY_REDIS_CONSUMER_NAME = "dummy"
+
+    def consumer(self, redis_client, consumer_class=AsyncConsumer, **kwargs):
+        return consumer_class(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+            **kwargs,
+        )
+
+    def test_consumer_init_handles_consumer_group_already_created(self, redis_client):
+        redis_client.xgroup_create = AsyncMock(
+            side_effect=ResponseError("BUSYGROUP Consumer Group name already exists")
+        )
+
+        asyncio.run(self.consumer(redis_client).init())
+
+        redis_client.xgroup_create.assert_awaited_once_with(
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            "$",
+            mkstream=True,
+        )
+
+    def test_consumer_reads_idle_pending_events_then_its_pending_events_then_new_events(
+        self, redis_client
+    ):
+        redis_client.xautoclaim = AsyncMock(return_value=["0-0", [], []])
+        redis_client.xreadgroup = AsyncMock(return_value={})
+        consumer = self.consumer(redis_client, batch_size=50, block_ms=2000)
+
+        assert asyncio.run(consumer.read_events()) == []
+        assert asyncio.run(consumer.read_events()) == []
+
+        assert redis_client.xautoclaim.await_count == 2
+        assert redis_client.xreadgroup.mock_calls == [
+            call(
+                groupname=self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+                consumername=self.DUMMY_REDIS_CONSUMER_NAME,
+                count=50,
+                streams={self.DUMMY_REDIS_STREAM_NAME: "0-0"},
+            ),
+            call(
+                groupname=self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+                consumername=self.DUMMY_REDIS_CONSUMER_NAME,
+                count=50,
+                streams={self.DUMMY_REDIS_STREAM_NAME: ">"},
+                block=2000,
+            ),
+        ]
+
+    def test_consumer_prioritizes_idle_pending_events_if_there_are_any(
+        self, redis_client
+    ):
+        redis_client.xautoclaim = AsyncMock(
+            return_value=["0-0", [("1-0", {"k": "v"})], []]
+        )
+        redis_client.xreadgroup = AsyncMock(return_value={})
+
+        events = asyncio.run(self.consumer(redis_client).read_events())
+
+        assert events == [RedisStreamEvent("1-0", {"k": "v"})]
+        redis_client.xreadgroup.assert_not_called()
+
+    def test_consumer_claims_idle_pending_events_on_its_own_schedule(
+        self, redis_client
+    ):
+        redis_client.xautoclaim = AsyncMock(return_value=["0-0", [], []])
+        redis_client.xreadgroup = AsyncMock(return_value={})
+        consumer = self.consumer(redis_client, claim_interval_seconds=30)
+
+        with patch("store_async_jobs.consumer.time.monotonic") as monotonic:
+            monotonic.return_value = 100
+            asyncio.run(consumer.read_events())
+            monotonic.return_value = 129
+            asyncio.run(consumer.read_events())
+            assert redis_client.xautoclaim.await_count == 1
+
+            monotonic.return_value = 130
+            asyncio.run(consumer.read_events())
+            assert redis_client.xautoclaim.await_count == 2
+
+    def test_consumer_processes_events_concurrently_up_to_max_concurrency(
+        self, redis_client
+    ):
+        consumer = self.consumer(redis_client, max_concurrency=3)
+        events = [RedisStreamEvent(f"{i}-0", {}) for i in range(10)]
+        in_flight = []
+        max_in_flight = 0
+
+        async def process_event(event):
+            nonlocal max_in_flight
+            in_flight.append(event.id)
+            max_in_flight = max(max_in_flight, len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(event.id)
+            return event.id
+
+        consumer.process_event = process_event
+
+        event_ids = asyncio.run(consumer.process_batch(events))
+
+        assert sorted(event_ids) == sorted(e.id for e in events)
+        assert max_in_flight == 3
+
+    def test_consumer_processes_events_with_the_same_key_in_order(self, redis_client):
+        consumer = self.consumer(
+            redis_client, AsyncRedisDebeziumStreamConsumer, max_concurrency=10
+        )
+        events = [
+            debezium_event(f"{i}-0", order_id, state)
+            for i, (order_id, state) in enumerate(
+                [
+                    ("a", "PENDING"),
+                    ("b", "PENDING"),
+                    ("a", "CONFIRMED"),
+                    ("b", "CANCELLED"),
+                    ("a", "PAID"),
+                ]
+            )
+        ]
+        processed = []
+
+        async def process_change_event(event: DebeziumRedisEvent):
+            # events processed first take longer - without ordering per key, later events of the
+            # same order would overtake them
+            await asyncio.sleep(0.01 * (5 - int(event.id[0])))
+            processed.append((event.after["id"], event.after["state"]))
+            return event.id
+
+        consumer.process_change_event = process_change_event
+
+        asyncio.run(consumer.process_batch(events))
+
+        assert [state for id, state in processed if id == "a"] == [
+            "PENDING",
+            "CONFIRMED",
+            "PAID",
+        ]
+        assert [state for id, state in processed if id == "b"] == [
+            "PENDING",
+            "CANCELLED",
+        ]
+
+    def test_consumer_confirms_processed_events_with_a_single_xack_leaving_the_ones_after_a_failure_pending(
+        self, redis_client
+    ):
+        consumer = self.consumer(redis_client, AsyncRedisDebeziumStreamConsumer)
+        events = [
+            debezium_event("1-0", "a", "PENDING"),
+            debezium_event("2-0", "b", "PENDING"),
+            debezium_event("3-0", "a", "CONFIRMED"),
+        ]
+        consumer.read_events = AsyncMock(return_value=events)
+        redis_client.xack = AsyncMock(return_value=1)
+
+        async def process_change_event(event: DebeziumRedisEvent):
+            if event.id == "1-0":
+                raise RuntimeError()
+            return event.id
+
+        consumer.process_change_event = process_change_event
+
+        asyncio.run(consumer.process_events())
+
+        redis_client.xack.assert_awaited_once_with(
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            "2-0",
+        )
+
+    def test_consumer_holds_back_the_events_with_the_key_of_a_failed_event_until_it_is_processed(
+        self, redis_client
+    ):
+        consumer = self.consumer(redis_client, AsyncRedisDebeziumStreamConsumer)
+        consumer.read_events = AsyncMock(
+            side_effect=[
+                [debezium_event("1-0", "a", "PENDING")],
+                # new events, read in the next batches
+                [
+                    debezium_event("2-0", "a", "CONFIRMED"),
+                    debezium_event("3-0", "b", "PENDING"),
+                ],
+                # claimed once idle, in the order of the stream
+                [
+                    debezium_event("1-0", "a", "PENDING"),
+                    debezium_event("2-0", "a", "CONFIRMED"),
+                ],
+                [debezium_event("4-0", "a", "PAID")],
+            ]
+        )
+        redis_client.xack = AsyncMock(return_value=1)
+        processed = []
+
+        async def process_change_event(event: DebeziumRedisEvent):
+            processed.append(event.id)
+            if len(processed) == 1:
+                raise RuntimeError()
+            return event.id
+
+        consumer.process_change_event = process_change_event
+
+        for _ in range(4):
+            asyncio.run(consumer.process_events())
+
+        assert processed == ["1-0", "3-0", "1-0", "2-0", "4-0"]
+        assert [c.args[2:] for c in redis_client.xack.await_args_list] == [
+            ("3-0",),
+            ("1-0", "2-0"),
+            ("4-0",),
+        ]
+        assert consumer.held_event_ids == {}
+
+    def test_consumer_does_not_confirm_anything_when_there_are_no_events(
+        self, redis_client
+    ):
+        consumer = self.consumer(redis_client)
+        consumer.read_events = AsyncMock(return_value=[])
+        redis_client.xack = AsyncMock()
+
+        asyncio.run(consumer.process_events())
+
+        redis_client.xack.assert_not_called()
+
+    def test_consumer_moves_claimed_events_that_failed_too_many_times_to_the_dead_letter_stream(
+        self, redis_client
+    ):
+        redis_client.xautoclaim = AsyncMock(
+            return_value=["0-0", [("1-0", {"k1": "v1"}), ("2-0", {"k2": "v2"})], []]
+        )
+        pipeline = Mock()
+        pipeline.execute = AsyncMock(
+            side_effect=[
+                [
+                    [{"message_id": "1-0", "times_delivered": 4}],
+                    [{"message_id": "2-0", "times_delivered": 4}],
+                    "ValueError: bad event",
+                    None,
+                ],
+                [],
+            ]
+        )
+        redis_client.pipeline = Mock(return_value=pipeline)
+        consumer = self.consumer(redis_client, max_deliveries=3)
+
+        events = asyncio.run(consumer.read_events())
+
+        # 2-0 was only delivered again, it did not fail
+        assert [event.id for event in events] == ["2-0"]
+        pipeline.xadd.assert_called_once()
+        assert pipeline.xadd.call_args.args[0] == "stream_key:dead-letter"
+        pipeline.xack.assert_called_once_with(
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            "1-0",
+        )
+        redis_client.pipeline.assert_called_with(transaction=True)
+        assert consumer.metrics.events_claimed == 2
+        assert consumer.metrics.events_dead_lettered == 1
+
+    def test_consumer_records_failures_and_metrics_of_processed_events(
+        self, redis_client
+    ):
+        consumer = self.consumer(redis_client, max_deliveries=5)
+        consumer.read_events = AsyncMock(
+            return_value=[RedisStreamEvent("1-0", {}), RedisStreamEvent("2-0", {})]
+        )
+        redis_client.xack = AsyncMock(return_value=1)
+        redis_client.set = AsyncMock()
+
+        async def process_event(event: RedisStreamEvent):
+            if event.id == "1-0":
+                raise RuntimeError("boom")
+            return event.id
+
+        consumer.process_event = process_event
+
+        asyncio.run(consumer.process_events())
+
+        redis_client.set.assert_awaited_once_with(
+            "stream_key:le_consumer_group:failure:1-0",
+            "RuntimeError: boom",
+            ex=FAILURE_TTL_SECONDS,
+        )
+        assert consumer.metrics.events_processed == 1
+        assert sum(consumer.metrics.processing_bucket_counts) == 2
+        # the state of the consumer group is not read with the asyncio client
+        assert consumer.metrics.group_info() is None
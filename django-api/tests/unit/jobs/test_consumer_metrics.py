@@ -0,0 +1,156 @@
+import urllib.request
+from unittest.mock import Mock
+
+import pytest
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+from store_async_jobs.consumer import Consumer, RedisStreamEvent
+from store_async_jobs.metrics import (
+    ConsumerMetrics,
+    render_metrics,
+    start_metrics_server,
+)
+
+
+@pytest.fixture()
+def redis_client():
+    return Redis("localhost", decode_responses=True, protocol=3)
+
+
+class TestConsumerMetrics:
+
+    DUMMY_REDIS_STREAM_NAME = "stream_key"
+    DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME = "le_consumer_group"
+    DUMMY_REDIS_CONSUMER_NAME = "dummy"
+    LABELS = 'stream="stream_key",group="le_consumer_group",consumer="dummy"'
+
+    @pytest.fixture()
+    def consumer(self, redis_client):
+        redis_client.xinfo_groups = Mock(
+            return_value=[
+                {"name": "other_group", "pending": 7, "lag": 70},
+                {
+                    "name": self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+                    "pending": 3,
+                    "lag": 42,
+                },
+            ]
+        )
+        return Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+        )
+
+    def test_consumer_counts_processed_and_claimed_events(self, consumer, redis_client):
+        redis_client.xautoclaim = Mock(
+            return_value=["0-0", [("1-0", {}), ("2-0", {})], []]
+        )
+        redis_client.xack = Mock(return_value=2)
+        consumer.process_event = Mock(side_effect=lambda e: e.id)
+
+        consumer.process_events_in_batch()
+
+        rendered = render_metrics([consumer.metrics])
+        assert f"store_consumer_events_claimed_total{{{self.LABELS}}} 2" in rendered
+        assert f"store_consumer_events_processed_total{{{self.LABELS}}} 2" in rendered
+        assert (
+            f"store_consumer_event_processing_seconds_count{{{self.LABELS}}} 2"
+            in rendered
+        )
+
+    def test_processing_time_histogram_buckets_are_cumulative(self, consumer):
+        metrics = consumer.metrics
+        metrics.observe_processing(0.001)
+        # a batch of 4 events, 0.05s each
+        metrics.observe_processing(0.2, event_count=4)
+        metrics.observe_processing(60)
+
+        rendered = render_metrics([metrics])
+
+        def bucket(le: str) -> str:
+            return f'store_consumer_event_processing_seconds_bucket{{{self.LABELS},le="{le}"}}'
+
+        assert f"{bucket('0.0005')} 0" in rendered
+        assert f"{bucket('0.001')} 1" in rendered
+        assert f"{bucket('0.025')} 1" in rendered
+        assert f"{bucket('0.05')} 5" in rendered
+        assert f"{bucket('10.0')} 5" in rendered
+        assert f"{bucket('+Inf')} 6" in rendered
+        assert (
+            f"store_consumer_event_processing_seconds_sum{{{self.LABELS}}} 60.201"
+            in rendered
+        )
+        assert (
+            f"store_consumer_event_processing_seconds_count{{{self.LABELS}}} 6"
+            in rendered
+        )
+
+    def test_group_pending_events_and_lag_are_read_from_redis(
+        self, consumer, redis_client
+    ):
+        rendered = render_metrics([consumer.metrics])
+
+        group_labels = 'stream="stream_key",group="le_consumer_group"'
+        assert f"store_consumer_group_pending_events{{{group_labels}}} 3" in rendered
+        assert f"store_consumer_group_lag{{{group_labels}}} 42" in rendered
+        redis_client.xinfo_groups.assert_called_once_with(self.DUMMY_REDIS_STREAM_NAME)
+
+    def test_group_metrics_are_left_out_when_redis_is_unavailable(
+        self, consumer, redis_client
+    ):
+        redis_client.xinfo_groups = Mock(side_effect=ConnectionError())
+
+        rendered = render_metrics([consumer.metrics])
+
+        assert "store_consumer_group_pending_events{" not in rendered
+        assert f"store_consumer_events_processed_total{{{self.LABELS}}} 0" in rendered
+
+    def test_metrics_of_several_consumers_are_grouped_by_metric(self, redis_client):
+        redis_client.xinfo_groups = Mock(return_value=[])
+        metrics = [
+            ConsumerMetrics(redis_client, stream_name, "group", "consumer")
+            for stream_name in ["stream_a", "stream_b"]
+        ]
+
+        lines = render_metrics(metrics).splitlines()
+
+        type_line = lines.index("# TYPE store_consumer_events_processed_total counter")
+        assert lines[type_line + 1].startswith(
+            'store_consumer_events_processed_total{stream="stream_a"'
+        )
+        assert lines[type_line + 2].startswith(
+            'store_consumer_events_processed_total{stream="stream_b"'
+        )
+        assert len([line for line in lines if line.startswith("# TYPE")]) == 6
+
+    def test_metrics_are_served_over_http(self, consumer):
+        consumer.metrics.events_confirmed(5)
+        server = start_metrics_server(0, [consumer.metrics], host="127.0.0.1")
+        try:
+            with urllib.request.urlopen(
+                f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            ) as response:
+                content_type = response.headers["Content-Type"]
+                body = response.read().decode("utf-8")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert content_type.startswith("text/plain; version=0.0.4")
+        assert f"store_consumer_events_processed_total{{{self.LABELS}}} 5" in body
+
+    def test_supervisor_observes_the_processing_time_of_each_partition(self, consumer):
+        from store_async_jobs.supervisor import ConsumerSupervisor
+
+        consumer.process_partition = Mock(
+            side_effect=lambda events: [e.id for e in events]
+        )
+
+        ConsumerSupervisor(consumer, workers=2).process_partition(
+            [RedisStreamEvent("1-0", {}), RedisStreamEvent("2-0", {})]
+        )
+
+        assert sum(consumer.metrics.processing_bucket_counts) == 2
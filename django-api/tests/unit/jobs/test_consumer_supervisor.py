@@ -0,0 +1,193 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
+
+import pytest
+from redis import Redis
+
+from store_async_jobs.consumer import RedisDebeziumStreamConsumer, RedisStreamEvent
+from store_async_jobs.supervisor import (
+    ConsumerSupervisor,
+    key_range_group_name,
+    parse_key_range,
+)
+
+
+@pytest.fixture()
+def redis_client():
+    return Redis("localhost", decode_responses=True, protocol=3)
+
+
+def debezium_event(event_id: str, order_id: str) -> RedisStreamEvent:
+    return RedisStreamEvent(
+        event_id, {f'{{"payload":{{"id":"{order_id}"}}}}': '{"payload":{}}'}
+    )
+
+
+class TestConsumerSupervisor:
+
+    DUMMY_REDIS_STREAM_NAME = "stream_key"
+    DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME = "le_consumer_group"
+    DUMMY_REDIS_CONSUMER_NAME = "dummy"
+
+    @pytest.fixture()
+    def consumer(self, redis_client):
+        return RedisDebeziumStreamConsumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+        )
+
+    def test_events_with_the_same_key_are_processed_in_order_by_the_same_worker(
+        self, consumer
+    ):
+        events = [
+            debezium_event(f"{i}-0", order_id)
+            for i, order_id in enumerate(["a", "b", "a", "c", "b", "a"])
+        ]
+        processed = []
+        consumer.process_event = Mock(
+            side_effect=lambda e: processed.append(
+                (e.id, consumer.partition_key(e), threading.current_thread().name)
+            )
+            or e.id
+        )
+
+        supervisor = ConsumerSupervisor(consumer, workers=3)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            event_ids = supervisor.process_batch(executor, events)
+
+        assert sorted(event_ids) == sorted(e.id for e in events)
+        for key in ["a", "b", "c"]:
+            key_events = [p for p in processed if f'"{key}"' in p[1]]
+            assert [p[0] for p in key_events] == [
+                e.id for e in events if f'"{key}"' in consumer.partition_key(e)
+            ]
+            assert len({p[2] for p in key_events}) == 1
+
+    def test_failed_events_and_following_events_with_same_key_are_not_confirmed(
+        self, consumer
+    ):
+        events = [
+            debezium_event("1-0", "a"),
+            debezium_event("2-0", "b"),
+            debezium_event("3-0", "a"),
+        ]
+
+        def process_event(event):
+            if event.id == "1-0":
+                raise RuntimeError()
+            return event.id
+
+        consumer.process_event = Mock(side_effect=process_event)
+
+        supervisor = ConsumerSupervisor(consumer, workers=2)
+        # make sure that "a" and "b" events are not handled by the same worker
+        supervisor.worker_for = lambda e: 0 if '"a"' in consumer.partition_key(e) else 1
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            event_ids = supervisor.process_batch(executor, events)
+
+        assert event_ids == ["2-0"]
+
+    def test_failed_events_only_hold_back_the_following_events_with_the_same_key(
+        self, consumer
+    ):
+        events = [
+            debezium_event("1-0", "a"),
+            debezium_event("2-0", "b"),
+            debezium_event("3-0", "a"),
+            debezium_event("4-0", "c"),
+        ]
+        processed = []
+
+        def process_event(event):
+            processed.append(event.id)
+            if event.id == "1-0":
+                raise RuntimeError()
+            return event.id
+
+        consumer.process_event = Mock(side_effect=process_event)
+
+        # all events are handled by the same worker
+        supervisor = ConsumerSupervisor(consumer, workers=1)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            event_ids = supervisor.process_batch(executor, events)
+
+        assert event_ids == ["2-0", "4-0"]
+        assert processed == ["1-0", "2-0", "4-0"]
+
+    def test_failed_events_hold_back_the_events_with_the_same_key_of_the_next_batches(
+        self, consumer
+    ):
+        consumer.read_events = Mock(
+            side_effect=[
+                [debezium_event("1-0", "a"), debezium_event("2-0", "b")],
+                [debezium_event("3-0", "a"), debezium_event("4-0", "b")],
+                # claimed once idle
+                [debezium_event("1-0", "a"), debezium_event("3-0", "a")],
+            ]
+        )
+        consumer.confirm_events_processed = Mock()
+        failures = iter([RuntimeError()])
+
+        def process_event(event):
+            if event.id == "1-0" and next(failures, None):
+                raise RuntimeError()
+            return event.id
+
+        consumer.process_event = Mock(side_effect=process_event)
+
+        supervisor = ConsumerSupervisor(consumer, workers=2)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for _ in range(3):
+                supervisor.process_events(executor)
+
+        assert [
+            sorted(c.args[0]) for c in consumer.confirm_events_processed.call_args_list
+        ] == [["2-0"], ["4-0"], ["1-0", "3-0"]]
+
+    def test_workers_are_picked_from_the_keys_of_the_key_range(self, redis_client):
+        consumer = RedisDebeziumStreamConsumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+            key_range=(1, 2),
+        )
+        events = [debezium_event(f"{i}-0", f"order-{i}") for i in range(100)]
+        own_events, _ = consumer.split_key_range(events)
+
+        supervisor = ConsumerSupervisor(consumer, workers=2)
+
+        assert {supervisor.worker_for(event) for event in own_events} == {0, 1}
+
+    def test_supervisor_confirms_the_batch_in_flight_before_stopping(self, consumer):
+        consumer.read_events = Mock(return_value=[debezium_event("1-0", "a")])
+        consumer.confirm_events_processed = Mock()
+
+        supervisor = ConsumerSupervisor(consumer, workers=2)
+
+        def process_event(event):
+            # e.g. SIGTERM while processing
+            supervisor.stop()
+            return event.id
+
+        consumer.process_event = Mock(side_effect=process_event)
+
+        supervisor.run()
+
+        consumer.read_events.assert_called_once()
+        consumer.confirm_events_processed.assert_called_once_with(["1-0"])
+
+
+def test_key_ranges_are_parsed_from_their_index_and_count():
+    assert parse_key_range("0/3") == (0, 3)
+    assert parse_key_range("2/3") == (2, 3)
+    for value in ["3/3", "-1/3", "1", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_key_range(value)
+
+
+def test_each_key_range_has_its_own_consumer_group():
+    assert key_range_group_name("orders", (0, 3)) == "orders:range-0-of-3"
@@ -0,0 +1,227 @@
+from unittest.mock import Mock, call
+
+import pytest
+
+from store_async_jobs.consumer import (
+    FAILURE_TTL_SECONDS,
+    Consumer,
+    RedisDebeziumStreamConsumer,
+    RedisStreamEvent,
+)
+from store_async_jobs.dead_letter_replay import replay_dead_letter_events
+
+
+def pending(event_id: str, times_delivered: int) -> list[dict]:
+    return [
+        {
+            "message_id": event_id,
+            "consumer": "dummy",
+            "time_since_delivered": 60000,
+            "times_delivered": times_delivered,
+        }
+    ]
+
+
+class TestDeadLetter:
+
+    DUMMY_REDIS_STREAM_NAME = "stream_key"
+    DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME = "le_consumer_group"
+    DUMMY_REDIS_CONSUMER_NAME = "dummy"
+    DEAD_LETTER_STREAM_NAME = "stream_key:dead-letter"
+
+    @pytest.fixture()
+    def redis_client(self):
+        return Mock()
+
+    def consumer(self, redis_client, consumer_class=Consumer, **kwargs):
+        return consumer_class(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+            **kwargs,
+        )
+
+    def failure_key(self, event_id: str) -> str:
+        return f"stream_key:le_consumer_group:failure:{event_id}"
+
+    def test_claimed_events_that_failed_too_many_times_are_moved_to_the_dead_letter_stream(
+        self, redis_client
+    ):
+        redis_client.xautoclaim.return_value = [
+            "0-0",
+            [("1-0", {"k1": "v1"}), ("2-0", {"k2": "v2"}), ("3-0", {"k3": "v3"})],
+            [],
+        ]
+        pipeline = redis_client.pipeline.return_value
+        pipeline.execute.side_effect = [
+            [
+                pending("1-0", 4),
+                pending("2-0", 4),
+                pending("3-0", 3),
+                "ValueError: bad event",
+                None,
+                "ValueError: still failing",
+            ],
+            [],
+        ]
+        consumer = self.consumer(redis_client, max_deliveries=3)
+
+        events = list(consumer.read_events())
+
+        # event 2-0 was not processed because of the failure of 1-0 (same partition)
+        # and 3-0 did not fail too many times yet
+        assert [event.id for event in events] == ["2-0", "3-0"]
+        assert pipeline.xpending_range.call_args_list == [
+            call("stream_key", "le_consumer_group", event_id, event_id, 1)
+            for event_id in ["1-0", "2-0", "3-0"]
+        ]
+        pipeline.xadd.assert_called_once_with(
+            self.DEAD_LETTER_STREAM_NAME,
+            {
+                "k1": "v1",
+                "dead_letter:stream": "stream_key",
+                "dead_letter:group": "le_consumer_group",
+                "dead_letter:consumer": "dummy",
+                "dead_letter:event_id": "1-0",
+                "dead_letter:deliveries": 4,
+                "dead_letter:failure": "ValueError: bad event",
+            },
+        )
+        pipeline.xack.assert_called_once_with("stream_key", "le_consumer_group", "1-0")
+        pipeline.delete.assert_called_once_with(self.failure_key("1-0"))
+        redis_client.pipeline.assert_called_with(transaction=True)
+        assert consumer.metrics.events_dead_lettered == 1
+
+    def test_dead_lettered_events_stop_holding_back_their_key(self, redis_client):
+        redis_client.xautoclaim.return_value = [
+            "0-0",
+            [("1-0", {"k1": "v1"}), ("2-0", {"k1": "v1"})],
+            [],
+        ]
+        pipeline = redis_client.pipeline.return_value
+        pipeline.execute.side_effect = [
+            [pending("1-0", 4), pending("2-0", 2), "ValueError: bad event", None],
+            [],
+        ]
+        consumer = self.consumer(
+            redis_client, consumer_class=RedisDebeziumStreamConsumer, max_deliveries=3
+        )
+        # 1-0 failed, and 2-0 was held back behind it
+        consumer.held_event_ids = {"k1": {"1-0", "2-0"}}
+        consumer.process_event = Mock(side_effect=lambda event: event.id)
+
+        consumer.process_events()
+
+        consumer.process_event.assert_called_once_with(
+            RedisStreamEvent("2-0", {"k1": "v1"})
+        )
+        assert consumer.held_event_ids == {}
+
+    def test_own_pending_events_are_checked_when_read_again(self, redis_client):
+        redis_client.xautoclaim.return_value = ["0-0", [], []]
+        redis_client.xreadgroup.return_value = {
+            self.DUMMY_REDIS_STREAM_NAME: [[("1-0", {"k1": "v1"})]]
+        }
+        pipeline = redis_client.pipeline.return_value
+        pipeline.execute.side_effect = [[pending("1-0", 6), "KeyError: 'id'"], []]
+        consumer = self.consumer(redis_client, max_deliveries=5)
+
+        assert list(consumer.read_events()) == []
+        pipeline.xack.assert_called_once_with("stream_key", "le_consumer_group", "1-0")
+
+    def test_new_events_are_not_checked(self, redis_client):
+        redis_client.xautoclaim.return_value = ["0-0", [], []]
+        redis_client.xreadgroup.return_value = {
+            self.DUMMY_REDIS_STREAM_NAME: [[("1-0", {"k1": "v1"})]]
+        }
+        consumer = self.consumer(redis_client, max_deliveries=5)
+        consumer.check_pending_messages = False
+
+        assert [event.id for event in consumer.read_events()] == ["1-0"]
+        redis_client.pipeline.assert_not_called()
+
+    def test_events_are_not_checked_without_max_deliveries(self, redis_client):
+        redis_client.xautoclaim.return_value = ["0-0", [("1-0", {"k1": "v1"})], []]
+        consumer = self.consumer(redis_client)
+
+        assert [event.id for event in consumer.read_events()] == ["1-0"]
+        redis_client.pipeline.assert_not_called()
+
+    def test_failures_of_partition_events_are_recorded(self, redis_client):
+        consumer = self.consumer(
+            redis_client, RedisDebeziumStreamConsumer, max_deliveries=5
+        )
+        consumer.process_change_event = Mock(side_effect=ValueError("bad event"))
+
+        processed_event_ids = consumer.process_partition(
+            [
+                RedisStreamEvent("1-0", {'{"payload":{"id":"a"}}': "{"}),
+                RedisStreamEvent("2-0", {'{"payload":{"id":"a"}}': "{}"}),
+            ]
+        )
+
+        assert processed_event_ids == []
+        # only the event that failed - the next one was not processed
+        redis_client.set.assert_called_once()
+        key, failure = redis_client.set.call_args.args
+        assert key == self.failure_key("1-0")
+        assert failure.startswith("JSONDecodeError: ")
+        assert redis_client.set.call_args.kwargs == {"ex": FAILURE_TTL_SECONDS}
+
+    def test_failures_of_events_processed_one_by_one_are_recorded(self, redis_client):
+        consumer = self.consumer(redis_client, max_deliveries=5)
+        consumer.read_events = Mock(return_value=[RedisStreamEvent("1-0", {})])
+        consumer.process_event = Mock(side_effect=RuntimeError("boom"))
+
+        consumer.process_events()
+
+        redis_client.set.assert_called_once_with(
+            self.failure_key("1-0"), "RuntimeError: boom", ex=FAILURE_TTL_SECONDS
+        )
+
+    def test_dead_letter_events_are_replayed_to_their_stream(self, redis_client):
+        redis_client.xrange.return_value = [
+            (
+                "10-0",
+                {
+                    "k1": "v1",
+                    "dead_letter:stream": "stream_key",
+                    "dead_letter:group": "le_consumer_group",
+                    "dead_letter:consumer": "dummy",
+                    "dead_letter:event_id": "1-0",
+                    "dead_letter:deliveries": "4",
+                    "dead_letter:failure": "ValueError: bad event",
+                },
+            ),
+        ]
+        pipeline = redis_client.pipeline.return_value
+
+        replayed_ids = replay_dead_letter_events(
+            redis_client, self.DEAD_LETTER_STREAM_NAME, count=10
+        )
+
+        assert replayed_ids == ["10-0"]
+        redis_client.xrange.assert_called_once_with(
+            self.DEAD_LETTER_STREAM_NAME, count=10
+        )
+        pipeline.xadd.assert_called_once_with("stream_key", {"k1": "v1"})
+        pipeline.xdel.assert_called_once_with(self.DEAD_LETTER_STREAM_NAME, "10-0")
+        pipeline.execute.assert_called_once()
+        redis_client.pipeline.assert_called_once_with(transaction=True)
+
+    def test_nothing_is_replayed_when_the_dead_letter_stream_is_empty(
+        self, redis_client
+    ):
+        redis_client.xrange.return_value = []
+
+        assert (
+            replay_dead_letter_events(
+                redis_client, self.DEAD_LETTER_STREAM_NAME, event_ids=["10-0"]
+            )
+            == []
+        )
+        redis_client.xrange.assert_called_once_with(
+            self.DEAD_LETTER_STREAM_NAME, "10-0", "10-0"
+        )
+        redis_client.pipeline.assert_not_called()
@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from store_async_jobs.consumer import (
+    DebeziumEventDecoder,
+    DebeziumRedisEvent,
+    RedisStreamEvent,
+)
+
+STREAM_NAME = "store.public.store_api_order"
+EVENT_ID = "1740218269024-0"
+BEFORE = {"id": "ef9b5beb", "state": "PENDING", "customer_id": "7a000c94"}
+AFTER = {"id": "ef9b5beb", "state": "CONFIRMED", "customer_id": "7a000c94"}
+
+
+def envelope(before: dict | None, after: dict | None, with_schema=True) -> str:
+    payload = {
+        "before": before,
+        "after": after,
+        "source": {"table": "store_api_order", "sequence": '["1","2"]'},
+        "op": "u",
+    }
+    if not with_schema:
+        return json.dumps(payload)
+
+    schema = {
+        "type": "struct",
+        "fields": [
+            {"type": "string", "optional": False, "field": field}
+            for field in ["id", "state", "customer_id"]
+        ],
+        "name": "store.public.store_api_order.Envelope",
+    }
+    return json.dumps({"schema": schema, "payload": payload}, separators=(",", ":"))
+
+
+def stream_event(raw_json: str) -> RedisStreamEvent:
+    return RedisStreamEvent(EVENT_ID, {'{"id":"ef9b5beb"}': raw_json})
+
+
+class TestDebeziumEventDecoder:
+
+    @pytest.mark.parametrize("loads", [json.loads, None])
+    def test_decodes_only_the_rows_of_envelopes_with_schema(self, loads):
+        decoder = DebeziumEventDecoder(loads=loads) if loads else DebeziumEventDecoder()
+
+        event = decoder.decode(STREAM_NAME, stream_event(envelope(BEFORE, AFTER)))
+
+        assert event == DebeziumRedisEvent(id=EVENT_ID, before=BEFORE, after=AFTER)
+        assert (
+            decoder.plan_by_stream[STREAM_NAME].__func__
+            is DebeziumEventDecoder.decode_rows_only
+        )
+
+    def test_decodes_only_the_payload_of_envelopes_without_source(self):
+        decoder = DebeziumEventDecoder()
+        raw_json = json.dumps(
+            {"schema": {}, "payload": {"before": BEFORE, "after": AFTER, "op": "u"}},
+            separators=(",", ":"),
+        )
+
+        event = decoder.decode(STREAM_NAME, stream_event(raw_json))
+
+        assert event == DebeziumRedisEvent(id=EVENT_ID, before=BEFORE, after=AFTER)
+        assert (
+            decoder.plan_by_stream[STREAM_NAME].__func__
+            is DebeziumEventDecoder.decode_payload_only
+        )
+
+    def test_decodes_envelopes_without_schema(self):
+        decoder = DebeziumEventDecoder()
+
+        event = decoder.decode(
+            STREAM_NAME, stream_event(envelope(None, AFTER, with_schema=False))
+        )
+
+        assert event == DebeziumRedisEvent(id=EVENT_ID, before=None, after=AFTER)
+
+    def test_projects_the_declared_fields(self):
+        decoder = DebeziumEventDecoder(fields=("id", "state"))
+
+        event = decoder.decode(STREAM_NAME, stream_event(envelope(BEFORE, AFTER)))
+
+        assert event == DebeziumRedisEvent(
+            id=EVENT_ID,
+            before={"id": "ef9b5beb", "state": "PENDING"},
+            after={"id": "ef9b5beb", "state": "CONFIRMED"},
+        )
+
+    def test_decodes_rows_with_payload_fields(self):
+        decoder = DebeziumEventDecoder()
+        row = {"id": "1", "payload": {"payload": '"payload":'}, "source": "web"}
+
+        event = decoder.decode(STREAM_NAME, stream_event(envelope(None, row)))
+
+        assert event == DebeziumRedisEvent(id=EVENT_ID, before=None, after=row)
+
+    def test_decodes_the_whole_envelope_when_the_payload_is_not_last(self):
+        decoder = DebeziumEventDecoder()
+        raw_json = json.dumps(
+            {"payload": {"before": None, "after": AFTER}, "schema": {}}
+        )
+
+        event = decoder.decode(STREAM_NAME, stream_event(raw_json))
+
+        assert event == DebeziumRedisEvent(id=EVENT_ID, before=None, after=AFTER)
+        assert (
+            decoder.plan_by_stream[STREAM_NAME].__func__
+            is DebeziumEventDecoder.decode_envelope
+        )
+
+    def test_replans_when_the_events_of_a_stream_change_layout(self):
+        decoder = DebeziumEventDecoder()
+        decoder.decode(STREAM_NAME, stream_event(envelope(BEFORE, AFTER)))
+
+        event = decoder.decode(
+            STREAM_NAME, stream_event(envelope(BEFORE, AFTER, with_schema=False))
+        )
+
+        assert event == DebeziumRedisEvent(id=EVENT_ID, before=BEFORE, after=AFTER)
+        assert (
+            decoder.plan_by_stream[STREAM_NAME].__func__
+            is DebeziumEventDecoder.decode_envelope_without_schema
+        )
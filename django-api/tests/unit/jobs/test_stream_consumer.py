@@ -1,4 +1,4 @@
-from unittest.mock import Mock, call
+from unittest.mock import Mock, call, patch
 
 import pytest
 from redis import Redis
@@ -254,3 +254,355 @@ class TestRedisStreamConsumer:
             self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
             event_id,
         )
+
+    def test_consumer_processes_events_in_batch_and_confirms_them_together(
+        self, redis_client
+    ):
+        mock_order_manager = Mock()
+
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+        )
+        consumer.read_events = Mock(
+            return_value=[
+                RedisStreamEvent("event-id1", {}),
+                RedisStreamEvent("event-id2", {}),
+            ]
+        )
+        consumer.process_event = Mock(side_effect=lambda x: x.id)
+        consumer.confirm_events_processed = Mock(return_value=None)
+
+        mock_order_manager.attach_mock(consumer.read_events, "read_events")
+        mock_order_manager.attach_mock(consumer.process_event, "process_event")
+        mock_order_manager.attach_mock(
+            consumer.confirm_events_processed, "confirm_events_processed"
+        )
+
+        consumer.process_events_in_batch()
+
+        assert mock_order_manager.mock_calls == [
+            call.read_events(),
+            call.process_event(RedisStreamEvent("event-id1", {})),
+            call.process_event(RedisStreamEvent("event-id2", {})),
+            call.confirm_events_processed(["event-id1", "event-id2"]),
+        ]
+
+    def test_consumer_does_not_confirm_any_event_of_a_failed_batch(self, redis_client):
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+        )
+        consumer.read_events = Mock(
+            return_value=[
+                RedisStreamEvent("event-id1", {}),
+                RedisStreamEvent("event-id2", {}),
+            ]
+        )
+        consumer.process_batch = Mock(side_effect=RuntimeError())
+        redis_client.xack = Mock(return_value=1)
+
+        with pytest.raises(RuntimeError):
+            consumer.process_events_in_batch()
+
+        redis_client.xack.assert_not_called()
+
+    def test_consumer_confirms_the_events_of_a_batch_unrelated_to_a_failed_event(
+        self, redis_client
+    ):
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+        )
+        consumer.read_events = Mock(
+            return_value=[
+                RedisStreamEvent("event-id1", {}),
+                RedisStreamEvent("event-id2", {}),
+                RedisStreamEvent("event-id3", {}),
+            ]
+        )
+        consumer.process_event = Mock(
+            side_effect=["event-id1", RuntimeError(), "event-id3"]
+        )
+        redis_client.xack = Mock(return_value=1)
+
+        consumer.process_events_in_batch()
+
+        redis_client.xack.assert_called_once_with(
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            "event-id1",
+            "event-id3",
+        )
+
+    def test_consumer_processing_events_one_by_one_only_skips_the_events_with_the_key_of_a_failed_event(
+        self, redis_client
+    ):
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+        )
+        consumer.partition_key = lambda event: event.payload["key"]
+        consumer.read_events = Mock(
+            return_value=[
+                RedisStreamEvent("1-0", {"key": "a"}),
+                RedisStreamEvent("2-0", {"key": "b"}),
+                RedisStreamEvent("3-0", {"key": "a"}),
+            ]
+        )
+        consumer.process_event = Mock(side_effect=[RuntimeError(), "2-0"])
+        redis_client.xack = Mock(return_value=1)
+
+        consumer.process_events()
+
+        assert consumer.process_event.call_count == 2
+        redis_client.xack.assert_called_once_with(
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            "2-0",
+        )
+
+    def test_consumer_confirms_events_processed_with_a_single_xack(
+        self, redis_client: Redis
+    ):
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+        )
+        redis_client.xack = Mock(return_value=2)
+
+        consumer.confirm_events_processed(["event-id1", "event-id2"])
+
+        redis_client.xack.assert_called_once_with(
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            "event-id1",
+            "event-id2",
+        )
+
+    def test_consumer_reads_batches_of_new_events_blocking_for_the_configured_time(
+        self, redis_client
+    ):
+        redis_client.xautoclaim = Mock(return_value=["0-0", [], []])
+        redis_client.xreadgroup = Mock(return_value={})
+
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+            batch_size=100,
+            block_ms=2000,
+        )
+
+        assert list(consumer.read_events()) == []
+        assert list(consumer.read_events()) == []
+
+        assert redis_client.xreadgroup.mock_calls == [
+            # pending events
+            call(
+                groupname=self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+                consumername=self.DUMMY_REDIS_CONSUMER_NAME,
+                count=100,
+                streams={self.DUMMY_REDIS_STREAM_NAME: "0-0"},
+            ),
+            call(
+                groupname=self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+                consumername=self.DUMMY_REDIS_CONSUMER_NAME,
+                count=100,
+                streams={self.DUMMY_REDIS_STREAM_NAME: ">"},
+                block=2000,
+            ),
+        ]
+
+    def test_consumer_reads_its_own_pending_events_once_even_when_they_fail(
+        self, redis_client
+    ):
+        redis_client.xautoclaim = Mock(return_value=["0-0", [], []])
+        redis_client.xreadgroup = Mock(
+            side_effect=[
+                {self.DUMMY_REDIS_STREAM_NAME: [[("1-0", {}), ("2-0", {})]]},
+                {self.DUMMY_REDIS_STREAM_NAME: [[("3-0", {})]]},
+                {self.DUMMY_REDIS_STREAM_NAME: [[]]},
+                {},
+            ]
+        )
+
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+            batch_size=2,
+            block_ms=1000,
+            claim_interval_seconds=30,
+        )
+        consumer.process_event = Mock(side_effect=RuntimeError())
+
+        for _ in range(4):
+            consumer.process_events()
+
+        # the failed events are left pending, to be claimed once idle - not read again straight away
+        assert [
+            c.kwargs["streams"][self.DUMMY_REDIS_STREAM_NAME]
+            for c in redis_client.xreadgroup.mock_calls
+        ] == ["0-0", "2-0", "3-0", ">"]
+        assert consumer.process_event.call_count == 3
+
+    def test_consumer_claims_idle_pending_events_on_its_own_schedule(
+        self, redis_client
+    ):
+        redis_client.xautoclaim = Mock(return_value=["0-0", [], []])
+        redis_client.xreadgroup = Mock(return_value={})
+
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+            block_ms=1000,
+            claim_interval_seconds=30,
+        )
+
+        with patch("store_async_jobs.consumer.time.monotonic") as monotonic:
+            monotonic.return_value = 100
+            list(consumer.read_events())
+            monotonic.return_value = 129
+            list(consumer.read_events())
+            assert redis_client.xautoclaim.call_count == 1
+
+            monotonic.return_value = 130
+            list(consumer.read_events())
+            assert redis_client.xautoclaim.call_count == 2
+
+        assert redis_client.xreadgroup.call_count == 3
+
+    def test_consumer_keeps_claiming_while_there_are_more_idle_events_than_the_batch_size(
+        self, redis_client
+    ):
+        redis_client.xautoclaim = Mock(
+            side_effect=[
+                ["2-0", [("1-0", {}), ("2-0", {})], []],
+                ["0-0", [("3-0", {})], []],
+            ]
+        )
+        redis_client.xreadgroup = Mock(return_value={})
+
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+            batch_size=2,
+            claim_interval_seconds=30,
+        )
+
+        assert [e.id for e in consumer.read_events()] == ["1-0", "2-0"]
+        assert [e.id for e in consumer.read_events()] == ["3-0"]
+        # idle events were claimed - no need to claim before the next interval
+        assert list(consumer.read_events()) == []
+
+        assert redis_client.xautoclaim.call_count == 2
+        redis_client.xreadgroup.assert_called_once()
+
+    def test_consumer_holds_back_the_events_with_the_key_of_a_failed_event_until_it_is_processed(
+        self, redis_client
+    ):
+        consumer = Consumer(
+            redis_client,
+            self.DUMMY_REDIS_STREAM_NAME,
+            self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME,
+            self.DUMMY_REDIS_CONSUMER_NAME,
+        )
+        consumer.partition_key = lambda event: event.payload["key"]
+        consumer.read_events = Mock(
+            side_effect=[
+                [RedisStreamEvent("1-0", {"key": "a"})],
+                # new events, read in the next batches
+                [
+                    RedisStreamEvent("2-0", {"key": "a"}),
+                    RedisStreamEvent("3-0", {"key": "b"}),
+                ],
+                [RedisStreamEvent("4-0", {"key": "a"})],
+                # claimed once idle, in the order of the stream
+                [
+                    RedisStreamEvent("1-0", {"key": "a"}),
+                    RedisStreamEvent("2-0", {"key": "a"}),
+                    RedisStreamEvent("4-0", {"key": "a"}),
+                ],
+                [RedisStreamEvent("5-0", {"key": "a"})],
+            ]
+        )
+        processed = []
+
+        def process_event(event):
+            processed.append(event.id)
+            if len(processed) == 1:
+                raise RuntimeError()
+            return event.id
+
+        consumer.process_event = Mock(side_effect=process_event)
+        redis_client.xack = Mock(return_value=1)
+
+        for _ in range(5):
+            consumer.process_events()
+
+        assert processed == ["1-0", "3-0", "1-0", "2-0", "4-0", "5-0"]
+        assert [c.args[2] for c in redis_client.xack.call_args_list] == [
+            "3-0",
+            "1-0",
+            "2-0",
+            "4-0",
+            "5-0",
+        ]
+        assert consumer.held_event_ids == {}
+
+    def test_consumer_only_processes_the_events_of_its_key_range(self, redis_client):
+        redis_client.xautoclaim = Mock(return_value=["0-0", [], []])
+        redis_client.xreadgroup = Mock(
+            return_value={
+                self.DUMMY_REDIS_STREAM_NAME: [
+                    [(f"{i}-0", {"key": f"order-{i}"}) for i in range(20)]
+                ]
+            }
+        )
+        redis_client.xack = Mock(return_value=1)
+
+        consumers = [
+            Consumer(
+                redis_client,
+                self.DUMMY_REDIS_STREAM_NAME,
+                f"{self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME}:{index}",
+                self.DUMMY_REDIS_CONSUMER_NAME,
+                key_range=(index, 3),
+            )
+            for index in range(3)
+        ]
+        for consumer in consumers:
+            consumer.partition_key = lambda event: event.payload["key"]
+
+        event_ids_by_range = [
+            [event.id for event in consumer.read_events()] for consumer in consumers
+        ]
+
+        # each event is processed in a single key range, and confirmed in the others
+        assert sorted(sum(event_ids_by_range, [])) == sorted(
+            f"{i}-0" for i in range(20)
+        )
+        assert all(event_ids_by_range)
+        for index, xack in enumerate(redis_client.xack.call_args_list):
+            assert (
+                xack.args[1] == f"{self.DUMMY_REDIS_STREAM_CONSUMER_GROUP_NAME}:{index}"
+            )
+            assert set(xack.args[2:]).isdisjoint(event_ids_by_range[index])
+            assert len(xack.args[2:]) + len(event_ids_by_range[index]) == 20
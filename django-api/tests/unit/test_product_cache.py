@@ -0,0 +1,115 @@
+import json
+import uuid
+from unittest.mock import Mock, call
+
+from redis.exceptions import ConnectionError
+
+from store_api.cache import ProductCache
+
+DUMMY_TTL_SECONDS = 60
+
+
+class TestProductCache:
+
+    def test_get_product_returns_cached_product_without_loading(self):
+        product_id = uuid.uuid4()
+        cached_product = {"id": str(product_id), "title": "cached"}
+        redis_client = Mock()
+        redis_client.mget = Mock(return_value=[json.dumps(cached_product), "3"])
+        load = Mock()
+
+        cache = ProductCache(redis_client, DUMMY_TTL_SECONDS)
+
+        assert cache.get_product(product_id, load) == cached_product
+        load.assert_not_called()
+        redis_client.mget.assert_called_once_with(
+            f"store:cache:product:{product_id}",
+            f"store:cache:product:{product_id}:generation",
+        )
+
+    def test_get_product_loads_and_caches_product_if_the_generation_did_not_change(
+        self,
+    ):
+        product_id = uuid.uuid4()
+        product = {"id": str(product_id), "title": "loaded"}
+        redis_client = Mock()
+        redis_client.mget = Mock(return_value=[None, "3"])
+
+        cache = ProductCache(redis_client, DUMMY_TTL_SECONDS)
+
+        assert cache.get_product(product_id, lambda: product) == product
+        cache.set_if_generation.assert_called_once_with(
+            keys=[
+                f"store:cache:product:{product_id}",
+                f"store:cache:product:{product_id}:generation",
+            ],
+            args=[json.dumps(product), "3", DUMMY_TTL_SECONDS],
+        )
+
+    def test_get_product_does_not_cache_non_existing_products(self):
+        redis_client = Mock()
+        redis_client.mget = Mock(return_value=[None, None])
+
+        cache = ProductCache(redis_client, DUMMY_TTL_SECONDS)
+
+        assert cache.get_product(uuid.uuid4(), lambda: None) is None
+        cache.set_if_generation.assert_not_called()
+
+    def test_get_product_loads_product_when_redis_is_unavailable(self):
+        product = {"title": "loaded"}
+        redis_client = Mock()
+        redis_client.mget = Mock(side_effect=ConnectionError())
+
+        cache = ProductCache(redis_client, DUMMY_TTL_SECONDS)
+
+        assert cache.get_product(uuid.uuid4(), lambda: product) == product
+
+    def test_get_list_page_is_keyed_by_list_generation_and_query(self):
+        page = {"metadata": {}, "data": []}
+        redis_client = Mock()
+        redis_client.get = Mock(side_effect=["7", None])
+
+        cache = ProductCache(redis_client, DUMMY_TTL_SECONDS)
+
+        assert cache.get_list_page({"page_size": "2"}, lambda: page) == page
+        cached_page_key = redis_client.set.call_args.args[0]
+        assert cached_page_key.startswith("store:cache:product:list:7:")
+        assert redis_client.get.mock_calls == [
+            call("store:cache:product:list:generation"),
+            call(cached_page_key),
+        ]
+
+    def test_invalidate_products_changes_generations_and_deletes_cached_products(
+        self,
+    ):
+        product_id = uuid.uuid4()
+        redis_client = Mock()
+        pipeline = Mock()
+        redis_client.pipeline = Mock(return_value=pipeline)
+
+        cache = ProductCache(redis_client, DUMMY_TTL_SECONDS)
+        cache.invalidate_products([product_id])
+
+        assert pipeline.mock_calls == [
+            call.incr(f"store:cache:product:{product_id}:generation"),
+            call.expire(
+                f"store:cache:product:{product_id}:generation", DUMMY_TTL_SECONDS
+            ),
+            call.delete(f"store:cache:product:{product_id}"),
+            call.incr("store:cache:product:list:generation"),
+            call.execute(),
+        ]
+
+    def test_invalidate_products_keeps_the_lists_if_they_are_not_affected(self):
+        product_id = uuid.uuid4()
+        redis_client = Mock()
+        pipeline = Mock()
+        redis_client.pipeline = Mock(return_value=pipeline)
+
+        cache = ProductCache(redis_client, DUMMY_TTL_SECONDS)
+        cache.invalidate_products([product_id], lists=False)
+
+        assert (
+            call.incr("store:cache:product:list:generation") not in pipeline.mock_calls
+        )
+        assert call.delete(f"store:cache:product:{product_id}") in pipeline.mock_calls
@@ -0,0 +1,69 @@
+import pytest
+
+from store_api.models import ProductStock
+from tests.conftest import ProductFactory, UserFactory
+
+
+@pytest.mark.django_db
+class TestProductStockShards:
+
+    @pytest.fixture()
+    def stock(
+        self, user_factory: UserFactory, product_factory: ProductFactory
+    ) -> ProductStock:
+        seller = user_factory.create("test@test.com", "test_seller", "Passwd")
+        product = product_factory.create(
+            seller, "cap", "red cap", 100, available_stock={"default": 10}
+        )
+        return product.stock.get()
+
+    def shard_availability(self, stock: ProductStock) -> list[int]:
+        return list(
+            stock.shard_set.order_by("shard").values_list("available", flat=True)
+        )
+
+    def test_sharding_splits_availability_evenly(self, stock: ProductStock):
+        stock.set_shards(4)
+
+        stock.refresh_from_db()
+        assert stock.shards == 4
+        assert stock.available == 0
+        assert self.shard_availability(stock) == [3, 3, 2, 2]
+        assert (
+            ProductStock.objects.with_total_available().get(id=stock.id).total_available
+            == 10
+        )
+
+    def test_resharding_keeps_total_availability(self, stock: ProductStock):
+        stock.set_shards(4)
+        stock.set_shards(3)
+
+        stock.refresh_from_db()
+        assert stock.available == 0
+        assert self.shard_availability(stock) == [4, 3, 3]
+
+        stock.set_shards(0)
+
+        stock.refresh_from_db()
+        assert stock.shards == 0
+        assert stock.available == 10
+        assert self.shard_availability(stock) == []
+
+    def test_rebalancing_spreads_the_stock_row_and_drained_shards(
+        self, stock: ProductStock
+    ):
+        stock.set_shards(2)
+        # e.g. a reverted order restoring stock, and another draining a shard
+        ProductStock.objects.filter(id=stock.id).update(available=4)
+        stock.shard_set.filter(shard=1).update(available=0)
+
+        assert stock.rebalance_shards()
+
+        stock.refresh_from_db()
+        assert stock.available == 0
+        assert self.shard_availability(stock) == [5, 4]
+
+    def test_balanced_shards_are_not_rebalanced(self, stock: ProductStock):
+        stock.set_shards(3)
+
+        assert not stock.rebalance_shards()